@@ -0,0 +1,135 @@
+#!/usr/bin/python3
+
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+# per record cost of the interval record path on the client, in microseconds:
+#
+#   control receiver   process_c_or_f_record() and put_results_record(), for a c record
+#                      from the data receiver (ascii and binary control protocol)
+#   output             output.print_output() of the d record from the results ring
+#
+# no sockets, no processes, the records are made up (tcp, one stream, --quiet)
+#
+# usage (from the top of the repo):
+#
+#   PYTHONPATH=src python3 scripts/bench_record_path.py [NUM_RECORDS]
+
+import sys
+import time
+import argparse
+import multiprocessing
+
+from bbperf import const
+from bbperf import output
+from bbperf import control_record_helper
+from bbperf import control_receiver_thread
+
+from bbperf.run_mode_manager_class import RunModeManagerClass
+from bbperf.udp_rate_manager_class import UdpRateManagerClass
+
+
+class ResultsRingStub:
+
+    def __init__(self):
+        self.record_list = []
+
+    def put(self, record):
+        self.record_list.append(record)
+
+
+def get_args(control_protocol):
+    return argparse.Namespace(
+        udp=False,
+        parallel=1,
+        kernel_timestamps=False,
+        rtt_sample_interval=None,
+        sweep=False,
+        sweep_load_percent_list=[],
+        time=const.DEFAULT_VALID_DATA_COLLECTION_TIME_SEC,
+        max_ramp_time=None,
+        tcp_target_rate=None,
+        control_protocol=control_protocol,
+        data_file_format="text",
+        json_file=None,
+        json_summary_only=False,
+        summary_percent_list=const.SUMMARY_PERCENT_LIST,
+        verbosity=0,
+        quiet=2)
+
+
+# (curr time, c record) from the data receiver, 10 per second
+def get_c_record_list(control_protocol, num_records):
+    c_record_list = []
+
+    start_time_sec = time.time()
+
+    for idx in range(num_records):
+        sent_time_sec = start_time_sec + (idx * const.SAMPLE_INTERVAL_SEC)
+        record_type = "cal" if idx < 20 else "run"
+        tcp_info = (2000 + idx % 100, 500, 1000, 10, 0, 4096, 12500000, 15000000, idx)
+
+        if control_protocol == "binary":
+            c_record = control_record_helper.pack_interval_c_record(
+                (control_record_helper.record_type_to_int(record_type), sent_time_sec, 0.1, 100, 1250000, idx * 100) + tcp_info,
+                0.1, 100, 1250000, idx * 100, 0, 0.0)
+        else:
+            c_record = " a {} {} 0.1 100 1250000 {} {} b 0.1 100 1250000 {} 0 0.0 c ".format(
+                record_type, sent_time_sec, idx * 100, " ".join(str(x) for x in tcp_info), idx * 100).encode()
+
+        c_record_list.append((sent_time_sec + 0.002, c_record))
+
+    return c_record_list
+
+
+def bench_control_receiver(args, c_record_list):
+    shared_run_mode = multiprocessing.Value('i', const.RUN_MODE_CALIBRATING)
+    run_mode_manager = RunModeManagerClass(args, shared_run_mode)
+    udp_rate_manager = UdpRateManagerClass(args, multiprocessing.Value('d', 0))
+    results_ring = ResultsRingStub()
+
+    start_time = time.perf_counter()
+
+    for curr_time_sec, c_record in c_record_list:
+        new_record = control_receiver_thread.process_c_or_f_record(args, c_record, curr_time_sec, 0,
+                                                                   run_mode_manager, udp_rate_manager, None, None)
+        control_receiver_thread.put_results_record(args, results_ring, new_record)
+
+    return time.perf_counter() - start_time, results_ring.record_list
+
+
+def bench_output(args, d_record_list):
+    output.init(args)
+
+    start_time = time.perf_counter()
+
+    for d_record in d_record_list:
+        output.print_output(d_record)
+
+    elapsed_sec = time.perf_counter() - start_time
+
+    output.term()
+    output.delete_tmp_data_files()
+
+    return elapsed_sec
+
+
+def main():
+    num_records = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    for control_protocol in [ "ascii", "binary" ]:
+        args = get_args(control_protocol)
+        c_record_list = get_c_record_list(control_protocol, num_records)
+
+        control_receiver_sec, d_record_list = bench_control_receiver(args, c_record_list)
+        output_sec = bench_output(args, d_record_list)
+
+        print("{:6}  control receiver {:6.2f} us/record   output {:6.2f} us/record   total {:6.2f} us/record".format(
+            control_protocol,
+            control_receiver_sec * 1e6 / num_records,
+            output_sec * 1e6 / num_records,
+            (control_receiver_sec + output_sec) * 1e6 / num_records), flush=True)
+
+
+if __name__ == '__main__':
+    main()
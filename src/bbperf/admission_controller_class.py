@@ -0,0 +1,212 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import math
+import time
+import types
+
+from . import const
+
+# decides when a test may start on the server, so that tests running at the same time do
+# not skew each other's results more than the server operator allows
+#
+# a test fits if
+#   - nothing else is running (a test always fits on an idle server)
+#   - neither it nor a running test is exclusive (client --exclusive)
+#   - fewer than --max-concurrent-sessions tests are running
+#   - the bandwidth of the running tests plus its own is within --bandwidth-budget, if set.
+#     a test reserves its --tcp-target-rate, or --session-bandwidth without one
+#
+# tests that do not fit wait in arrival order (an exclusive test at the head is not
+# overtaken by smaller ones).  the wait is estimated from the expected end times of the
+# running and queued tests.  a client whose wait would exceed --max-queue-wait, or that
+# finds the queue full, is told to retry after that long instead.
+#
+# the caller passes an opaque item with each test (e.g. its control socket), and gets it
+# back once the test is admitted
+
+
+class AdmissionControllerClass:
+
+    def __init__(self, args):
+        self.args = args
+
+        # run_id -> demand
+        self.running_dict = {}
+        # demands, in arrival order
+        self.queued_list = []
+
+
+    # returns a demand, what the test needs from the server
+    def get_demand(self, run_id, client_args, item):
+        if client_args.tcp_target_rate is not None:
+            bandwidth_mbps = client_args.tcp_target_rate
+        else:
+            bandwidth_mbps = self.args.session_bandwidth
+
+        return types.SimpleNamespace(
+            run_id=run_id,
+            client_args=client_args,
+            item=item,
+            bandwidth_mbps=bandwidth_mbps,
+            exclusive=client_args.exclusive,
+            expected_duration_sec=self.get_expected_duration_sec(client_args),
+            expected_end_time=None)
+
+
+    def get_expected_duration_sec(self, client_args):
+        expected_duration_sec = const.EXPECTED_CALIBRATION_TIME_SEC
+
+        if client_args.udp:
+            expected_duration_sec += const.DATA_SAMPLE_IGNORE_TIME_UDP_MAX_SEC
+        else:
+            expected_duration_sec += const.DATA_SAMPLE_IGNORE_TIME_TCP_MAX_SEC
+
+        if client_args.sweep:
+            expected_duration_sec += const.SWEEP_CAPACITY_ESTIMATE_TIME_SEC
+            expected_duration_sec += len(client_args.sweep_load_percent_list) * client_args.sweep_step_time
+        else:
+            expected_duration_sec += client_args.time
+
+        # never more than the test is allowed to run
+        return min(expected_duration_sec, client_args.max_run_time_failsafe_sec)
+
+
+    def fits(self, demand, running_list):
+        if len(running_list) == 0:
+            return True
+
+        if demand.exclusive or any(r.exclusive for r in running_list):
+            return False
+
+        if len(running_list) >= self.args.max_concurrent_sessions:
+            return False
+
+        if self.args.bandwidth_budget is not None:
+            running_bandwidth_mbps = sum(r.bandwidth_mbps for r in running_list)
+            if (running_bandwidth_mbps + demand.bandwidth_mbps) > self.args.bandwidth_budget:
+                return False
+
+        return True
+
+
+    # earliest time, not before not_before, at which demand fits next to the tests in
+    # sim_list that are still running by then
+    def get_earliest_start_time(self, demand, sim_list, not_before):
+        end_time_list = sorted(r.expected_end_time for r in sim_list if r.expected_end_time > not_before)
+
+        for start_time in [ not_before ] + end_time_list:
+            if self.fits(demand, [ r for r in sim_list if r.expected_end_time > start_time ]):
+                return start_time
+
+        # not reached, once the last test ends anything fits
+        return end_time_list[-1]
+
+
+    # when the queued tests (followed by new_demand, if any) would start, running and queued
+    # tests are assumed to take their expected duration
+    # returns a start time for each one, in queue order
+    def get_estimated_start_time_list(self, new_demand, curr_time):
+        sim_list = []
+
+        for r in self.running_dict.values():
+            # overdue tests are expected to end any moment
+            sim_list.append(types.SimpleNamespace(
+                bandwidth_mbps=r.bandwidth_mbps,
+                exclusive=r.exclusive,
+                expected_end_time=max(r.expected_end_time, curr_time)))
+
+        demand_list = list(self.queued_list)
+        if new_demand is not None:
+            demand_list.append(new_demand)
+
+        start_time_list = []
+        start_time = curr_time
+
+        # first come first served, nobody starts before the one ahead of it
+        for d in demand_list:
+            start_time = self.get_earliest_start_time(d, sim_list, start_time)
+
+            sim_list.append(types.SimpleNamespace(
+                bandwidth_mbps=d.bandwidth_mbps,
+                exclusive=d.exclusive,
+                expected_end_time=start_time + d.expected_duration_sec))
+
+            start_time_list.append(start_time)
+
+        return start_time_list
+
+
+    # returns (run_id, client_args, item, estimated wait in seconds) for each queued test
+    def get_queued_list(self):
+        curr_time = time.time()
+
+        start_time_list = self.get_estimated_start_time_list(None, curr_time)
+
+        return [ (d.run_id, d.client_args, d.item, start_time - curr_time)
+                 for d, start_time in zip(self.queued_list, start_time_list) ]
+
+
+    def start(self, demand, curr_time):
+        demand.expected_end_time = curr_time + demand.expected_duration_sec
+        self.running_dict[demand.run_id] = demand
+
+
+    # returns ("admit", None), ("queued", estimated wait in seconds) or ("busy", retry after seconds)
+    def request(self, run_id, client_args, item):
+        curr_time = time.time()
+
+        demand = self.get_demand(run_id, client_args, item)
+
+        if (len(self.queued_list) == 0) and self.fits(demand, list(self.running_dict.values())):
+            self.start(demand, curr_time)
+            return "admit", None
+
+        estimated_wait_sec = self.get_estimated_start_time_list(demand, curr_time)[-1] - curr_time
+
+        if (len(self.queued_list) >= self.args.max_queue_length) or (estimated_wait_sec > self.args.max_queue_wait):
+            return "busy", max(1, math.ceil(estimated_wait_sec))
+
+        self.queued_list.append(demand)
+
+        return "queued", estimated_wait_sec
+
+
+    # the test is done, returns the queued tests that can start now, as (run_id, client_args, item)
+    def end(self, run_id):
+        self.running_dict.pop(run_id, None)
+
+        return self.pop_admitted()
+
+
+    def pop_admitted(self):
+        curr_time = time.time()
+
+        admitted_list = []
+
+        while (len(self.queued_list) > 0) and self.fits(self.queued_list[0], list(self.running_dict.values())):
+            demand = self.queued_list.pop(0)
+            self.start(demand, curr_time)
+            admitted_list.append((demand.run_id, demand.client_args, demand.item))
+
+        return admitted_list
+
+
+    # a queued client went away, returns the queued tests that can start now (it may have
+    # been holding up the queue)
+    def remove_queued(self, run_id):
+        self.queued_list = [ d for d in self.queued_list if d.run_id != run_id ]
+
+        return self.pop_admitted()
+
+
+    def is_known(self, run_id):
+        return (run_id in self.running_dict) or any(d.run_id == run_id for d in self.queued_list)
+
+
+    def get_num_running(self):
+        return len(self.running_dict)
+
+
+    def get_queue_length(self):
+        return len(self.queued_list)
@@ -0,0 +1,353 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import os
+import io
+import sys
+import shutil
+import argparse
+import contextlib
+import multiprocessing
+import concurrent.futures
+
+import numpy
+
+from . import util
+from . import const
+from . import graph
+from . import output
+from . import data_file_helper
+from . import control_receiver_thread
+
+from .run_mode_manager_class import RunModeManagerClass
+
+# bbperf analyze: re-process the raw data files of earlier tests (--raw-data-file, text or
+# --data-file-format npy), e.g. with a different validity window or percentiles, without
+# running the tests again
+#
+# every record is replayed the way the client saw it: the run mode manager decides, again,
+# when calibration ends and which samples are valid (with the received time of the record as
+# the clock), and the records go through the same output path as a live test (summary, json
+# file, graph).  the files are analyzed in parallel, one per worker process.
+#
+# what the raw data does not say is worked out from the records: tcp or udp, number of
+# streams, --kernel-timestamps, --rtt-sample-interval, --sweep.  the udp rate and the sweep
+# steps are what they were during the test.
+
+
+def analyze_mainline(argv):
+    parser = argparse.ArgumentParser(prog="bbperf analyze",
+        description="bbperf analyze: re-process saved raw data files")
+
+    parser.add_argument("raw_data_file_list",
+        metavar="RAW_DATA_FILE",
+        nargs="+",
+        help="raw data file of a test (--raw-data-file, text or npy)")
+
+    parser.add_argument("-t", "--time",
+        metavar="SECONDS",
+        type=int,
+        default=const.DEFAULT_VALID_DATA_COLLECTION_TIME_SEC,
+        help="use this many seconds of valid data samples, at most what the test collected (default: {})".format(
+            const.DEFAULT_VALID_DATA_COLLECTION_TIME_SEC))
+
+    parser.add_argument("--max-ramp-time",
+        metavar="SECONDS",
+        type=int,
+        default=None,
+        help="max duration in seconds before samples are valid (tcp default: {}, udp default: {})".format(
+            const.DATA_SAMPLE_IGNORE_TIME_TCP_MAX_SEC,
+            const.DATA_SAMPLE_IGNORE_TIME_UDP_MAX_SEC))
+
+    parser.add_argument("--tcp-target-rate",
+        metavar="MBPS",
+        type=float,
+        default=None,
+        help="the tcp test was paced at this rate, samples are valid once the flow gets close to it")
+
+    parser.add_argument("--extra-percentiles",
+        metavar="PERCENTS",
+        default=None,
+        help="comma separated percentiles to add to the summary, e.g. 99.9")
+
+    parser.add_argument("--sweep-steps",
+        metavar="PERCENTS",
+        default=const.SWEEP_DEFAULT_LOAD_PERCENTS,
+        help="the --sweep-steps of a sweep test (default: {})".format(const.SWEEP_DEFAULT_LOAD_PERCENTS))
+
+    parser.add_argument("-o", "--output-dir",
+        metavar="OUTPUT_DIR",
+        default=None,
+        help="write the json file (and graph) of each raw data file to this directory, "
+             "named after the raw data file")
+
+    parser.add_argument("--json-summary-only",
+        action="store_true",
+        default=False,
+        help="write only the summary to the json files, not every interval")
+
+    parser.add_argument("-g", "--graph",
+        action="store_true",
+        default=False,
+        help="generate graphs (requires gnuplot)")
+
+    parser.add_argument("-j", "--jobs",
+        metavar="NUM_JOBS",
+        type=int,
+        default=os.cpu_count(),
+        help="number of files to analyze at the same time (default: number of cpus)")
+
+    parser.add_argument("-q", "--quiet",
+        action="store_true",
+        default=False,
+        help="do not print the summaries")
+
+    args = parser.parse_args(argv)
+
+    validate_analyze_args(args)
+
+    # file name -> output
+    output_dict = {}
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        future_dict = { executor.submit(analyze_file, args, filename): filename for filename in args.raw_data_file_list }
+
+        for future in concurrent.futures.as_completed(future_dict):
+            output_dict[future_dict[future]] = future.result()
+
+    num_failed = 0
+
+    # in the order given
+    for filename in args.raw_data_file_list:
+        is_ok, output_str = output_dict[filename]
+
+        if not is_ok:
+            num_failed += 1
+
+        if len(args.raw_data_file_list) > 1:
+            print("==> {} <==".format(filename), flush=True)
+        print(output_str, end="", flush=True)
+
+    if num_failed > 0:
+        sys.exit(1)
+
+
+def validate_analyze_args(args):
+    if args.jobs < 1:
+        raise Exception("ERROR: --jobs must be at least 1, got {}".format(args.jobs))
+
+    if args.time < 1:
+        raise Exception("ERROR: --time must be at least 1, got {}".format(args.time))
+
+    if args.tcp_target_rate is not None and args.tcp_target_rate <= 0:
+        raise Exception("ERROR: --tcp-target-rate must be greater than 0, got {}".format(args.tcp_target_rate))
+
+    if args.json_summary_only and (not args.output_dir):
+        raise Exception("ERROR: --json-summary-only requires --output-dir")
+
+    if args.output_dir and not os.path.isdir(args.output_dir):
+        raise Exception("ERROR: --output-dir is not a directory: {}".format(args.output_dir))
+
+    try:
+        sweep_load_percent_list = [ float(x) for x in args.sweep_steps.split(",") ]
+    except ValueError:
+        raise Exception("ERROR: invalid --sweep-steps: {}".format(args.sweep_steps))
+
+    # the output files are named after the raw data files
+    if args.output_dir:
+        name_list = [ get_output_name(filename) for filename in args.raw_data_file_list ]
+        if len(set(name_list)) < len(name_list):
+            raise Exception("ERROR: with --output-dir, raw data files must have different names")
+
+    d = vars(args)
+    d["sweep_load_percent_list"] = sweep_load_percent_list
+    d["summary_percent_list"] = util.get_summary_percent_list(args.extra_percentiles)
+
+
+# foo/bar.npy -> bar
+def get_output_name(filename):
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+# returns (is_ok, what a live test would have printed), runs in a worker process
+def analyze_file(analyze_args, filename):
+    output_buffer = io.StringIO()
+
+    with contextlib.redirect_stdout(output_buffer), contextlib.redirect_stderr(output_buffer):
+        try:
+            replay_file(analyze_args, filename)
+            is_ok = True
+
+        except Exception as e:
+            print("{}: {}".format(filename, e), flush=True)
+            is_ok = False
+
+    return is_ok, output_buffer.getvalue()
+
+
+def replay_file(analyze_args, filename):
+    args = get_replay_args(analyze_args, filename)
+
+    output.init(args)
+
+    try:
+        shared_run_mode = multiprocessing.Value('i', const.RUN_MODE_CALIBRATING)
+        run_mode_manager = RunModeManagerClass(args, shared_run_mode)
+
+        for e_record, r_record in read_raw_data_file(args, filename):
+
+            if e_record is not None:
+                e_record.is_sample_valid = control_receiver_thread.get_echo_is_sample_valid(run_mode_manager)
+                output.print_record(e_record, None)
+                continue
+
+            # the test went on after this, with a shorter --time
+            if shared_run_mode.value == const.RUN_MODE_STOP:
+                break
+
+            # the sweep step comes from the sweep manager, which changed the offered load, that stays as it was
+            sweep_step = r_record.sweep_step
+            run_mode_manager.update(r_record, r_record.r_pkt_received_time_sec)
+            r_record.sweep_step = sweep_step if r_record.is_sample_valid else const.SWEEP_STEP_NONE
+
+            output.print_record(None, r_record)
+
+        output.term()
+
+        write_output_files(args)
+
+    finally:
+        output.delete_tmp_data_files()
+
+
+# the client args for the replay, the ones the raw data does not have come from a first pass over it
+def get_replay_args(analyze_args, filename):
+    args = argparse.Namespace(udp=False, kernel_timestamps=False)
+
+    is_udp = True
+    max_stream_id = 0
+    is_kernel_timestamps = False
+    is_rtt_sampled = False
+    is_sweep = False
+
+    for e_record, r_record in read_raw_data_file(args, filename):
+        record = e_record if e_record is not None else r_record
+
+        max_stream_id = max(max_stream_id, record.r_stream_id)
+
+        if (record.r_receiver_dwell_sec != 0) or (record.control_dwell_sec != 0):
+            is_kernel_timestamps = True
+
+        if e_record is not None:
+            is_rtt_sampled = True
+            continue
+
+        # tcp interval records have no loss, see RunModeManagerClass
+        if r_record.interval_dropped == -1:
+            is_udp = False
+
+        if r_record.rtt_sample_count > 0:
+            is_rtt_sampled = True
+
+        if r_record.sweep_step != const.SWEEP_STEP_NONE:
+            is_sweep = True
+            if r_record.sweep_step >= len(analyze_args.sweep_load_percent_list):
+                raise Exception("ERROR: sweep step {} is not in --sweep-steps".format(r_record.sweep_step))
+
+    if is_udp and (analyze_args.tcp_target_rate is not None):
+        raise Exception("ERROR: --tcp-target-rate is for tcp tests only")
+
+    output_name = get_output_name(filename)
+
+    args.udp = is_udp
+    args.parallel = max_stream_id + 1
+    args.kernel_timestamps = is_kernel_timestamps
+    # the interval is not in the raw data, only whether there was one
+    args.rtt_sample_interval = 0 if is_rtt_sampled else None
+    args.sweep = is_sweep
+    args.sweep_load_percent_list = analyze_args.sweep_load_percent_list
+    args.time = analyze_args.time
+    args.max_ramp_time = analyze_args.max_ramp_time
+    args.tcp_target_rate = analyze_args.tcp_target_rate
+    args.summary_percent_list = analyze_args.summary_percent_list
+    args.verbosity = 0
+    # no interval lines, only the summary
+    args.quiet = 2 if analyze_args.quiet else 1
+    args.data_file_format = "text"
+    args.json_summary_only = analyze_args.json_summary_only
+    args.graph = analyze_args.graph
+
+    if analyze_args.output_dir:
+        args.json_file = os.path.join(analyze_args.output_dir, output_name + ".json")
+        args.graph_file = os.path.join(analyze_args.output_dir, output_name + ".png") if args.graph else None
+    else:
+        args.json_file = None
+        args.graph_file = None
+
+    return args
+
+
+# yields (e_record, None) or (None, r_record), with their derived fields (see util)
+def read_raw_data_file(args, filename):
+    with open(filename, "rb") as f:
+        is_npy = (f.read(6) == b'\x93NUMPY')
+
+    if is_npy:
+        raw_data = numpy.load(filename, mmap_mode="r")
+
+        if raw_data.dtype != data_file_helper.RAW_DATA_DTYPE:
+            raise Exception("ERROR: not a raw data file")
+
+        # chunks, so a big file is not all in memory as python objects
+        for chunk_start in range(0, len(raw_data), const.NPY_WRITER_CHUNK_RECORDS):
+            for row in raw_data[chunk_start : chunk_start + const.NPY_WRITER_CHUNK_RECORDS].tolist():
+                record = data_file_helper.raw_row_to_record(row)
+
+                if row[0]:
+                    yield util.add_e_record_derived_fields(args, record), None
+                else:
+                    yield None, util.add_r_record_derived_fields(args, record)
+
+        return
+
+    with open(filename, "r") as f:
+        for line in f:
+            line = line.rstrip("\n")
+
+            if line.startswith(" e "):
+                yield util.parse_e_record(args, line), None
+            elif line.startswith(" a "):
+                yield None, util.parse_r_record(args, line)
+            else:
+                raise Exception("ERROR: not a raw data file")
+
+
+# same as the client, see client.write_output_files(), the tmp data files are deleted by the caller
+def write_output_files(args):
+    if args.graph or args.graph_file:
+        graphdatafilename = output.get_graph_data_file_name()
+        pngfilename = graphdatafilename + ".png"
+
+        graph.create_graph(args, graphdatafilename, pngfilename)
+
+        if args.graph_file:
+            shutil.move(pngfilename, args.graph_file)
+            print("created graph: {}".format(args.graph_file), flush=True)
+        else:
+            print("created graph: {}".format(pngfilename), flush=True)
+
+        if args.sweep:
+            sweepdatafilename = output.get_sweep_data_file_name()
+            sweeppngfilename = sweepdatafilename + ".png"
+
+            graph.create_sweep_graph(args, sweepdatafilename, sweeppngfilename)
+
+            if args.graph_file:
+                sweep_graph_file = args.graph_file[:-len(".png")] + "-sweep.png"
+                shutil.move(sweeppngfilename, sweep_graph_file)
+                print("created graph: {}".format(sweep_graph_file), flush=True)
+            else:
+                print("created graph: {}".format(sweeppngfilename), flush=True)
+
+    if args.json_file:
+        print("created json file: {}".format(args.json_file), flush=True)
@@ -0,0 +1,245 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import asyncio
+import time
+import types
+import socket
+import uuid
+
+from . import util
+from . import const
+from . import output
+from . import client
+from . import tcp_helper
+from . import async_engine_helper
+
+from .exceptions import ServerBusyException
+
+# client for "--engine asyncio", see async_engine_helper
+
+
+def client_mainline(args):
+    asyncio.run(run_client(args))
+
+
+# same as client.create_control_connection()
+# returns (control_reader, control_writer, client control addr, run_id, control protocol)
+async def create_control_connection(args, server_addr):
+    loop = asyncio.get_running_loop()
+
+    if args.verbosity:
+        print("creating control connection to server at {}".format(server_addr), flush=True)
+
+    control_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    control_sock.bind((args.bind, 0))
+    control_sock.setblocking(False)
+    await loop.sock_connect(control_sock, server_addr)
+    # the control messages back to the sender are part of the rtt measurement
+    control_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    client_control_addr = control_sock.getsockname()
+
+    if args.verbosity:
+        print("created control connection, client {}, server {}".format(
+              client_control_addr, server_addr), flush=True)
+
+    control_reader, control_writer = await asyncio.open_connection(sock=control_sock)
+
+    # generate a random UUID (36 character string)
+    run_id = str(uuid.uuid4())
+
+    control_writer.write(("control " + run_id).encode())
+
+    await async_engine_helper.expect_string(control_reader, const.TCP_CONTROL_INITIAL_ACK)
+
+    control_writer.write(util.client_args_to_json(args).encode())
+
+    while True:
+        # all replies are the same length, the server may queue us first
+        args_reply = (await control_reader.readexactly(len(const.TCP_CONTROL_ARGS_ACK))).decode()
+
+        try:
+            reply_type, reply_value = util.parse_control_args_reply(args_reply)
+        except ServerBusyException:
+            control_writer.close()
+            raise
+
+        if reply_type == "ack":
+            return control_reader, control_writer, client_control_addr, run_id, reply_value
+
+        if reply_type == "error":
+            error_str = (await control_reader.readexactly(reply_value)).decode(errors="replace")
+            control_writer.close()
+            raise Exception("ERROR: the server cannot run this test: {}".format(error_str))
+
+        print("server busy, queued, estimated wait {} seconds".format(reply_value), flush=True)
+
+
+# same as client.create_control_connection_with_retries()
+async def create_control_connection_with_retries(args, server_addr):
+    retry_num = 0
+
+    while True:
+        try:
+            return await create_control_connection(args, server_addr)
+
+        except ServerBusyException as e:
+            if retry_num >= args.busy_retries:
+                raise Exception("ERROR: server busy, giving up after {} retries".format(retry_num))
+
+            backoff_sec = util.get_busy_backoff_sec(retry_num, e.retry_after_sec)
+
+            print("{}, retrying in {:.1f} seconds".format(e, backoff_sec), flush=True)
+
+            await asyncio.sleep(backoff_sec)
+
+            retry_num += 1
+
+
+async def run_client(args):
+    loop = asyncio.get_running_loop()
+
+    client_start_time = time.time()
+
+    if args.verbosity:
+        print("args: {}".format(args), flush=True)
+
+    server_addr = client.get_server_addr(args)
+
+    # create control connection
+
+    control_reader, control_writer, client_control_addr, run_id, control_protocol = \
+        await create_control_connection_with_retries(args, server_addr)
+
+    if (args.control_protocol == "binary") and (control_protocol != "binary"):
+        raise Exception("ERROR: server does not support the binary control protocol")
+
+    args.control_protocol = control_protocol
+
+    if args.verbosity:
+        print("received control args ack, control protocol {}".format(control_protocol), flush=True)
+
+    # create data connections
+
+    data_initial_string = "data " + run_id
+
+    # (reader, writer, sock) per stream, reader and writer for tcp, sock for udp
+    data_stream_list = []
+    client_data_addr_list = []
+
+    # one data connection per stream, all under the same run_id
+    for stream_id in range(args.parallel):
+
+        if args.local_data_port:
+            local_data_port = args.local_data_port + stream_id
+        else:
+            local_data_port = 0
+
+        if args.udp:
+            data_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            data_sock.bind((args.bind, local_data_port))
+            # the server answers from a socket connected to us on the server port
+            data_sock.connect(server_addr)
+            data_sock.setblocking(False)
+
+            if args.verbosity:
+                print("sending data initial string (udp): {}".format(data_initial_string), flush=True)
+
+            sender_task = asyncio.ensure_future(async_engine_helper.send_udp_string(data_sock, data_initial_string))
+
+            try:
+                await asyncio.wait_for(async_engine_helper.wait_for_udp_string(data_sock, const.UDP_DATA_INITIAL_ACK), 60)
+            except asyncio.TimeoutError:
+                raise Exception("ERROR: failed to UDP recv string: {}".format(const.UDP_DATA_INITIAL_ACK))
+            finally:
+                sender_task.cancel()
+
+            if args.verbosity:
+                print("received data initial ack", flush=True)
+
+            data_stream_list.append((None, None, data_sock))
+
+        else:
+            data_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            data_sock.bind((args.bind, local_data_port))
+            tcp_helper.set_congestion_control(args, data_sock)
+            tcp_helper.set_tcp_notsent_lowat(data_sock, args.tcp_notsent_lowat)
+            tcp_helper.set_tcp_target_rate(args, data_sock)
+            data_sock.setblocking(False)
+            await loop.sock_connect(data_sock, server_addr)
+
+            data_reader, data_writer = await asyncio.open_connection(sock=data_sock)
+
+            if args.verbosity:
+                print("sending data initial string (tcp): {}".format(data_initial_string), flush=True)
+
+            data_writer.write(data_initial_string.encode())
+
+            data_stream_list.append((data_reader, data_writer, None))
+
+        client_data_addr_list.append(data_sock.getsockname())
+
+    await async_engine_helper.expect_string(control_reader, const.SETUP_COMPLETE_MSG)
+
+    shared_run_mode, shared_udp_sending_rate_pps, shared_tcp_pacing_rate = async_engine_helper.create_shared_values()
+
+    output.init(args)
+
+    if args.reverse:
+        # direction down
+
+        num_receivers_running = types.SimpleNamespace(value=len(data_stream_list))
+
+        coroutine_list = []
+
+        for stream_id, (data_reader, data_writer, data_sock) in enumerate(data_stream_list):
+            coroutine_list.append(async_engine_helper.run_data_receiver(
+                args, control_writer, data_reader, data_sock, stream_id, num_receivers_running))
+
+        coroutine_list.append(async_engine_helper.run_control_receiver_passthru(args, control_reader))
+
+        # test starts here
+
+        control_writer.write(const.START_MSG.encode())
+
+    else:
+        # direction up
+
+        coroutine_list = []
+
+        coroutine_list.append(async_engine_helper.run_control_receiver_term(
+            args, control_reader, None, shared_run_mode, shared_udp_sending_rate_pps, shared_tcp_pacing_rate))
+
+        for data_reader, data_writer, data_sock in data_stream_list:
+            coroutine_list.append(async_engine_helper.run_data_sender(
+                args, data_writer, data_sock, shared_run_mode, shared_udp_sending_rate_pps, shared_tcp_pacing_rate))
+
+    if args.verbosity:
+        print("test running, {} {}, control conn addr {}, data conn addr {}, server addr {}, elapsed startup time {} seconds".format(
+              "udp" if args.udp else "tcp",
+              "down" if args.reverse else "up",
+              client_control_addr,
+              client_data_addr_list,
+              server_addr,
+              (time.time() - client_start_time)),
+              flush=True)
+
+    await async_engine_helper.run_test_tasks(args, coroutine_list)
+
+    if args.verbosity:
+        print("test finished, generating output", flush=True)
+
+    output.term()
+
+    for data_reader, data_writer, data_sock in data_stream_list:
+        if data_sock is not None:
+            util.done_with_socket(data_sock)
+        else:
+            data_writer.close()
+    control_writer.close()
+
+    client.write_output_files(args)
+
+    if args.verbosity:
+        print("test complete, exiting")
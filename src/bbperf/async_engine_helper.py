@@ -0,0 +1,470 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import asyncio
+import time
+import types
+
+from . import util
+from . import const
+from . import output
+from . import pacing_helper
+from . import tcp_info_helper
+from . import control_record_helper
+from . import control_receiver_thread
+from . import data_receiver_thread
+
+from .exceptions import PeerDisconnectedException
+from .udp_rate_manager_class import UdpRateManagerClass
+from .run_mode_manager_class import RunModeManagerClass
+from .sweep_manager_class import SweepManagerClass
+
+# single process asyncio engine ("--engine asyncio")
+#
+# same wire protocol as the multiprocessing engine, but every data flow and the control
+# connection are tasks in one event loop (see async_client and async_server).  the tasks
+# here mirror the processes of the multiprocessing engine:
+#
+#   run_data_sender()               data_sender_thread.run
+#   run_data_receiver()             data_receiver_thread.run
+#   run_control_receiver_term()     control_receiver_thread.run_recv_term_queue / run_recv_term_send
+#   run_control_receiver_passthru() control_receiver_thread.run_recv_queue
+#
+# tcp flows are asyncio streams, udp flows are connected non-blocking sockets.  what needs
+# a process of its own is not supported, see util.get_asyncio_engine_unsupported_options()
+
+
+# same as the multiprocessing.Value objects of the multiprocessing engine, nothing is
+# shared across processes here
+def create_shared_values():
+    shared_run_mode = types.SimpleNamespace(value=const.RUN_MODE_CALIBRATING)
+    shared_udp_sending_rate_pps = types.SimpleNamespace(value=const.UDP_DEFAULT_INITIAL_RATE)
+    # bytes per second, zero is not paced
+    shared_tcp_pacing_rate = types.SimpleNamespace(value=0.0)
+
+    return shared_run_mode, shared_udp_sending_rate_pps, shared_tcp_pacing_rate
+
+
+async def expect_string(reader, expected_string):
+    try:
+        received_bytes = await asyncio.wait_for(reader.readexactly(len(expected_string)), const.SOCKET_TIMEOUT_SEC)
+    except asyncio.IncompleteReadError:
+        raise PeerDisconnectedException()
+
+    received_str = received_bytes.decode()
+
+    if received_str != expected_string:
+        raise Exception("ERROR: expected \"{}\", received \"{}\"".format(expected_string, received_str))
+
+
+# one whole control record, end_bytes is the end of an ascii record (b' c ' or b' d ')
+async def recv_control_record(args, reader, end_bytes):
+    try:
+        if args.control_protocol == "binary":
+            header = await reader.readexactly(control_record_helper.RECORD_HEADER_SIZE)
+
+            record_len, _ = control_record_helper.RECORD_HEADER_STRUCT.unpack(header)
+
+            if record_len < control_record_helper.RECORD_HEADER_SIZE:
+                raise Exception("ERROR: invalid control record length: {}".format(record_len))
+
+            return header + await reader.readexactly(record_len - control_record_helper.RECORD_HEADER_SIZE)
+
+        return await reader.readuntil(end_bytes)
+
+    except asyncio.IncompleteReadError:
+        raise PeerDisconnectedException()
+
+
+# keeps sending string_to_send, like udp_string_sender_thread, until cancelled
+async def send_udp_string(data_sock, string_to_send):
+    ping_interval_sec = 0.2
+    ping_duration_sec = 5
+    total_pings_to_send = ping_duration_sec / ping_interval_sec
+
+    send_count = 0
+
+    while send_count <= total_pings_to_send:
+        try:
+            data_sock.send(string_to_send.encode())
+        except OSError:
+            # e.g. connection refused, the peer is not there yet
+            pass
+
+        send_count += 1
+
+        await asyncio.sleep(ping_interval_sec)
+
+
+async def wait_for_udp_string(data_sock, expected_string):
+    loop = asyncio.get_running_loop()
+
+    expected_bytes = expected_string.encode()
+
+    while True:
+        try:
+            payload_bytes = await loop.sock_recv(data_sock, const.BUFSZ)
+        except ConnectionRefusedError:
+            continue
+
+        if payload_bytes == expected_bytes:
+            return
+
+
+# the multiprocessing engine sends it 3 times as well
+async def send_udp_stop_message(data_sock):
+    for i in range(3):
+        try:
+            data_sock.send(const.UDP_STOP_MSG.encode())
+        except OSError:
+            pass
+
+        await asyncio.sleep(0.1)
+
+
+# tcp flows pass data_writer, udp flows pass data_sock
+async def run_data_sender(args, data_writer, data_sock, shared_run_mode, shared_udp_sending_rate_pps, shared_tcp_pacing_rate):
+    loop = asyncio.get_running_loop()
+
+    if args.verbosity:
+        print("data sender: start of task", flush=True)
+
+    if args.udp:
+        udp_batch_size = util.convert_udp_pps_to_batch_size(shared_udp_sending_rate_pps.value)
+    else:
+        # drain() then waits until everything written is in the socket, and tcp_notsent_lowat
+        # keeps that from getting far ahead of the network
+        data_writer.transport.set_write_buffer_limits(high=0)
+
+    # tcp pacing set by the sweep manager
+    tcp_pacing_rate = 0.0
+
+    start_time_sec = time.time()
+    calibration_start_time = start_time_sec
+
+    interval_start_time = start_time_sec
+    interval_end_time = interval_start_time + const.SAMPLE_INTERVAL_SEC
+
+    interval_time_sec = 0.0
+    interval_send_count = 0
+    interval_bytes_sent = 0
+
+    accum_send_count = 0
+    accum_bytes_sent = 0
+
+    total_send_counter = 1
+    num_negative_delay = 0
+
+    # sampled at the end of every interval, tcp only
+    tcp_info_bytes = tcp_info_helper.tcp_info_to_bytes(tcp_info_helper.TCP_INFO_NONE)
+
+    current_udp_batch_start_time = start_time_sec
+    current_udp_batch_start_total_send_counter = total_send_counter
+
+    while True:
+        curr_time_sec = time.time()
+
+        if (shared_run_mode.value == const.RUN_MODE_CALIBRATING):
+            # double the limit to avoid a race condition with the run mode manager
+            if curr_time_sec > (calibration_start_time + (2 * const.MAX_DURATION_CALIBRATION_TIME_SEC)):
+                raise Exception("FATAL: async data sender: time in calibration exceeded max allowed")
+
+            is_calibrated = False
+        else:
+            is_calibrated = True
+
+        record_type = b'run' if is_calibrated else b'cal'
+
+        ba = bytearray(b' a ' +
+                        record_type + b' ' +
+                        str(curr_time_sec).encode() + b' ' +
+                        str(interval_time_sec).encode() + b' ' +
+                        str(interval_send_count).encode() + b' ' +
+                        str(interval_bytes_sent).encode() + b' ' +
+                        str(total_send_counter).encode() + b' ' +
+                        tcp_info_bytes + b' b ')
+
+        if (not args.udp) and is_calibrated:
+            ba.extend(const.PAYLOAD_4K)
+        else:
+            ba.extend(const.PAYLOAD_1K)
+
+        batch_size = udp_batch_size if args.udp else 1
+
+        try:
+            for _ in range(batch_size):
+                if args.udp:
+                    await loop.sock_sendall(data_sock, ba)
+                else:
+                    data_writer.write(ba)
+                    await data_writer.drain()
+
+                total_send_counter += 1
+                accum_send_count += 1
+                accum_bytes_sent += len(ba)
+
+        except (ConnectionResetError, BrokenPipeError):
+            # this can happen at the end of a reverse test
+            print("data sender: peer disconnected", flush=True)
+            break
+
+        curr_time_sec = time.time()
+
+        if curr_time_sec > interval_end_time:
+            interval_time_sec = curr_time_sec - interval_start_time
+            interval_send_count = accum_send_count
+            interval_bytes_sent = accum_bytes_sent
+
+            interval_start_time = curr_time_sec
+            interval_end_time = interval_start_time + const.SAMPLE_INTERVAL_SEC
+            accum_send_count = 0
+            accum_bytes_sent = 0
+
+            if not args.udp:
+                tcp_info_bytes = tcp_info_helper.tcp_info_to_bytes(tcp_info_helper.get_tcp_info(data_writer.get_extra_info("socket")))
+
+            # update udp autorate
+            if args.udp:
+                udp_batch_size = util.convert_udp_pps_to_batch_size(shared_udp_sending_rate_pps.value)
+
+            elif shared_tcp_pacing_rate.value != tcp_pacing_rate:
+                tcp_pacing_rate = shared_tcp_pacing_rate.value
+                pacing_helper.set_max_pacing_rate(data_writer.get_extra_info("socket"), tcp_pacing_rate)
+
+        # send very slowly at first to establish unloaded latency
+        if not is_calibrated:
+            await asyncio.sleep(0.2)
+            current_udp_batch_start_time = time.time()
+            current_udp_batch_start_total_send_counter = total_send_counter
+            continue
+
+        # normal end of test
+        if shared_run_mode.value == const.RUN_MODE_STOP:
+            break
+
+        if ((curr_time_sec - start_time_sec) > args.max_run_time_failsafe_sec):
+            raise Exception("ERROR: max_run_time_failsafe_sec exceeded")
+
+        if not args.udp:
+            # the socket may take everything without drain() ever yielding, let the other tasks run
+            await asyncio.sleep(0)
+            continue
+
+        # pause between udp batches, same as "--udp-pacing batch"
+        this_batch_pkts_sent = total_send_counter - current_udp_batch_start_total_send_counter
+
+        this_batch_actual_time_sec = curr_time_sec - current_udp_batch_start_time
+
+        this_batch_should_have_taken_time = this_batch_pkts_sent / shared_udp_sending_rate_pps.value
+
+        delay_sec = this_batch_should_have_taken_time - this_batch_actual_time_sec
+
+        if delay_sec < 0:
+            num_negative_delay += 1
+            if (num_negative_delay % const.UDP_NEGATIVE_DELAY_BETWEEN_BATCHES_WARNING_EVERY) == 0:
+                print("WARNING: udp sender is cpu constrained, results may be invalid: {}".format(num_negative_delay), flush=True)
+            await asyncio.sleep(0)
+        else:
+            await asyncio.sleep(delay_sec)
+
+        current_udp_batch_start_time += this_batch_should_have_taken_time
+        current_udp_batch_start_total_send_counter = total_send_counter
+
+    if args.udp:
+        if args.verbosity:
+            print("data sender: sending udp stop message", flush=True)
+        await send_udp_stop_message(data_sock)
+        util.done_with_socket(data_sock)
+    else:
+        data_writer.close()
+
+    if args.verbosity:
+        print("data sender: end of task", flush=True)
+
+
+# tcp flows pass data_reader, udp flows pass data_sock
+# the last receiver to finish closes the control connection, like data_receiver_thread
+async def run_data_receiver(args, control_writer, data_reader, data_sock, stream_id, num_receivers_running):
+    loop = asyncio.get_running_loop()
+
+    if args.verbosity:
+        print("data receiver: start of task", flush=True)
+
+    stop_msg_bytes = const.UDP_STOP_MSG.encode()
+
+    start_time_sec = time.time()
+
+    interval_start_time = start_time_sec
+    interval_end_time = interval_start_time + const.SAMPLE_INTERVAL_SEC
+
+    interval_pkts_received = 0
+    interval_bytes_received = 0
+    total_recv_calls = 0
+
+    while True:
+        try:
+            if args.udp:
+                bytes_read = await asyncio.wait_for(loop.sock_recv(data_sock, const.BUFSZ), const.SOCKET_TIMEOUT_SEC)
+
+                if bytes_read == stop_msg_bytes:
+                    if args.verbosity:
+                        print("data receiver: received udp stop message, exiting", flush=True)
+                    break
+
+            else:
+                bytes_read = await asyncio.wait_for(data_reader.read(const.BUFSZ), const.SOCKET_TIMEOUT_SEC)
+
+                if len(bytes_read) == 0:
+                    if args.verbosity:
+                        print("peer disconnected (data socket)", flush=True)
+                    break
+
+        except asyncio.TimeoutError:
+            raise Exception("FATAL: async data receiver: timeout during data socket read")
+
+        except ConnectionRefusedError:
+            # udp, an icmp error for something we sent earlier
+            continue
+
+        except ConnectionResetError:
+            if args.verbosity:
+                print("connection reset error (data socket)", flush=True)
+            break
+
+        curr_time_sec = time.time()
+
+        total_recv_calls += 1
+        interval_pkts_received += 1         # valid for udp only
+        interval_bytes_received += len(bytes_read)
+
+        if curr_time_sec > interval_end_time:
+            interval_time_sec = curr_time_sec - interval_start_time
+
+            a_b_block = data_receiver_thread.get_a_b_block(args, bytes_read, None)
+
+            if a_b_block is None:
+                # skip sending for this packet, but stay "in" sample interval
+                continue
+
+            if args.control_protocol == "binary":
+                record = control_record_helper.pack_interval_c_record(
+                    control_record_helper.a_b_block_to_fields(a_b_block),
+                    interval_time_sec,
+                    interval_pkts_received,
+                    interval_bytes_received,
+                    total_recv_calls,
+                    stream_id,
+                    0)
+            else:
+                record = a_b_block + "{} {} {} {} {} 0 c ".format(
+                    interval_time_sec,
+                    interval_pkts_received,
+                    interval_bytes_received,
+                    total_recv_calls,               # num of pkts received, valid for udp only
+                    stream_id).encode()
+
+            # one write() per record, so records of different streams never interleave
+            control_writer.write(record)
+            await control_writer.drain()
+
+            interval_bytes_received = 0
+            interval_pkts_received = 0
+
+            interval_start_time = curr_time_sec
+            interval_end_time = interval_start_time + const.SAMPLE_INTERVAL_SEC
+
+        if ((curr_time_sec - start_time_sec) > args.max_run_time_failsafe_sec):
+            raise Exception("ERROR: max_run_time_failsafe_sec exceeded")
+
+    if data_sock is not None:
+        util.done_with_socket(data_sock)
+
+    num_receivers_running.value -= 1
+    if num_receivers_running.value == 0:
+        control_writer.close()
+
+    if args.verbosity:
+        print("data receiver: end of task", flush=True)
+
+
+# runs the managers on every interval record
+# on the client (up) the records go to output, on the server (down) back to the client
+async def run_control_receiver_term(args, control_reader, control_writer, shared_run_mode, shared_udp_sending_rate_pps, shared_tcp_pacing_rate):
+    if args.verbosity:
+        print("control receiver: start of task", flush=True)
+
+    run_mode_manager = RunModeManagerClass(args, shared_run_mode)
+    udp_rate_manager = UdpRateManagerClass(args, shared_udp_sending_rate_pps)
+    if args.sweep:
+        sweep_manager = SweepManagerClass(args, shared_run_mode, shared_udp_sending_rate_pps, shared_tcp_pacing_rate)
+    else:
+        sweep_manager = None
+
+    to_output = (control_writer is None)
+
+    while True:
+        try:
+            received_record = await recv_control_record(args, control_reader, b' c ')
+
+        except (PeerDisconnectedException, ConnectionResetError):
+            if args.verbosity:
+                print("peer disconnected (control socket)", flush=True)
+            break
+
+        curr_time_sec = time.time()
+
+        new_record = control_receiver_thread.process_c_or_f_record(args, received_record, curr_time_sec, 0,
+                                                                   run_mode_manager, udp_rate_manager, sweep_manager, None)
+
+        if to_output:
+            output.print_output(new_record)
+            continue
+
+        new_record = control_receiver_thread.record_to_wire(args, new_record)
+
+        if isinstance(new_record, str):
+            new_record = new_record.encode()
+
+        try:
+            control_writer.write(new_record)
+            await control_writer.drain()
+
+        except (BrokenPipeError, ConnectionResetError):
+            # records still in flight when the client closes the control connection
+            if args.verbosity:
+                print("peer disconnected (control socket)", flush=True)
+            break
+
+    if args.verbosity:
+        print("control receiver: end of task", flush=True)
+
+
+# client, reverse direction, the server ran the managers
+async def run_control_receiver_passthru(args, control_reader):
+    if args.verbosity:
+        print("control receiver: start of task", flush=True)
+
+    while True:
+        try:
+            received_record = await recv_control_record(args, control_reader, b' d ')
+
+        except (PeerDisconnectedException, ConnectionResetError):
+            if args.verbosity:
+                print("peer disconnected (control socket)", flush=True)
+            break
+
+        if args.control_protocol != "binary":
+            received_record = received_record.decode()
+
+        output.print_output(received_record)
+
+    if args.verbosity:
+        print("control receiver: end of task", flush=True)
+
+
+# runs the tasks of a test, the test is over when all of them are done
+async def run_test_tasks(args, coroutine_list):
+    try:
+        await asyncio.wait_for(asyncio.gather(*coroutine_list), args.max_run_time_failsafe_sec)
+    except asyncio.TimeoutError:
+        raise Exception("ERROR: max_run_time_failsafe_sec exceeded")
@@ -0,0 +1,379 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import math
+import asyncio
+import time
+import types
+import socket
+
+from . import util
+from . import const
+from . import tcp_helper
+from . import async_engine_helper
+from . import initial_string_helper
+
+from .admission_controller_class import AdmissionControllerClass
+
+# server for "--engine asyncio", see async_engine_helper
+#
+# same as the multiprocessing server (see session_dispatcher_class), but with a session task
+# per test instead of a session process.  connections and udp flows are told apart by their
+# initial string (see initial_string_helper), so data connections are handed to the session
+# with their run_id.  udp flows start on a single unconnected socket on the server port, the
+# session then connects a socket of its own to each flow (SO_REUSEPORT).  the admission
+# controller decides when a test starts, same as with the multiprocessing server.
+
+
+def server_mainline(args):
+    asyncio.run(run_server(args))
+
+
+# data connections and udp flows waiting for their session, by run_id
+class PendingDataConnectionsClass:
+
+    def __init__(self):
+        self.pending_dict = {}
+
+
+    def add_session(self, run_id):
+        self.pending_dict[run_id] = types.SimpleNamespace(queue=asyncio.Queue(), udp_addr_set=set())
+
+
+    def remove_session(self, run_id):
+        self.pending_dict.pop(run_id, None)
+
+
+    # returns (reader, writer) for tcp, or the client addr for udp
+    async def get(self, run_id):
+        try:
+            return await asyncio.wait_for(self.pending_dict[run_id].queue.get(), const.SOCKET_TIMEOUT_SEC)
+        except asyncio.TimeoutError:
+            raise Exception("ERROR: timeout waiting for data connection, run_id {}".format(run_id))
+
+
+    # false if there is no such session
+    def put_tcp(self, run_id, data_reader, data_writer):
+        pending = self.pending_dict.get(run_id)
+        if pending is None:
+            return False
+
+        pending.queue.put_nowait((data_reader, data_writer))
+        return True
+
+
+    # the client resends its initial string until acked, only the first one counts
+    def put_udp(self, run_id, client_data_addr):
+        pending = self.pending_dict.get(run_id)
+        if (pending is None) or (client_data_addr in pending.udp_addr_set):
+            return
+
+        pending.udp_addr_set.add(client_data_addr)
+        pending.queue.put_nowait(client_data_addr)
+
+
+class UdpDispatcherProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, pending_data_connections):
+        self.pending_data_connections = pending_data_connections
+
+
+    def datagram_received(self, payload_bytes, client_data_addr):
+        run_id = initial_string_helper.get_udp_run_id(payload_bytes)
+
+        if run_id is None:
+            return
+
+        self.pending_data_connections.put_udp(run_id, client_data_addr)
+
+
+async def run_server(args):
+    loop = asyncio.get_running_loop()
+
+    server_addr = (args.bind, args.port)
+
+    listen_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listen_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+    print("binding tcp control socket to local address {}".format(server_addr), flush=True)
+    listen_sock.bind(server_addr)
+    listen_sock.listen(32)          # listen backlog
+
+    server_port = listen_sock.getsockname()[1]
+
+    pending_data_connections = PendingDataConnectionsClass()
+
+    udp_dispatcher_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp_dispatcher_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    print("binding udp data socket to local address {}".format(server_addr), flush=True)
+    udp_dispatcher_sock.bind((args.bind, server_port))
+
+    await loop.create_datagram_endpoint(lambda: UdpDispatcherProtocol(pending_data_connections), sock=udp_dispatcher_sock)
+
+    admission_controller = AdmissionControllerClass(args)
+
+    async def handle_connection(reader, writer):
+        await handle_tcp_connection(args, (args.bind, server_port), pending_data_connections, admission_controller, reader, writer)
+
+    tcp_server = await asyncio.start_server(handle_connection, sock=listen_sock)
+
+    print("server listening on port {}, max concurrent sessions {}".format(server_port, args.max_concurrent_sessions), flush=True)
+
+    async with tcp_server:
+        await tcp_server.serve_forever()
+
+
+async def handle_tcp_connection(args, server_addr, pending_data_connections, admission_controller, reader, writer):
+    client_addr = writer.get_extra_info("peername")
+
+    try:
+        prefix_bytes = await asyncio.wait_for(reader.readexactly(initial_string_helper.LEN_INITIAL_STRING_PREFIX), const.SOCKET_TIMEOUT_SEC)
+
+        initial_string_len = initial_string_helper.get_initial_string_len(prefix_bytes)
+
+        if initial_string_len is None:
+            print("ERROR: invalid initial string from client addr {}: {}".format(client_addr, prefix_bytes), flush=True)
+            writer.close()
+            return
+
+        initial_bytes = prefix_bytes + await asyncio.wait_for(
+            reader.readexactly(initial_string_len - initial_string_helper.LEN_INITIAL_STRING_PREFIX), const.SOCKET_TIMEOUT_SEC)
+
+        run_id = initial_string_helper.get_run_id(initial_bytes)
+
+        if initial_string_helper.is_control_initial_string(initial_bytes):
+            if not initial_string_helper.is_valid_run_id(run_id):
+                print("ERROR: invalid run_id from client addr {}: {}".format(client_addr, ascii(run_id)), flush=True)
+                writer.close()
+                return
+
+            print("client connected (control socket): client addr {}, server addr {}, run_id {}".format(
+                client_addr, server_addr, run_id), flush=True)
+
+            await run_control_connection(args, server_addr, pending_data_connections, admission_controller, run_id, reader, writer)
+
+        elif not pending_data_connections.put_tcp(run_id, reader, writer):
+            print("ERROR: data connection for unknown run_id {}, client addr {}".format(run_id, client_addr), flush=True)
+            writer.close()
+
+    except Exception as e:
+        # a failed test must not take down the other tests
+        print("ERROR: client addr {}: {}: {}".format(client_addr, type(e).__name__, e), flush=True)
+        writer.close()
+
+
+# the client args, admission, then the test
+async def run_control_connection(args, server_addr, pending_data_connections, admission_controller, run_id, control_reader, control_writer):
+    if admission_controller.is_known(run_id):
+        raise Exception("run_id already in use: {}".format(run_id))
+
+    control_writer.write(const.TCP_CONTROL_INITIAL_ACK.encode())
+
+    args_bytes = await asyncio.wait_for(control_reader.readuntil(b'}'), const.SOCKET_TIMEOUT_SEC)
+
+    client_args = util.client_args_from_json(args_bytes)
+
+    print("received args from client: {}".format(vars(client_args)), flush=True)
+
+    error_str = util.check_client_protocol_version(client_args)
+    if error_str is not None:
+        control_writer.write(const.TCP_CONTROL_ARGS_VERSION_MISMATCH.encode())
+        await control_writer.drain()
+        raise Exception(error_str)
+
+    unsupported_option_list = util.get_asyncio_engine_unsupported_options(client_args)
+    if len(unsupported_option_list) > 0:
+        error_str = "not supported by a server with --engine asyncio: {}".format(", ".join(unsupported_option_list))
+        # the client reports it
+        control_writer.write(util.get_control_args_error_reply(error_str))
+        await control_writer.drain()
+        raise Exception(error_str)
+
+    if not await admit_client(admission_controller, run_id, client_args, control_reader, control_writer):
+        control_writer.close()
+        return
+
+    try:
+        await run_session(args, server_addr, pending_data_connections, run_id, client_args, control_reader, control_writer)
+
+    finally:
+        for _, _, admitted_event in admission_controller.end(run_id):
+            admitted_event.set()
+
+
+# see session_dispatcher_class.admit_client()
+# returns True once the test may start, False if the client was told to retry later or went away
+async def admit_client(admission_controller, run_id, client_args, control_reader, control_writer):
+    admitted_event = asyncio.Event()
+
+    decision, decision_sec = admission_controller.request(run_id, client_args, admitted_event)
+
+    if decision == "admit":
+        return True
+
+    if decision == "busy":
+        print("server busy, client told to retry after {} seconds, run_id {}".format(decision_sec, run_id), flush=True)
+        control_writer.write(const.TCP_CONTROL_ARGS_BUSY.format(decision_sec).encode())
+        await control_writer.drain()
+        return False
+
+    print("client queued, run_id {}, {} sessions running, queue length {}, estimated wait {:.1f} seconds".format(
+        run_id, admission_controller.get_num_running(), admission_controller.get_queue_length(), decision_sec), flush=True)
+
+    control_writer.write(const.TCP_CONTROL_ARGS_QUEUED.format(math.ceil(decision_sec)).encode())
+
+    admitted_task = asyncio.ensure_future(admitted_event.wait())
+    # the client has nothing to say until its args ack, so the read returns when it goes away
+    disconnect_task = asyncio.ensure_future(control_reader.read(const.BUFSZ))
+
+    is_admitted = False
+
+    try:
+        while True:
+            done, _ = await asyncio.wait([ admitted_task, disconnect_task ], timeout=const.QUEUE_UPDATE_INTERVAL_SEC,
+                                         return_when=asyncio.FIRST_COMPLETED)
+
+            if admitted_task in done:
+                is_admitted = True
+                return True
+
+            if disconnect_task in done:
+                if len(disconnect_task.result()) == 0:
+                    print("queued client disconnected, run_id {}".format(run_id), flush=True)
+                    return False
+
+                disconnect_task = asyncio.ensure_future(control_reader.read(const.BUFSZ))
+                continue
+
+            # a fresh estimate now and then, which also keeps the wait for the args ack from timing out
+            for queued_run_id, _, _, estimated_wait_sec in admission_controller.get_queued_list():
+                if queued_run_id == run_id:
+                    control_writer.write(const.TCP_CONTROL_ARGS_QUEUED.format(math.ceil(estimated_wait_sec)).encode())
+
+    finally:
+        admitted_task.cancel()
+        disconnect_task.cancel()
+
+        # it may have been holding up the queue
+        if not is_admitted:
+            for _, _, admitted_event in admission_controller.remove_queued(run_id):
+                admitted_event.set()
+
+
+async def run_session(args, server_addr, pending_data_connections, run_id, client_args, control_reader, control_writer):
+    curr_client_start_time = time.time()
+
+    pending_data_connections.add_session(run_id)
+
+    # (reader, writer, sock) per stream, reader and writer for tcp, sock for udp
+    data_stream_list = []
+    client_data_addr_list = []
+    ack_sender_task_list = []
+
+    try:
+        if client_args.control_protocol in [ "auto", "binary" ]:
+            client_args.control_protocol = "binary"
+            control_writer.write(const.TCP_CONTROL_ARGS_ACK_BINARY.encode())
+        else:
+            client_args.control_protocol = "ascii"
+            control_writer.write(const.TCP_CONTROL_ARGS_ACK.encode())
+
+        # the client sets up its flows one at a time, in stream id order
+        for stream_id in range(client_args.parallel):
+
+            if client_args.udp:
+                client_data_addr = await pending_data_connections.get(run_id)
+
+                data_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                data_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+                data_sock.bind(server_addr)
+                data_sock.connect(client_data_addr)
+                data_sock.setblocking(False)
+
+                # keep sending the data initial ack until the client starts the test
+                ack_sender_task_list.append(asyncio.ensure_future(
+                    async_engine_helper.send_udp_string(data_sock, const.UDP_DATA_INITIAL_ACK)))
+
+                data_stream_list.append((None, None, data_sock))
+
+            else:
+                data_reader, data_writer = await pending_data_connections.get(run_id)
+
+                data_sock = data_writer.get_extra_info("socket")
+                tcp_helper.set_congestion_control(client_args, data_sock)
+                tcp_helper.set_tcp_notsent_lowat(data_sock, client_args.tcp_notsent_lowat)
+                tcp_helper.set_tcp_target_rate(client_args, data_sock)
+
+                client_data_addr = data_writer.get_extra_info("peername")
+
+                data_stream_list.append((data_reader, data_writer, None))
+
+            if client_args.verbosity:
+                print("data connection {} from client addr {}".format(stream_id, client_data_addr), flush=True)
+
+            client_data_addr_list.append(client_data_addr)
+
+        pending_data_connections.remove_session(run_id)
+
+        shared_run_mode, shared_udp_sending_rate_pps, shared_tcp_pacing_rate = async_engine_helper.create_shared_values()
+
+        coroutine_list = []
+
+        if client_args.reverse:
+            # direction down
+
+            control_writer.write(const.SETUP_COMPLETE_MSG.encode())
+
+            await async_engine_helper.expect_string(control_reader, const.START_MSG)
+
+            # stop sending udp data initial acks
+            for ack_sender_task in ack_sender_task_list:
+                ack_sender_task.cancel()
+
+            coroutine_list.append(async_engine_helper.run_control_receiver_term(
+                client_args, control_reader, control_writer, shared_run_mode, shared_udp_sending_rate_pps, shared_tcp_pacing_rate))
+
+            for data_reader, data_writer, data_sock in data_stream_list:
+                coroutine_list.append(async_engine_helper.run_data_sender(
+                    client_args, data_writer, data_sock, shared_run_mode, shared_udp_sending_rate_pps, shared_tcp_pacing_rate))
+
+        else:
+            # direction up
+
+            num_receivers_running = types.SimpleNamespace(value=len(data_stream_list))
+
+            for stream_id, (data_reader, data_writer, data_sock) in enumerate(data_stream_list):
+                coroutine_list.append(async_engine_helper.run_data_receiver(
+                    client_args, control_writer, data_reader, data_sock, stream_id, num_receivers_running))
+
+            control_writer.write(const.SETUP_COMPLETE_MSG.encode())
+
+        print("test running, {} {}, run_id {}, data conn addr {}, server addr {}, elapsed startup time {} seconds".format(
+              "udp" if client_args.udp else "tcp",
+              "down" if client_args.reverse else "up",
+              run_id,
+              client_data_addr_list,
+              server_addr,
+              (time.time() - curr_client_start_time)),
+              flush=True)
+
+        await async_engine_helper.run_test_tasks(client_args, coroutine_list)
+
+        if client_args.verbosity:
+            print("test finished, cleaning up", flush=True)
+
+    finally:
+        pending_data_connections.remove_session(run_id)
+
+        for ack_sender_task in ack_sender_task_list:
+            ack_sender_task.cancel()
+
+        for data_reader, data_writer, data_sock in data_stream_list:
+            if data_sock is not None:
+                util.done_with_socket(data_sock)
+            else:
+                data_writer.close()
+
+        control_writer.close()
+
+    print("client ended, run_id {}".format(run_id), flush=True)
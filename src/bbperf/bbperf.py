@@ -3,14 +3,23 @@
 # Copyright (c) 2024 Cloudflare, Inc.
 # Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
 
+import sys
 import argparse
 
+from . import analyze
 from . import client
 from . import server
+from . import async_client
+from . import async_server
 from . import util
 from . import const
 
 def mainline():
+    # bbperf analyze RAW_DATA_FILE ...
+    if (len(sys.argv) > 1) and (sys.argv[1] == "analyze"):
+        analyze.analyze_mainline(sys.argv[2:])
+        return
+
     parser = argparse.ArgumentParser(description="bbperf: end to end performance and bufferbloat measurement tool")
 
     parser.add_argument("-s", "--server",
@@ -47,6 +56,12 @@ def mainline():
             const.DATA_SAMPLE_IGNORE_TIME_TCP_MAX_SEC,
             const.DATA_SAMPLE_IGNORE_TIME_UDP_MAX_SEC))
 
+    parser.add_argument("-P", "--parallel",
+        metavar="NUM_STREAMS",
+        type=int,
+        default=1,
+        help="number of parallel data streams (default: 1)")
+
     parser.add_argument("-t", "--time",
         metavar="SECONDS",
         type=int,
@@ -67,6 +82,18 @@ def mainline():
         default=None,
         help="JSON output file")
 
+    parser.add_argument("--json-summary-only",
+        action="store_true",
+        default=False,
+        help="write only the summary to the JSON output file, not every interval, so memory "
+             "use stays flat on long tests")
+
+    parser.add_argument("--extra-percentiles",
+        metavar="PERCENTS",
+        default=None,
+        help="comma separated percentiles to add to the summary, e.g. 99.9 (the summary "
+             "always has {})".format(", ".join("p{}".format(x) for x in const.SUMMARY_PERCENT_LIST)))
+
     parser.add_argument("-g", "--graph",
         action="store_true",
         default=False,
@@ -87,6 +114,13 @@ def mainline():
         default=None,
         help="save raw data to the specified file")
 
+    parser.add_argument("--data-file-format",
+        choices=["text", "npy"],
+        default="text",
+        help="format of the graph and raw data files: one line of text per record, or a numpy "
+             "structured array with the field names and types in its header, which loads without "
+             "parsing, e.g. numpy.load(FILE, mmap_mode=\"r\") (default: text)")
+
     parser.add_argument("-B", "--bind",
         metavar="BIND_ADDR",
         default="0.0.0.0",
@@ -119,6 +153,159 @@ def mainline():
         default=131072,
         help="net.ipv4.tcp_notsent_lowat (default: 131072)")
 
+    parser.add_argument("--tcp-target-rate",
+        metavar="MBPS",
+        type=float,
+        default=None,
+        help="pace the tcp data flow at this rate (split evenly across parallel streams) "
+             "using SO_MAX_PACING_RATE, to measure latency at a given offered load "
+             "(default: not paced, the flow runs flat out)")
+
+    parser.add_argument("--kernel-timestamps",
+        action="store_true",
+        help="use kernel receive timestamps (SO_TIMESTAMPNS) on the data and control sockets to take "
+             "the time spent waiting in socket buffers for bbperf to read out of the rtt, "
+             "the json output also reports the userspace rtt and the difference")
+
+    parser.add_argument("--rtt-sample-interval",
+        metavar="MS",
+        type=float,
+        default=None,
+        help="echo a sent time from the data receiver every MS milliseconds, in addition to the "
+             "interval records, for per interval min/p50/p99/max rtt and summary percentiles over "
+             "all samples (default: one rtt sample per interval)")
+
+    parser.add_argument("--sweep",
+        action="store_true",
+        help="after calibration, estimate capacity at full rate, then step the offered load through "
+             "--sweep-steps (percent of the estimate) and report latency, goodput and loss per step. "
+             "tcp steps are paced with SO_MAX_PACING_RATE")
+
+    parser.add_argument("--sweep-steps",
+        metavar="PERCENTS",
+        default=const.SWEEP_DEFAULT_LOAD_PERCENTS,
+        help="comma separated offered loads for --sweep, in percent of the estimated capacity "
+             "(default: {})".format(const.SWEEP_DEFAULT_LOAD_PERCENTS))
+
+    parser.add_argument("--sweep-step-time",
+        metavar="SECONDS",
+        type=float,
+        default=const.SWEEP_DEFAULT_STEP_TIME_SEC,
+        help="duration of each --sweep step (default: {})".format(const.SWEEP_DEFAULT_STEP_TIME_SEC))
+
+    parser.add_argument("--udp-send-mode",
+        choices=["auto", "loop", "gso"],
+        default="auto",
+        help="how udp batches are sent: one sendto() per datagram (loop), "
+             "one sendmsg() per group of datagrams using UDP_SEGMENT (gso), "
+             "or gso with fallback to loop (auto) (default: auto)")
+
+    parser.add_argument("--udp-recv-mode",
+        choices=["auto", "loop", "gro"],
+        default="auto",
+        help="how udp datagrams are received: one recvfrom() per datagram (loop), "
+             "a connected socket drained with recvmsg() using UDP_GRO (gro), "
+             "or gro with fallback to loop (auto) (default: auto)")
+
+    parser.add_argument("--udp-pacing",
+        choices=["batch", "precise", "kernel"],
+        default="batch",
+        help="how udp batches are paced: fixed 1 ms batches using sleep (batch), "
+             "small batches on a monotonic clock using sleep plus spin, with pacing error stats (precise), "
+             "or by the fq qdisc using SO_MAX_PACING_RATE, falling back to precise if fq is not found (kernel) "
+             "(default: batch)")
+
+    parser.add_argument("--udp-max-burst",
+        metavar="PACKETS",
+        type=int,
+        default=const.UDP_PACING_DEFAULT_MAX_BURST,
+        help="max datagrams sent back to back with --udp-pacing precise or kernel (default: {})".format(const.UDP_PACING_DEFAULT_MAX_BURST))
+
+    parser.add_argument("--copy-free-recv",
+        action="store_true",
+        default=False,
+        help="data receiver reads into reusable buffers and discards payload bytes "
+             "in the kernel (MSG_TRUNC) instead of copying them")
+
+    parser.add_argument("--data-header",
+        choices=["ascii", "binary"],
+        default="ascii",
+        help="format of the header in each data packet: ascii text, or a fixed width "
+             "binary header with stateful tcp framing (default: ascii)")
+
+    parser.add_argument("--max-concurrent-sessions",
+        type=int,
+        default=const.DEFAULT_MAX_CONCURRENT_SESSIONS,
+        help="server only, max number of tests run at the same time, clients beyond that "
+             "wait for their turn (default: {})".format(const.DEFAULT_MAX_CONCURRENT_SESSIONS))
+
+    parser.add_argument("--max-queue-length",
+        type=int,
+        default=const.DEFAULT_MAX_QUEUE_LENGTH,
+        help="server only, max number of clients waiting for their turn, clients beyond that "
+             "are told to retry later (default: {})".format(const.DEFAULT_MAX_QUEUE_LENGTH))
+
+    parser.add_argument("--max-queue-wait",
+        metavar="SECONDS",
+        type=float,
+        default=const.DEFAULT_MAX_QUEUE_WAIT_SEC,
+        help="server only, clients that would wait longer than this for their turn are told "
+             "to retry later (default: {})".format(const.DEFAULT_MAX_QUEUE_WAIT_SEC))
+
+    parser.add_argument("--bandwidth-budget",
+        metavar="MBPS",
+        type=float,
+        default=None,
+        help="server only, total bandwidth of the tests run at the same time (default: no limit)")
+
+    parser.add_argument("--session-bandwidth",
+        metavar="MBPS",
+        type=float,
+        default=const.DEFAULT_SESSION_BANDWIDTH_MBPS,
+        help="server only, bandwidth counted against --bandwidth-budget for a test without "
+             "--tcp-target-rate (default: {})".format(const.DEFAULT_SESSION_BANDWIDTH_MBPS))
+
+    parser.add_argument("--exclusive",
+        action="store_true",
+        default=False,
+        help="client only, do not share the server with other tests")
+
+    parser.add_argument("--busy-retries",
+        type=int,
+        default=const.DEFAULT_BUSY_RETRIES,
+        help="client only, times to come back when the server is busy, with backoff "
+             "(default: {})".format(const.DEFAULT_BUSY_RETRIES))
+
+    parser.add_argument("--metrics-port",
+        type=int,
+        default=None,
+        help="server only, serve live metrics in the prometheus text format over http on "
+             "this port (default: off)")
+
+    parser.add_argument("--metrics-bind",
+        default=const.DEFAULT_METRICS_BIND,
+        help="server only, local address of the metrics port (default: {})".format(const.DEFAULT_METRICS_BIND))
+
+    parser.add_argument("--metrics-textfile",
+        metavar="FILE",
+        default=None,
+        help="server only, write live metrics to this file every {} seconds, for the node "
+             "exporter textfile collector, e.g. FILE ending in \".prom\" (default: off)".format(const.METRICS_TEXTFILE_INTERVAL_SEC))
+
+    parser.add_argument("--engine",
+        choices=["multiprocessing", "asyncio"],
+        default="multiprocessing",
+        help="run the test in a process per flow (multiprocessing), or in a single asyncio "
+             "event loop, for low rate tests and servers with many clients (asyncio) "
+             "(default: multiprocessing)")
+
+    parser.add_argument("--control-protocol",
+        choices=["auto", "ascii", "binary"],
+        default="auto",
+        help="format of the interval records on the control connection: ascii text, or "
+             "length prefixed binary records.  auto uses binary if the server supports it "
+             "(default: auto)")
+
     args = parser.parse_args()
 
     util.validate_and_finalize_args(args)
@@ -131,12 +318,18 @@ def mainline():
             print("bbperf version {} (protocol: TCP, congestion control: {}, tcp_notsent_lowat: {})".format(
                 const.BBPERF_VERSION, args.congestion, args.tcp_notsent_lowat), flush=True)
 
-        client.client_mainline(args)
+        if args.engine == "asyncio":
+            async_client.client_mainline(args)
+        else:
+            client.client_mainline(args)
     else:
 
         print("bbperf version {} (bbperf server)".format(const.BBPERF_VERSION), flush=True)
 
-        server.server_mainline(args)
+        if args.engine == "asyncio":
+            async_server.server_mainline(args)
+        else:
+            server.server_mainline(args)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,72 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+from . import binary_header_helper
+
+# tracks binary frame boundaries across tcp recv calls
+#
+# a header may straddle two (or more) recv buffers, so the bytes of a partial header are
+# kept here until the rest arrives.  only the frame length field is looked at for each
+# frame, the full header is unpacked just for the most recent one.
+#
+# with --kernel-timestamps, the receive time of the recv that completed the most recent
+# header is kept with it, so the dwell is that of the header we report on.
+class BinaryFrameParserClass:
+
+    def __init__(self):
+        self.header_buffer = bytearray(binary_header_helper.BINARY_HEADER_SIZE)
+        self.header_bytes_have = 0
+        self.payload_bytes_remaining = 0
+        self.num_frames = 0
+        self.last_header = None
+        self.last_header_rx_time_sec = None
+
+
+    # view is the bytes from one recv call, rx_time_sec its kernel receive time (or None)
+    def feed(self, view, rx_time_sec=None):
+        header_size = binary_header_helper.BINARY_HEADER_SIZE
+        view_len = len(view)
+        offset = 0
+        last_header_offset = None
+
+        while offset < view_len:
+
+            if self.payload_bytes_remaining > 0:
+                num_bytes_to_skip = min(self.payload_bytes_remaining, view_len - offset)
+                self.payload_bytes_remaining -= num_bytes_to_skip
+                offset += num_bytes_to_skip
+                continue
+
+            if self.header_bytes_have == 0 and (offset + header_size) <= view_len:
+                # fast path, the whole header is in this buffer
+                frame_len = binary_header_helper.FRAME_LEN_STRUCT.unpack_from(
+                    view, offset + binary_header_helper.FRAME_LEN_OFFSET)[0]
+                last_header_offset = offset
+                offset += header_size
+
+            else:
+                # header straddles recv buffers
+                num_bytes_to_copy = min(header_size - self.header_bytes_have, view_len - offset)
+                self.header_buffer[ self.header_bytes_have : self.header_bytes_have + num_bytes_to_copy ] = view[ offset : offset + num_bytes_to_copy ]
+                self.header_bytes_have += num_bytes_to_copy
+                offset += num_bytes_to_copy
+
+                if self.header_bytes_have < header_size:
+                    # need more bytes
+                    break
+
+                self.header_bytes_have = 0
+                self.last_header = binary_header_helper.unpack_header(self.header_buffer)
+                self.last_header_rx_time_sec = rx_time_sec
+                frame_len = self.last_header[3]
+                last_header_offset = None
+
+            if frame_len < header_size:
+                raise Exception("ERROR: binary frame parser: invalid frame length {}".format(frame_len))
+
+            self.payload_bytes_remaining = frame_len - header_size
+            self.num_frames += 1
+
+        if last_header_offset is not None:
+            self.last_header = binary_header_helper.unpack_header(view, last_header_offset)
+            self.last_header_rx_time_sec = rx_time_sec
@@ -0,0 +1,100 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import struct
+
+from . import tcp_info_helper
+
+# fixed width data header used with "--data-header binary"
+#
+# every send (tcp) or datagram (udp) is one frame: this header followed by filler payload
+#
+#   magic                     H   BINARY_HEADER_MAGIC
+#   version                   B   BINARY_HEADER_VERSION
+#   record type               B   0 = cal, 1 = run
+#   frame length              I   header plus payload, in bytes
+#   sent time                 Q   nanoseconds since the epoch
+#   sender interval duration  Q   nanoseconds
+#   sender interval pkts sent Q   valid for udp only
+#   sender interval bytes     Q
+#   sender total pkts sent    Q   valid for udp only
+#   sender tcp info           IIIIIIQQQ   tcp only, see tcp_info_helper
+
+BINARY_HEADER_MAGIC = 0xbbfe
+BINARY_HEADER_VERSION = 2
+
+BINARY_HEADER_STRUCT = struct.Struct('!HBBIQQQQQIIIIIIQQQ')
+BINARY_HEADER_SIZE = BINARY_HEADER_STRUCT.size
+
+# offset of the frame length field, so frames can be walked without unpacking every header
+FRAME_LEN_STRUCT = struct.Struct('!I')
+FRAME_LEN_OFFSET = 4
+
+MAGIC_STRUCT = struct.Struct('!H')
+
+RECORD_TYPE_CAL = 0
+RECORD_TYPE_RUN = 1
+
+
+# allocate a frame buffer once, the header is patched in place on every send
+def create_frame_buffer(payload_bytes):
+    frame_buffer = bytearray(BINARY_HEADER_SIZE + len(payload_bytes))
+    frame_buffer[ BINARY_HEADER_SIZE : ] = payload_bytes
+    return frame_buffer
+
+
+def pack_header_into(frame_buffer, is_calibrated, sent_time_ns, interval_time_ns,
+                     interval_send_count, interval_bytes_sent, total_send_counter, tcp_info):
+
+    BINARY_HEADER_STRUCT.pack_into(frame_buffer, 0,
+        BINARY_HEADER_MAGIC,
+        BINARY_HEADER_VERSION,
+        RECORD_TYPE_RUN if is_calibrated else RECORD_TYPE_CAL,
+        len(frame_buffer),
+        sent_time_ns,
+        interval_time_ns,
+        interval_send_count,
+        interval_bytes_sent,
+        total_send_counter,
+        *tcp_info)
+
+
+# for udp, where a datagram may be something other than a data frame
+def is_binary_header(buffer):
+    if len(buffer) < BINARY_HEADER_SIZE:
+        return False
+
+    return MAGIC_STRUCT.unpack_from(buffer, 0)[0] == BINARY_HEADER_MAGIC
+
+
+# returns the header fields as a tuple
+def unpack_header(buffer, offset=0):
+    header = BINARY_HEADER_STRUCT.unpack_from(buffer, offset)
+
+    if header[0] != BINARY_HEADER_MAGIC:
+        raise Exception("ERROR: invalid binary data header magic: {:#x}".format(header[0]))
+
+    if header[1] != BINARY_HEADER_VERSION:
+        raise Exception("ERROR: unsupported binary data header version: {}".format(header[1]))
+
+    return header
+
+
+def ns_to_decimal_str(ns):
+    return "{}.{:09d}".format(ns // 1000000000, ns % 1000000000)
+
+
+# the control connection carries the same " a ... b " block regardless of the data header format
+def header_to_a_b_block(header):
+    _, _, record_type, _, sent_time_ns, interval_time_ns, interval_send_count, interval_bytes_sent, total_send_counter = header[ : 9 ]
+
+    a_b_str = " a {} {} {} {} {} {} {} b ".format(
+        "run" if record_type == RECORD_TYPE_RUN else "cal",
+        ns_to_decimal_str(sent_time_ns),
+        ns_to_decimal_str(interval_time_ns),
+        interval_send_count,
+        interval_bytes_sent,
+        total_send_counter,
+        tcp_info_helper.tcp_info_to_bytes(header[ 9 : ]).decode())
+
+    return a_b_str.encode()
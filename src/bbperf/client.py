@@ -3,6 +3,7 @@
 # Copyright (c) 2024 Cloudflare, Inc.
 # Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
 
+import os
 import multiprocessing
 import time
 import queue
@@ -19,37 +20,36 @@ from . import util
 from . import const
 from . import output
 from . import graph
+from . import data_file_helper
 from . import tcp_helper
 from . import udp_helper
+from . import control_record_helper
 
 from .tcp_control_connection_class import TcpControlConnectionClass
+from .ready_event_class import ReadyEventClass
+from .shm_ring_buffer_class import ShmRingBufferClass
+from .exceptions import ServerBusyException
 
 
-def client_mainline(args):
-    client_start_time = time.time()
-
-    if args.verbosity:
-        print("args: {}".format(args), flush=True)
+def get_server_addr(args):
+    try:
+        # is the arg already an IP address?
+        ipaddress.ip_address(args.client)
+        server_ip = args.client
 
-    if args.client:
+    except ValueError:
+        # not an ip address, must be a hostname
         try:
-            # is the arg already an IP address?
-            ipaddress.ip_address(args.client)
-            server_ip = args.client
+            server_ip = socket.gethostbyname(args.client)
 
-        except ValueError:
-            # not an ip address, must be a hostname
-            try:
-                server_ip = socket.gethostbyname(args.client)
-
-            except socket.gaierror as e:
-                raise Exception("ERROR: unable to resolve hostname {}, {}".format(args.client, e))
+        except socket.gaierror as e:
+            raise Exception("ERROR: unable to resolve hostname {}, {}".format(args.client, e))
 
-    server_port = args.port
-    server_addr = (server_ip, server_port)
+    return (server_ip, args.port)
 
-    # create control connection
 
+# connects and sends our args, returns (control_conn, client control addr, run_id, control protocol)
+def create_control_connection(args, server_addr):
     if args.verbosity:
         print("creating control connection to server at {}".format(server_addr), flush=True)
 
@@ -75,7 +75,53 @@ def client_mainline(args):
 
     control_conn.send_args_to_server(args)
 
-    control_conn.wait_for_control_args_ack()
+    try:
+        control_protocol = control_conn.wait_for_control_args_ack()
+    except ServerBusyException:
+        control_conn.close()
+        raise
+
+    return control_conn, client_control_addr, run_id, control_protocol
+
+
+# same, but comes back later when the server is busy, up to --busy-retries times
+def create_control_connection_with_retries(args, server_addr):
+    retry_num = 0
+
+    while True:
+        try:
+            return create_control_connection(args, server_addr)
+
+        except ServerBusyException as e:
+            if retry_num >= args.busy_retries:
+                raise Exception("ERROR: server busy, giving up after {} retries".format(retry_num))
+
+            backoff_sec = util.get_busy_backoff_sec(retry_num, e.retry_after_sec)
+
+            print("{}, retrying in {:.1f} seconds".format(e, backoff_sec), flush=True)
+
+            time.sleep(backoff_sec)
+
+            retry_num += 1
+
+
+def client_mainline(args):
+    client_start_time = time.time()
+
+    if args.verbosity:
+        print("args: {}".format(args), flush=True)
+
+    server_addr = get_server_addr(args)
+    server_ip = server_addr[0]
+
+    # create control connection
+
+    control_conn, client_control_addr, run_id, control_protocol = create_control_connection_with_retries(args, server_addr)
+
+    if (args.control_protocol == "binary") and (control_protocol != "binary"):
+        raise Exception("ERROR: server does not support the binary control protocol")
+
+    args.control_protocol = control_protocol
 
     # create data connection
 
@@ -84,133 +130,157 @@ def client_mainline(args):
 
     data_initial_string = "data " + run_id
 
-    if args.udp:
-        data_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        # bind client data connection to local address and/or port
-        data_sock.bind((args.bind, args.local_data_port))
-        data_sock.settimeout(const.SOCKET_TIMEOUT_SEC)
-        # must send something just to bind a local addr
-        # this packet is not used by the server
-        data_sock.sendto("foo".encode(), (server_ip, 65535))
-        client_data_addr = data_sock.getsockname()
-        if args.verbosity:
-            print("created udp data connection, client {}, no server addr".format(client_data_addr), flush=True)
-
-        if args.verbosity:
-            print("sending data initial string (async udp): {}".format(data_initial_string), flush=True)
-
-        # start and keep sending the data connection initial string asynchronously
-        readyevent = multiprocessing.Event()
-        doneevent = multiprocessing.Event()
-        udp_data_initial_string_sender_process = multiprocessing.Process(
-            name = "udpdatainitialstringsender",
-            target = udp_string_sender_thread.run,
-            args = (readyevent, doneevent, args, data_sock, server_addr, data_initial_string),
-            daemon = True)
-        udp_data_initial_string_sender_process.start()
-        if not readyevent.wait(timeout=60):
-            raise Exception("ERROR: process failed to become ready")
-
-        if args.verbosity:
-            print("waiting for data initial ack", flush=True)
-
-        # wait for data init ack
-        udp_helper.wait_for_string(data_sock, server_addr, const.UDP_DATA_INITIAL_ACK)
+    data_sock_list = []
+    client_data_addr_list = []
 
-        if args.verbosity:
-            print("received data initial ack", flush=True)
+    # one data connection per stream, all under the same run_id
+    for stream_id in range(args.parallel):
 
-        # stop sending data initial string
-        doneevent.set()
+        if args.local_data_port:
+            local_data_port = args.local_data_port + stream_id
+        else:
+            local_data_port = 0
+
+        if args.udp:
+            data_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            # bind client data connection to local address and/or port
+            data_sock.bind((args.bind, local_data_port))
+            data_sock.settimeout(const.SOCKET_TIMEOUT_SEC)
+            # must send something just to bind a local addr
+            # this packet is not used by the server
+            data_sock.sendto("foo".encode(), (server_ip, 65535))
+            client_data_addr = data_sock.getsockname()
+            if args.verbosity:
+                print("created udp data connection, client {}, no server addr".format(client_data_addr), flush=True)
+
+            if args.verbosity:
+                print("sending data initial string (async udp): {}".format(data_initial_string), flush=True)
+
+            # start and keep sending the data connection initial string asynchronously
+            readyevent = ReadyEventClass()
+            doneevent = multiprocessing.Event()
+            udp_data_initial_string_sender_process = multiprocessing.Process(
+                name = "udpdatainitialstringsender",
+                target = udp_string_sender_thread.run,
+                args = (readyevent, doneevent, args, data_sock, server_addr, data_initial_string),
+                daemon = True)
+            udp_data_initial_string_sender_process.start()
+            readyevent.wait_until_ready(udp_data_initial_string_sender_process)
+
+            if args.verbosity:
+                print("waiting for data initial ack", flush=True)
+
+            # wait for data init ack
+            udp_helper.wait_for_string(data_sock, server_addr, const.UDP_DATA_INITIAL_ACK)
+
+            if args.verbosity:
+                print("received data initial ack", flush=True)
+
+            # stop sending data initial string
+            doneevent.set()
 
-    else:
-        data_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        # bind client data connection to local address and/or port
-        data_sock.bind((args.bind, args.local_data_port))
-        tcp_helper.set_congestion_control(args, data_sock)
-        tcp_helper.set_tcp_notsent_lowat(data_sock, args.tcp_notsent_lowat)
-        data_sock.connect(server_addr)
-        data_sock.settimeout(const.SOCKET_TIMEOUT_SEC)
-        client_data_addr = data_sock.getsockname()
-        if args.verbosity:
-            print("created tcp data connection, client {}, server {}".format(
-                client_data_addr, server_addr), flush=True)
-
-        if args.verbosity:
-            print("sending data initial string (tcp): {}".format(data_initial_string), flush=True)
-        data_sock.sendall(data_initial_string.encode())
-        if args.verbosity:
-            print("sent data initial string (tcp)", flush=True)
+        else:
+            data_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            # bind client data connection to local address and/or port
+            data_sock.bind((args.bind, local_data_port))
+            tcp_helper.set_congestion_control(args, data_sock)
+            tcp_helper.set_tcp_notsent_lowat(data_sock, args.tcp_notsent_lowat)
+            tcp_helper.set_tcp_target_rate(args, data_sock)
+            data_sock.connect(server_addr)
+            data_sock.settimeout(const.SOCKET_TIMEOUT_SEC)
+            client_data_addr = data_sock.getsockname()
+            if args.verbosity:
+                print("created tcp data connection, client {}, server {}".format(
+                    client_data_addr, server_addr), flush=True)
+
+            if args.verbosity:
+                print("sending data initial string (tcp): {}".format(data_initial_string), flush=True)
+            data_sock.sendall(data_initial_string.encode())
+            if args.verbosity:
+                print("sent data initial string (tcp)", flush=True)
+
+        data_sock_list.append(data_sock)
+        client_data_addr_list.append(client_data_addr)
 
     control_conn.wait_for_setup_complete_message()
 
     shared_run_mode = multiprocessing.Value('i', const.RUN_MODE_CALIBRATING)
     shared_udp_sending_rate_pps = multiprocessing.Value('i', const.UDP_DEFAULT_INITIAL_RATE)
-    control_receiver_results_queue = multiprocessing.Queue()
+    # bytes per second, zero is not paced
+    shared_tcp_pacing_rate = multiprocessing.Value('d', 0.0)
+    control_receiver_results_ring = ShmRingBufferClass(control_record_helper.MAX_RECORD_SIZE, const.RESULTS_RING_NUM_SLOTS)
+    sender_stats_queue = multiprocessing.Queue()
 
     if args.reverse:
         # direction down
 
-        readyevent = multiprocessing.Event()
+        thread_list = []
 
-        data_receiver_process = multiprocessing.Process(
-            name = "datareceiver",
-            target = data_receiver_thread.run,
-            args = (readyevent, args, control_conn, data_sock, server_addr),
-            daemon = True)
+        # data receivers share the control connection
+        control_send_lock = multiprocessing.Lock()
+        shared_num_receivers_running = multiprocessing.Value('i', len(data_sock_list))
 
-        data_receiver_process.start()
-        if not readyevent.wait(timeout=60):
-            raise Exception("ERROR: process failed to become ready")
+        for stream_id, data_sock in enumerate(data_sock_list):
+            readyevent = ReadyEventClass()
 
-        readyevent = multiprocessing.Event()
+            data_receiver_process = multiprocessing.Process(
+                name = "datareceiver{}".format(stream_id),
+                target = data_receiver_thread.run,
+                args = (readyevent, args, control_conn, data_sock, server_addr, stream_id, control_send_lock, shared_num_receivers_running),
+                daemon = True)
+
+            data_receiver_process.start()
+            readyevent.wait_until_ready(data_receiver_process)
+
+            thread_list.append(data_receiver_process)
+
+        readyevent = ReadyEventClass()
 
         control_receiver_process = multiprocessing.Process(
             name = "controlreceiver",
             target = control_receiver_thread.run_recv_queue,
-            args = (readyevent, args, control_conn, control_receiver_results_queue),
+            args = (readyevent, args, control_conn, control_receiver_results_ring),
             daemon = True)
 
         control_receiver_process.start()
-        if not readyevent.wait(timeout=60):
-            raise Exception("ERROR: process failed to become ready")
+        readyevent.wait_until_ready(control_receiver_process)
 
         # test starts here
 
         control_conn.send_start_message()
 
-        thread_list = []
-        thread_list.append(data_receiver_process)
         thread_list.append(control_receiver_process)
 
 
     else:
         # direction up
 
-        readyevent = multiprocessing.Event()
+        readyevent = ReadyEventClass()
 
         control_receiver_process = multiprocessing.Process(
             name = "controlreceiver",
             target = control_receiver_thread.run_recv_term_queue,
-            args = (readyevent, args, control_conn, control_receiver_results_queue, shared_run_mode, shared_udp_sending_rate_pps),
+            args = (readyevent, args, control_conn, control_receiver_results_ring, shared_run_mode, shared_udp_sending_rate_pps, shared_tcp_pacing_rate),
             daemon = True)
 
         control_receiver_process.start()
-        if not readyevent.wait(timeout=60):
-            raise Exception("ERROR: process failed to become ready")
-
-        data_sender_process = multiprocessing.Process(
-            name = "datasender",
-            target = data_sender_thread.run,
-            args = (args, data_sock, server_addr, shared_run_mode, shared_udp_sending_rate_pps),
-            daemon = True)
-
-        # test starts here
-        data_sender_process.start()
+        readyevent.wait_until_ready(control_receiver_process)
 
         thread_list = []
         thread_list.append(control_receiver_process)
-        thread_list.append(data_sender_process)
+
+        for stream_id, data_sock in enumerate(data_sock_list):
+            data_sender_process = multiprocessing.Process(
+                name = "datasender{}".format(stream_id),
+                target = data_sender_thread.run,
+                args = (args, data_sock, server_addr, shared_run_mode, shared_udp_sending_rate_pps, shared_tcp_pacing_rate, sender_stats_queue),
+                daemon = True)
+
+            thread_list.append(data_sender_process)
+
+        # test starts here
+        for data_sender_process in thread_list[1:]:
+            data_sender_process.start()
 
 
     if args.verbosity:
@@ -218,7 +288,7 @@ def client_mainline(args):
               "udp" if args.udp else "tcp",
               "down" if args.reverse else "up",
               client_control_addr,
-              client_data_addr,
+              client_data_addr_list,
               server_addr,
               (time.time() - client_start_time)),
               flush=True)
@@ -230,19 +300,22 @@ def client_mainline(args):
     start_time_sec = time.time()
 
     while True:
-        try:
-            s1 = control_receiver_results_queue.get_nowait()
-        except queue.Empty:
-            s1 = None
+        record_list = control_receiver_results_ring.get_batch()
+
+        for record in record_list:
+            output.print_output(record)
 
-        if s1:
-            output.print_output(s1)
+        if len(record_list) > 0:
             continue
 
-        if util.threads_are_running(thread_list):
-            # nothing in queues, but test is still running
-            time.sleep(0.01)
-        else:
+        # before threads_are_running(), so that a process exiting after it looked still wakes
+        # up the wait below
+        sentinel_list = util.get_sentinel_list(thread_list)
+
+        if not util.threads_are_running(thread_list):
+            # anything put after the get_batch() above
+            for record in control_receiver_results_ring.get_batch():
+                output.print_output(record)
             break
 
         curr_time_sec = time.time()
@@ -250,21 +323,55 @@ def client_mainline(args):
         if ((curr_time_sec - start_time_sec) > args.max_run_time_failsafe_sec):
             raise Exception("ERROR: max_run_time_failsafe_sec exceeded")
 
+        # nothing in the ring, but test is still running
+        # wakes up on the next record, or as soon as one of the processes exits
+        control_receiver_results_ring.wait(
+            start_time_sec + args.max_run_time_failsafe_sec - curr_time_sec,
+            sentinel_list)
+
     if args.verbosity:
         print("test finished, generating output", flush=True)
 
+    # the data senders are done, so anything they reported is already queued
+    while True:
+        try:
+            output.add_udp_pacing_stats(sender_stats_queue.get_nowait())
+        except queue.Empty:
+            break
+
     output.term()
 
-    util.done_with_socket(data_sock)
+    control_receiver_results_ring.close()
+
+    for data_sock in data_sock_list:
+        util.done_with_socket(data_sock)
     control_conn.close()
 
+    write_output_files(args)
+
+    if args.verbosity:
+        print("test complete, exiting")
+
+
+# graphs and the data files the user asked to keep, after output.term()
+def write_output_files(args):
     graphdatafilename = output.get_graph_data_file_name()
     rawdatafilename = output.get_raw_data_file_name()
 
     if (args.graph or args.graph_file) and not args.quiet:
-        pngfilename = graphdatafilename + ".png"
+        if args.data_file_format == "npy":
+            # gnuplot reads text
+            graphtextfilename = graphdatafilename[:-len(".npy")] + ".txt"
+            data_file_helper.write_graph_data_text_file(graphdatafilename, graphtextfilename)
+        else:
+            graphtextfilename = graphdatafilename
 
-        graph.create_graph(args, graphdatafilename, pngfilename)
+        pngfilename = graphtextfilename + ".png"
+
+        graph.create_graph(args, graphtextfilename, pngfilename)
+
+        if graphtextfilename != graphdatafilename:
+            os.remove(graphtextfilename)
 
         if args.graph_file:
             try:
@@ -278,6 +385,25 @@ def client_mainline(args):
         else:
             print("created graph: {}".format(pngfilename), flush=True)
 
+        if args.sweep:
+            sweepdatafilename = output.get_sweep_data_file_name()
+            sweeppngfilename = sweepdatafilename + ".png"
+
+            graph.create_sweep_graph(args, sweepdatafilename, sweeppngfilename)
+
+            if args.graph_file:
+                # next to the main graph: foo.png -> foo-sweep.png
+                sweep_graph_file = args.graph_file[:-len(".png")] + "-sweep.png"
+                try:
+                    shutil.move(sweeppngfilename, sweep_graph_file)
+                    print("created graph: {}".format(sweep_graph_file), flush=True)
+
+                except Exception as e:
+                    print("ERROR: during move of sweep graph png file: {}".format(e), flush=True)
+
+            else:
+                print("created graph: {}".format(sweeppngfilename), flush=True)
+
     if args.graph_data_file:
         shutil.copy(graphdatafilename, args.graph_data_file)
         if not args.quiet:
@@ -289,6 +415,3 @@ def client_mainline(args):
             print("keeping raw data file: {}".format(args.raw_data_file), flush=True)
 
     output.delete_tmp_data_files()
-
-    if args.verbosity:
-        print("test complete, exiting")
@@ -17,10 +17,30 @@ MAX_DATA_COLLECTION_TIME_WITHOUT_VALID_DATA = 60
 DATA_SAMPLE_IGNORE_TIME_ALWAYS_SEC = 1
 DATA_SAMPLE_IGNORE_TIME_TCP_MAX_SEC = 5
 DATA_SAMPLE_IGNORE_TIME_UDP_MAX_SEC = 10
+# with --tcp-target-rate, samples are valid once the flow reaches this fraction of its target
+DATA_SAMPLE_TCP_TARGET_RATE_VALID_FRACTION = 0.9
+
+# sweep mode (--sweep)
+# how long to measure capacity (at full rate) before the first step
+SWEEP_CAPACITY_ESTIMATE_TIME_SEC = 2
+# samples taken this soon after a rate change are not counted towards the step
+SWEEP_STEP_SETTLE_TIME_SEC = 0.5
+SWEEP_DEFAULT_STEP_TIME_SEC = 2
+SWEEP_DEFAULT_LOAD_PERCENTS = "10,20,30,40,50,60,70,80,90,100,110,120"
+# marks records that do not belong to any sweep step
+SWEEP_STEP_NONE = -1
+
+# high resolution rtt (--rtt-sample-interval)
+# the "count min p50 p99 max" fields of the d block, for an interval without samples
+RTT_SAMPLE_STATS_NONE = (0, 0, 0, 0, 0)
 
 # for socket recv()
 BUFSZ = (128 * 1024)
 
+# with --copy-free-recv, only this many bytes at the start of a received packet are copied
+# out of the kernel, which is plenty for the data header
+DATA_HEADER_REGION_SIZE = 256
+
 PAYLOAD_1K = b'a'*1024
 PAYLOAD_4K = b'a'*(4*1024)
 
@@ -28,23 +48,116 @@ RUN_MODE_CALIBRATING = 1
 RUN_MODE_RUNNING = 2
 RUN_MODE_STOP = 3
 
+MAX_PARALLEL_STREAMS = 128
+
 SAMPLE_INTERVAL_SEC = 0.1
 STDOUT_INTERVAL_SEC = 1
 
+# summary percentiles (see quantile_sketch_class), exact up to this many values of a
+# statistic, within this relative error after that
+QUANTILE_SKETCH_MAX_EXACT_SAMPLES = 10000
+QUANTILE_SKETCH_RELATIVE_ACCURACY = 0.005
+
+# the percentiles in the summary (plus --extra-percentiles), and the points of the cdf in the json file
+SUMMARY_PERCENT_LIST = [ 1, 10, 50, 90, 99 ]
+SUMMARY_CDF_PERCENT_LIST = list(range(0, 101, 5))
+
+# --data-file-format npy, records buffered per write (see npy_writer_class)
+NPY_WRITER_CHUNK_RECORDS = 4096
+
+# shared memory ring between the control receiver and the client output loop
+RESULTS_RING_NUM_SLOTS = 8192
+# longest the control receiver waits for room in a full ring, the output loop is gone by then
+RESULTS_RING_FULL_MAX_WAIT_SEC = 30
+
 # pacing for UDP sends
 UDP_DESIRED_BATCHES_PER_SECOND = 1000
 UDP_NEGATIVE_DELAY_BETWEEN_BATCHES_WARNING_EVERY = UDP_DESIRED_BATCHES_PER_SECOND
 
+# precise udp pacing ("--udp-pacing precise")
+# smallest gap we aim for between batches, batches grow (up to the burst limit) to keep this
+UDP_PACING_MIN_GAP_SEC = 0.0001
+# sleep until this close to the deadline, then spin
+UDP_PACING_SPIN_SEC = 0.0002
+UDP_PACING_DEFAULT_MAX_BURST = 32
+# gap error samples kept for the pacing stats (decimated when full)
+UDP_PACING_MAX_GAP_ERROR_SAMPLES = 100000
+# kernel udp pacing ("--udp-pacing kernel") works in bytes per second, this is added to
+# the payload to cover the data header and the udp, ip and ethernet headers
+UDP_KERNEL_PACING_OVERHEAD_BYTES = 128
+
 SETUP_COMPLETE_MSG = "setup complete"
 START_MSG = " start "
 UDP_STOP_MSG = "stop"
 TCP_CONTROL_INITIAL_ACK = "control initial ack"
-TCP_CONTROL_ARGS_ACK = "control args ack"
+# the client args, control records and data blocks, client and server must have the same,
+# the client sends it with its args (bbperf before this sent none, that is version 1)
+PROTOCOL_VERSION = 2
+# the server agrees to the ascii or the binary control protocol
+TCP_CONTROL_ARGS_ACK = "control args a{:02d}".format(PROTOCOL_VERSION)
+TCP_CONTROL_ARGS_ACK_BINARY = "control args b{:02d}".format(PROTOCOL_VERSION)
+# the args ack of a server without a protocol version
+TCP_CONTROL_ARGS_ACK_VERSION_1 = "control args ack"
+# sent instead of the control args ack, same length (a client without a protocol version
+# shows it in its invalid ack error)
+TCP_CONTROL_ARGS_VERSION_MISMATCH = "version mismatch"
 UDP_DATA_INITIAL_ACK = "data initial ack"
+# sent instead of the control args ack, same length, see admission_controller_class
+# the client is queued, estimated wait in seconds, the control args ack follows later
+TCP_CONTROL_ARGS_QUEUED = "queued {:09d}"
+# the server is busy, retry after this many seconds
+TCP_CONTROL_ARGS_BUSY = "busy {:011d}"
+# the server cannot run the test, followed by an error message of this many bytes
+TCP_CONTROL_ARGS_ERROR = "error {:010d}"
 
 SOCKET_TIMEOUT_SEC=30
 
+# tests the server runs at the same time
+DEFAULT_MAX_CONCURRENT_SESSIONS = 16
+
+# server admission control
+# clients waiting for a free slot
+DEFAULT_MAX_QUEUE_LENGTH = 32
+# clients that would wait longer than this are told to come back later
+DEFAULT_MAX_QUEUE_WAIT_SEC = 300
+# bandwidth set aside for a test without --tcp-target-rate, with --bandwidth-budget
+DEFAULT_SESSION_BANDWIDTH_MBPS = 1000
+# calibration usually ends well before its max, used to estimate when running tests end
+EXPECTED_CALIBRATION_TIME_SEC = 10
+# queued clients get a fresh estimate this often, well within SOCKET_TIMEOUT_SEC
+QUEUE_UPDATE_INTERVAL_SEC = 10
+
+# server metrics exporter
+DEFAULT_METRICS_BIND = "127.0.0.1"
+METRICS_TEXTFILE_INTERVAL_SEC = 5
+
+# client backoff when the server is busy
+DEFAULT_BUSY_RETRIES = 5
+BUSY_BACKOFF_INITIAL_SEC = 1
+BUSY_BACKOFF_MAX_SEC = 60
+# random extra fraction of the backoff, so clients told the same retry time do not all come back at once
+BUSY_BACKOFF_JITTER = 0.25
+
+PROCESS_READY_TIMEOUT_SEC = 60
+
 UDP_DEFAULT_INITIAL_RATE = 8000
 
 UDP_MIN_RATE = 100
 UDP_MAX_RATE = 800000
+
+# linux socket options that are not exported by the python socket module
+UDP_SEGMENT = 103
+UDP_GRO = 104
+SO_MAX_PACING_RATE = 47
+SO_TIMESTAMPNS = 35
+SCM_TIMESTAMPNS = SO_TIMESTAMPNS
+SO_MAX_PACING_RATE_UNLIMITED = 0xffffffffffffffff
+
+# max number of datagrams per udp gso send (UDP_MAX_SEGMENTS in the kernel)
+UDP_GSO_MAX_SEGMENTS = 64
+# max udp payload for ipv4 (65535 - 20 byte ip header - 8 byte udp header)
+UDP_MAX_PAYLOAD = 65507
+
+# max recvmsg() calls when draining the udp data socket, so the data receiver
+# still gets back to its interval bookkeeping when packets never stop arriving
+UDP_RECV_MAX_CALLS_PER_BATCH = 64
@@ -5,20 +5,169 @@ import time
 
 from . import util
 from . import const
+from . import control_record_helper
 
 from .exceptions import PeerDisconnectedException
 from .udp_rate_manager_class import UdpRateManagerClass
 from .run_mode_manager_class import RunModeManagerClass
+from .sweep_manager_class import SweepManagerClass
+from .rtt_sample_aggregator_class import RttSampleAggregatorClass
+from .session_metrics_class import CONTROL_RECEIVER_WORKER_IDX
+from .echo_record_class import EchoRecordClass
+from .interval_record_class import IntervalRecordClass
+
+# once samples are valid, echoes are too
+def get_echo_is_sample_valid(run_mode_manager):
+    return 1 if (run_mode_manager.first_valid_sample_time is not None) else 0
+
+
+# rtt echo record, with --rtt-sample-interval
+# e_record has the raw fields of the " e ... f " block, adds ours (" f ... g ") and the rtt to the aggregator
+def process_e_record(args, e_record, curr_time_sec, control_dwell_sec, run_mode_manager, rtt_sample_aggregator):
+
+    e_record.r_pkt_received_time_sec = curr_time_sec
+    e_record.control_dwell_sec = control_dwell_sec
+    e_record.is_sample_valid = get_echo_is_sample_valid(run_mode_manager)
+
+    util.add_e_record_derived_fields(args, e_record)
+
+    rtt_sample_aggregator.add_sample(e_record.r_stream_id, e_record.rtt_sec)
+
+    return e_record
+
+
+# interval record
+# r_record has the raw fields of the " a ... c " block, adds ours (" c ... d ") and runs the managers on it
+def process_r_record(args, r_record, curr_time_sec, control_dwell_sec, run_mode_manager, udp_rate_manager, sweep_manager, rtt_sample_aggregator, session_metrics=None):
+
+    r_record.r_pkt_received_time_sec = curr_time_sec
+    r_record.control_dwell_sec = control_dwell_sec
+
+    # these will be updated below
+    r_record.interval_dropped = 0
+    r_record.interval_dropped_percent = 0.0
+    r_record.is_sample_valid = 0
+    r_record.sweep_step = const.SWEEP_STEP_NONE
+
+    util.add_r_record_derived_fields(args, r_record)
+
+    # updates   shared_run_mode
+    #           r_record.interval_dropped
+    #           r_record.interval_dropped_percent
+    #           r_record.is_sample_valid
+    run_mode_manager.update(r_record, curr_time_sec)
+
+    # updates   shared_run_mode (at the end of the sweep)
+    #           r_record.sweep_step
+    if sweep_manager is not None:
+        sweep_manager.update(r_record, curr_time_sec)
+
+    if args.udp and ((sweep_manager is None) or not sweep_manager.is_controlling_rate()):
+        udp_rate_manager.update(r_record)
+
+    # the interval record is an rtt sample too
+    if rtt_sample_aggregator is not None:
+        rtt_sample_aggregator.add_sample(r_record.r_stream_id, r_record.rtt_sec)
+        rtt_sample_stats = rtt_sample_aggregator.get_interval_stats(r_record.r_stream_id)
+    else:
+        rtt_sample_stats = const.RTT_SAMPLE_STATS_NONE
+
+    (r_record.rtt_sample_count,
+     r_record.rtt_sample_min_sec,
+     r_record.rtt_sample_p50_sec,
+     r_record.rtt_sample_p99_sec,
+     r_record.rtt_sample_max_sec) = rtt_sample_stats
+
+    # server with a metrics exporter, direction down
+    if session_metrics is not None:
+        session_metrics.add_r_record(r_record)
+
+    return r_record
+
+
+def recv_c_or_f_record(args, control_conn):
+    if args.control_protocol == "binary":
+        return control_conn.recv_binary_record()
+
+    return control_conn.recv_a_c_or_e_f_block()
+
+
+# returns the record with our fields added, an e_record (EchoRecordClass) or an r_record
+# (IntervalRecordClass), whichever control protocol it came in on, see record_to_wire()
+def process_c_or_f_record(args, received_record, curr_time_sec, control_dwell_sec, run_mode_manager, udp_rate_manager, sweep_manager, rtt_sample_aggregator, session_metrics=None):
+
+    if args.control_protocol == "binary":
+        record_kind = control_record_helper.get_record_kind(received_record)
+
+        if record_kind == control_record_helper.KIND_ECHO_F:
+            e_record = control_record_helper.unpack_echo_record(received_record)
+            return process_e_record(args, e_record, curr_time_sec, control_dwell_sec, run_mode_manager, rtt_sample_aggregator)
+
+        if record_kind != control_record_helper.KIND_INTERVAL_C:
+            raise Exception("ERROR: unexpected control record kind: {}".format(record_kind))
+
+        r_record = control_record_helper.unpack_interval_record(received_record)
+
+    else:
+        received_str = received_record.decode()
+
+        if received_str.startswith(" e "):
+            e_record = util.parse_e_f_block(received_str)
+            return process_e_record(args, e_record, curr_time_sec, control_dwell_sec, run_mode_manager, rtt_sample_aggregator)
+
+        r_record = util.parse_a_c_block(received_str)
+
+    return process_r_record(args, r_record, curr_time_sec, control_dwell_sec, run_mode_manager, udp_rate_manager, sweep_manager, rtt_sample_aggregator, session_metrics)
+
+
+# a record from process_c_or_f_record() as it goes over the control connection:
+# " a ... d " or " e ... g " for the ascii control protocol, a d or g record for binary
+def record_to_wire(args, record):
+    if args.control_protocol == "binary":
+        return control_record_helper.record_to_binary(record)
+
+    if isinstance(record, EchoRecordClass):
+        return util.e_record_to_str(record)
+
+    return util.r_record_to_str(record)
+
+
+# the results ring to the client output loop holds binary records only
+# record is from process_c_or_f_record(), or as received from the server (str or bytes)
+def put_results_record(args, results_ring, record):
+    if isinstance(record, str):
+        if record.startswith(" e "):
+            record = control_record_helper.record_to_binary(util.parse_e_record(args, record))
+        else:
+            record = control_record_helper.record_to_binary(util.parse_r_record(args, record))
+
+    elif isinstance(record, (IntervalRecordClass, EchoRecordClass)):
+        record = control_record_helper.record_to_binary(record)
+
+    results_ring.put(record)
+
 
 # direction up, runs on client
 # args are client args (not server args)
 # falling off the end of this method terminates the process
-def run_recv_term_queue(readyevent, args, control_conn, results_queue, shared_run_mode, shared_udp_sending_rate_pps):
+def run_recv_term_queue(readyevent, args, control_conn, results_ring, shared_run_mode, shared_udp_sending_rate_pps, shared_tcp_pacing_rate):
     if args.verbosity:
         print("starting control receiver process: run_recv_term_queue", flush=True)
 
     run_mode_manager = RunModeManagerClass(args, shared_run_mode)
     udp_rate_manager = UdpRateManagerClass(args, shared_udp_sending_rate_pps)
+    if args.sweep:
+        sweep_manager = SweepManagerClass(args, shared_run_mode, shared_udp_sending_rate_pps, shared_tcp_pacing_rate)
+    else:
+        sweep_manager = None
+
+    if args.rtt_sample_interval is not None:
+        rtt_sample_aggregator = RttSampleAggregatorClass()
+    else:
+        rtt_sample_aggregator = None
+
+    if args.kernel_timestamps:
+        control_conn.enable_kernel_timestamps()
 
     readyevent.set()
 
@@ -27,7 +176,7 @@ def run_recv_term_queue(readyevent, args, control_conn, results_queue, shared_ru
     while True:
 
         try:
-            bytes_read = control_conn.recv_a_c_block()
+            received_record = recv_c_or_f_record(args, control_conn)
 
         except ConnectionResetError:
             if args.verbosity:
@@ -42,33 +191,20 @@ def run_recv_term_queue(readyevent, args, control_conn, results_queue, shared_ru
             break
 
         curr_time_sec = time.time()
-        curr_time_str = str(curr_time_sec)
 
-        received_str = bytes_read.decode()
+        # how long the record sat in the control socket before we read it
+        if control_conn.last_record_kernel_time_sec is not None:
+            control_dwell_sec = curr_time_sec - control_conn.last_record_kernel_time_sec
+        else:
+            control_dwell_sec = 0
 
-        # the zeroes will be updated below
-        tmp_str = received_str + curr_time_str + " 0 0 0 d "
+        new_record = process_c_or_f_record(args, received_record, curr_time_sec, control_dwell_sec,
+                                           run_mode_manager, udp_rate_manager, sweep_manager, rtt_sample_aggregator)
 
-        r_record = util.parse_r_record(args, tmp_str)
-
-        # updates   shared_run_mode
-        #           r_record["interval_dropped"]
-        #           r_record["interval_dropped_percent"]
-        #           r_record["is_sample_valid"]
-        run_mode_manager.update(r_record)
-
-        if args.udp:
-            udp_rate_manager.update(r_record)
-
-        new_str = (received_str + curr_time_str + " " +
-                    str(r_record["interval_dropped"]) + " " +
-                    str(r_record["interval_dropped_percent"]) + " " +
-                    str(r_record["is_sample_valid"]) + " d ")
-
-        results_queue.put(new_str)
+        put_results_record(args, results_ring, new_record)
 
         if args.verbosity > 3:
-            print("control receiver process: {}".format(new_str), flush=True)
+            print("control receiver process: {}".format(record_to_wire(args, new_record)), flush=True)
 
         if ((curr_time_sec - start_time_sec) > args.max_run_time_failsafe_sec):
             raise Exception("ERROR: max_run_time_failsafe_sec exceeded")
@@ -82,12 +218,25 @@ def run_recv_term_queue(readyevent, args, control_conn, results_queue, shared_ru
 # direction down, runs on server
 # args are client args (not server args)
 # falling off the end of this method terminates the process
-def run_recv_term_send(readyevent, args, control_conn, shared_run_mode, shared_udp_sending_rate_pps):
+# session_metrics is a SessionMetricsClass on a server with a metrics exporter, otherwise None
+def run_recv_term_send(readyevent, args, control_conn, shared_run_mode, shared_udp_sending_rate_pps, shared_tcp_pacing_rate, session_metrics=None):
     if args.verbosity:
         print("starting control receiver process: run_recv_term_send", flush=True)
 
     run_mode_manager = RunModeManagerClass(args, shared_run_mode)
     udp_rate_manager = UdpRateManagerClass(args, shared_udp_sending_rate_pps)
+    if args.sweep:
+        sweep_manager = SweepManagerClass(args, shared_run_mode, shared_udp_sending_rate_pps, shared_tcp_pacing_rate)
+    else:
+        sweep_manager = None
+
+    if args.rtt_sample_interval is not None:
+        rtt_sample_aggregator = RttSampleAggregatorClass()
+    else:
+        rtt_sample_aggregator = None
+
+    if args.kernel_timestamps:
+        control_conn.enable_kernel_timestamps()
 
     readyevent.set()
 
@@ -96,7 +245,7 @@ def run_recv_term_send(readyevent, args, control_conn, shared_run_mode, shared_u
     while True:
 
         try:
-            bytes_read = control_conn.recv_a_c_block()
+            received_record = recv_c_or_f_record(args, control_conn)
 
         except ConnectionResetError:
             if args.verbosity:
@@ -111,33 +260,37 @@ def run_recv_term_send(readyevent, args, control_conn, shared_run_mode, shared_u
             break
 
         curr_time_sec = time.time()
-        curr_time_str = str(curr_time_sec)
-
-        received_str = bytes_read.decode()
 
-        # the zeroes will be updated below
-        tmp_str = received_str + curr_time_str + " 0 0 0 d "
+        # how long the record sat in the control socket before we read it
+        if control_conn.last_record_kernel_time_sec is not None:
+            control_dwell_sec = curr_time_sec - control_conn.last_record_kernel_time_sec
+        else:
+            control_dwell_sec = 0
 
-        r_record = util.parse_r_record(args, tmp_str)
+        new_record = process_c_or_f_record(args, received_record, curr_time_sec, control_dwell_sec,
+                                           run_mode_manager, udp_rate_manager, sweep_manager, rtt_sample_aggregator, session_metrics)
 
-        # updates   shared_run_mode
-        #           r_record["interval_dropped"]
-        #           r_record["interval_dropped_percent"]
-        #           r_record["is_sample_valid"]
-        run_mode_manager.update(r_record)
+        if session_metrics is not None:
+            session_metrics.set_worker_cpu_time(CONTROL_RECEIVER_WORKER_IDX)
 
-        if args.udp:
-            udp_rate_manager.update(r_record)
+        new_record = record_to_wire(args, new_record)
 
-        new_str = (received_str + curr_time_str + " " +
-                    str(r_record["interval_dropped"]) + " " +
-                    str(r_record["interval_dropped_percent"]) + " " +
-                    str(r_record["is_sample_valid"]) + " d ")
-
-        control_conn.send_string(new_str)
+        try:
+            if args.control_protocol == "binary":
+                control_conn.send_bytes(new_record)
+            else:
+                control_conn.send_string(new_record)
+
+        except (BrokenPipeError, ConnectionResetError):
+            # the client closes the control connection once its data receivers are done,
+            # records still in flight at that point have nowhere to go
+            if args.verbosity:
+                print("peer disconnected (control socket)", flush=True)
+            # exit process
+            break
 
         if args.verbosity > 3:
-            print("control receiver process: {}".format(new_str), flush=True)
+            print("control receiver process: {}".format(new_record), flush=True)
 
         if ((curr_time_sec - start_time_sec) > args.max_run_time_failsafe_sec):
             raise Exception("ERROR: max_run_time_failsafe_sec exceeded")
@@ -151,7 +304,7 @@ def run_recv_term_send(readyevent, args, control_conn, shared_run_mode, shared_u
 # direction down, runs on client (passthru)
 # args are client args (not server args) -- this always runs on client
 # falling off the end of this method terminates the process
-def run_recv_queue(readyevent, args, control_conn, results_queue):
+def run_recv_queue(readyevent, args, control_conn, results_ring):
     if args.verbosity:
         print("starting control receiver process: run_recv_queue", flush=True)
 
@@ -161,7 +314,10 @@ def run_recv_queue(readyevent, args, control_conn, results_queue):
 
     while True:
         try:
-            bytes_read = control_conn.recv_a_d_block()
+            if args.control_protocol == "binary":
+                received_record = control_conn.recv_binary_record()
+            else:
+                received_record = control_conn.recv_a_d_or_e_g_block().decode()
 
         except ConnectionResetError:
             if args.verbosity:
@@ -177,13 +333,11 @@ def run_recv_queue(readyevent, args, control_conn, results_queue):
 
         curr_time_sec = time.time()
 
-        received_str = bytes_read.decode()
-
-        # passthru as is
-        results_queue.put(received_str)
+        # passthru (as is with the binary control protocol)
+        put_results_record(args, results_ring, received_record)
 
         if args.verbosity > 3:
-            print("control receiver process: {}".format(received_str), flush=True)
+            print("control receiver process: {}".format(received_record), flush=True)
 
         if ((curr_time_sec - start_time_sec) > args.max_run_time_failsafe_sec):
             raise Exception("ERROR: max_run_time_failsafe_sec exceeded")
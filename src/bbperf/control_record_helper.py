@@ -0,0 +1,298 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import struct
+
+from . import tcp_info_helper
+
+from .echo_record_class import EchoRecordClass
+from .interval_record_class import IntervalRecordClass
+
+
+# binary control protocol ("--control-protocol binary")
+#
+# the same records as the ascii protocol, but as length prefixed structs, so nothing is
+# formatted or parsed as text along the way.  every record starts with
+#
+#   record length   H   header included, in bytes
+#   record kind     B   KIND_*
+#
+# followed by the blocks of its kind, each one appended by the next process in the
+# pipeline (same as the ascii " a ... b ... c ... d " blocks):
+#
+#   KIND_INTERVAL_C   a_b, c          data receiver -> control receiver
+#   KIND_INTERVAL_D   a_b, c, d       control receiver -> output
+#   KIND_ECHO_F       e_f             data receiver -> control receiver (--rtt-sample-interval)
+#   KIND_ECHO_G       e_f, g          control receiver -> output
+
+RECORD_HEADER_STRUCT = struct.Struct('!HB')
+RECORD_HEADER_SIZE = RECORD_HEADER_STRUCT.size
+
+KIND_INTERVAL_C = 1
+KIND_INTERVAL_D = 2
+KIND_ECHO_F = 3
+KIND_ECHO_G = 4
+
+RECORD_TYPE_CAL = 0
+RECORD_TYPE_RUN = 1
+
+# record type, sent time, sender interval duration, pkts sent, bytes sent, total pkts sent,
+# sender tcp info (see tcp_info_helper)
+A_B_STRUCT = struct.Struct('!BddQQQIIIIIIQQQ')
+# receiver interval duration, pkts received, bytes received, total pkts received, stream id, receiver dwell
+C_STRUCT = struct.Struct('!dQQQHd')
+# received time, dropped, dropped percent, is sample valid, sweep step, control dwell,
+# rtt sample count, min, p50, p99, max
+D_STRUCT = struct.Struct('!dqdBhdIdddd')
+# record type, sent time, stream id, receiver dwell
+E_F_STRUCT = struct.Struct('!BdHd')
+# received time, control dwell, is sample valid
+G_STRUCT = struct.Struct('!ddB')
+
+INTERVAL_C_SIZE = RECORD_HEADER_SIZE + A_B_STRUCT.size + C_STRUCT.size
+INTERVAL_D_SIZE = INTERVAL_C_SIZE + D_STRUCT.size
+ECHO_F_SIZE = RECORD_HEADER_SIZE + E_F_STRUCT.size
+ECHO_G_SIZE = ECHO_F_SIZE + G_STRUCT.size
+
+MAX_RECORD_SIZE = max(INTERVAL_D_SIZE, ECHO_G_SIZE)
+
+
+def record_type_to_int(record_type):
+    return RECORD_TYPE_RUN if record_type in [ "run", b"run" ] else RECORD_TYPE_CAL
+
+
+def record_type_to_str(record_type):
+    return "run" if record_type == RECORD_TYPE_RUN else "cal"
+
+
+def get_record_kind(record):
+    return record[2]
+
+
+# a_b_fields is (record type, sent time, sender interval duration, pkts sent, bytes sent, total pkts sent,
+# followed by the sender tcp info fields)
+def pack_interval_c_record(a_b_fields, receiver_interval_duration_sec, interval_pkts_received,
+                           interval_bytes_received, total_pkts_received, stream_id, receiver_dwell_sec):
+
+    record = bytearray(INTERVAL_C_SIZE)
+
+    RECORD_HEADER_STRUCT.pack_into(record, 0, INTERVAL_C_SIZE, KIND_INTERVAL_C)
+    A_B_STRUCT.pack_into(record, RECORD_HEADER_SIZE, *a_b_fields)
+    C_STRUCT.pack_into(record, RECORD_HEADER_SIZE + A_B_STRUCT.size,
+        receiver_interval_duration_sec,
+        interval_pkts_received,
+        interval_bytes_received,
+        total_pkts_received,
+        stream_id,
+        receiver_dwell_sec)
+
+    return record
+
+
+# returns the raw fields of an interval record (c or d) in a new r_record
+def unpack_interval_record(record):
+    r_record = IntervalRecordClass()
+
+    offset = RECORD_HEADER_SIZE
+
+    (record_type,
+     r_record.r_pkt_sent_time_sec,
+     r_record.r_sender_interval_duration_sec,
+     r_record.r_sender_interval_pkts_sent,
+     r_record.r_sender_interval_bytes_sent,
+     r_record.r_sender_total_pkts_sent,
+     # tcp_info_helper.TCP_INFO_FIELD_LIST order
+     r_record.r_sender_tcp_srtt_us,
+     r_record.r_sender_tcp_rttvar_us,
+     r_record.r_sender_tcp_min_rtt_us,
+     r_record.r_sender_tcp_snd_cwnd,
+     r_record.r_sender_tcp_lost,
+     r_record.r_sender_tcp_notsent_bytes,
+     r_record.r_sender_tcp_delivery_rate,
+     r_record.r_sender_tcp_pacing_rate,
+     r_record.r_sender_tcp_bytes_retrans) = A_B_STRUCT.unpack_from(record, offset)
+
+    r_record.r_record_type = record_type_to_str(record_type)
+
+    offset += A_B_STRUCT.size
+
+    (r_record.r_receiver_interval_duration_sec,
+     r_record.r_receiver_interval_pkts_received,
+     r_record.r_receiver_interval_bytes_received,
+     r_record.r_receiver_total_pkts_received,
+     r_record.r_stream_id,
+     r_record.r_receiver_dwell_sec) = C_STRUCT.unpack_from(record, offset)
+
+    if get_record_kind(record) != KIND_INTERVAL_D:
+        return r_record
+
+    offset += C_STRUCT.size
+
+    (r_record.r_pkt_received_time_sec,
+     r_record.interval_dropped,
+     r_record.interval_dropped_percent,
+     r_record.is_sample_valid,
+     r_record.sweep_step,
+     r_record.control_dwell_sec,
+     r_record.rtt_sample_count,
+     r_record.rtt_sample_min_sec,
+     r_record.rtt_sample_p50_sec,
+     r_record.rtt_sample_p99_sec,
+     r_record.rtt_sample_max_sec) = D_STRUCT.unpack_from(record, offset)
+
+    return r_record
+
+
+# the c record as received, with the d block of r_record appended
+def pack_interval_d_record(c_record, r_record):
+    record = bytearray(INTERVAL_D_SIZE)
+
+    record[ 0 : INTERVAL_C_SIZE ] = c_record
+    RECORD_HEADER_STRUCT.pack_into(record, 0, INTERVAL_D_SIZE, KIND_INTERVAL_D)
+    D_STRUCT.pack_into(record, INTERVAL_C_SIZE,
+        r_record.r_pkt_received_time_sec,
+        r_record.interval_dropped,
+        r_record.interval_dropped_percent,
+        r_record.is_sample_valid,
+        r_record.sweep_step,
+        r_record.control_dwell_sec,
+        r_record.rtt_sample_count,
+        r_record.rtt_sample_min_sec,
+        r_record.rtt_sample_p50_sec,
+        r_record.rtt_sample_p99_sec,
+        r_record.rtt_sample_max_sec)
+
+    return record
+
+
+# a whole d record from the fields of an r_record, e.g. one parsed from the ascii protocol
+def r_record_to_interval_d_record(r_record):
+    record = bytearray(INTERVAL_D_SIZE)
+
+    RECORD_HEADER_STRUCT.pack_into(record, 0, INTERVAL_D_SIZE, KIND_INTERVAL_D)
+    A_B_STRUCT.pack_into(record, RECORD_HEADER_SIZE,
+        record_type_to_int(r_record.r_record_type),
+        r_record.r_pkt_sent_time_sec,
+        r_record.r_sender_interval_duration_sec,
+        r_record.r_sender_interval_pkts_sent,
+        r_record.r_sender_interval_bytes_sent,
+        r_record.r_sender_total_pkts_sent,
+        r_record.r_sender_tcp_srtt_us,
+        r_record.r_sender_tcp_rttvar_us,
+        r_record.r_sender_tcp_min_rtt_us,
+        r_record.r_sender_tcp_snd_cwnd,
+        r_record.r_sender_tcp_lost,
+        r_record.r_sender_tcp_notsent_bytes,
+        r_record.r_sender_tcp_delivery_rate,
+        r_record.r_sender_tcp_pacing_rate,
+        r_record.r_sender_tcp_bytes_retrans)
+    C_STRUCT.pack_into(record, RECORD_HEADER_SIZE + A_B_STRUCT.size,
+        r_record.r_receiver_interval_duration_sec,
+        r_record.r_receiver_interval_pkts_received,
+        r_record.r_receiver_interval_bytes_received,
+        r_record.r_receiver_total_pkts_received,
+        r_record.r_stream_id,
+        r_record.r_receiver_dwell_sec)
+    D_STRUCT.pack_into(record, INTERVAL_C_SIZE,
+        r_record.r_pkt_received_time_sec,
+        r_record.interval_dropped,
+        r_record.interval_dropped_percent,
+        r_record.is_sample_valid,
+        r_record.sweep_step,
+        r_record.control_dwell_sec,
+        r_record.rtt_sample_count,
+        r_record.rtt_sample_min_sec,
+        r_record.rtt_sample_p50_sec,
+        r_record.rtt_sample_p99_sec,
+        r_record.rtt_sample_max_sec)
+
+    return record
+
+
+def pack_echo_f_record(record_type, sent_time_sec, stream_id, receiver_dwell_sec):
+    record = bytearray(ECHO_F_SIZE)
+
+    RECORD_HEADER_STRUCT.pack_into(record, 0, ECHO_F_SIZE, KIND_ECHO_F)
+    E_F_STRUCT.pack_into(record, RECORD_HEADER_SIZE, record_type, sent_time_sec, stream_id, receiver_dwell_sec)
+
+    return record
+
+
+# returns the raw fields of an echo record (f or g) in a new e_record
+def unpack_echo_record(record):
+    e_record = EchoRecordClass()
+
+    (record_type,
+     e_record.r_pkt_sent_time_sec,
+     e_record.r_stream_id,
+     e_record.r_receiver_dwell_sec) = E_F_STRUCT.unpack_from(record, RECORD_HEADER_SIZE)
+
+    e_record.r_record_type = record_type_to_str(record_type)
+
+    if get_record_kind(record) != KIND_ECHO_G:
+        return e_record
+
+    (e_record.r_pkt_received_time_sec,
+     e_record.control_dwell_sec,
+     e_record.is_sample_valid) = G_STRUCT.unpack_from(record, ECHO_F_SIZE)
+
+    return e_record
+
+
+def pack_echo_g_record(f_record, e_record):
+    record = bytearray(ECHO_G_SIZE)
+
+    record[ 0 : ECHO_F_SIZE ] = f_record
+    RECORD_HEADER_STRUCT.pack_into(record, 0, ECHO_G_SIZE, KIND_ECHO_G)
+    G_STRUCT.pack_into(record, ECHO_F_SIZE,
+        e_record.r_pkt_received_time_sec,
+        e_record.control_dwell_sec,
+        e_record.is_sample_valid)
+
+    return record
+
+
+# same for an e_record
+def e_record_to_echo_g_record(e_record):
+    f_record = pack_echo_f_record(
+        record_type_to_int(e_record.r_record_type),
+        e_record.r_pkt_sent_time_sec,
+        e_record.r_stream_id,
+        e_record.r_receiver_dwell_sec)
+
+    return pack_echo_g_record(f_record, e_record)
+
+
+# an e_record or r_record with all of its raw fields, as a g or d record
+def record_to_binary(record):
+    if isinstance(record, EchoRecordClass):
+        return e_record_to_echo_g_record(record)
+
+    return r_record_to_interval_d_record(record)
+
+
+# the a_b fields for pack_interval_c_record(), from the ascii " a ... b " block of a data header
+def a_b_block_to_fields(a_b_block):
+    words = a_b_block.split()
+
+    return (record_type_to_int(words[1]),
+            float(words[2]),
+            float(words[3]),
+            int(words[4]),
+            int(words[5]),
+            int(words[6]),
+            *(int(word) for word in words[ 7 : 7 + len(tcp_info_helper.TCP_INFO_FIELD_LIST) ]))
+
+
+# same, from a binary data header (see binary_header_helper)
+def binary_header_to_a_b_fields(header):
+    _, _, record_type, _, sent_time_ns, interval_time_ns, interval_send_count, interval_bytes_sent, total_send_counter = header[ : 9 ]
+
+    # binary_header_helper uses the same record type values
+    return (record_type,
+            sent_time_ns / 1000000000,
+            interval_time_ns / 1000000000,
+            interval_send_count,
+            interval_bytes_sent,
+            total_send_counter,
+            *header[ 9 : ])
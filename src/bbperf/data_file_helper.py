@@ -0,0 +1,150 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import operator
+
+import numpy
+
+from . import tcp_info_helper
+from . import control_record_helper
+
+from .echo_record_class import EchoRecordClass
+from .interval_record_class import IntervalRecordClass
+
+# the schemas of the raw and graph data files with --data-file-format npy (see
+# npy_writer_class), one field per word of the text forms, same names
+#
+# raw data file: every record off the control connection.  the fields are the raw fields
+# of util.parse_r_record() (r_record_type as control_record_helper.RECORD_TYPE_*), plus
+# is_echo.  rtt echoes (util.parse_e_record()) are in the same array, with is_echo set and
+# zeros in the fields they do not have.
+
+RAW_DATA_FIELD_LIST = [
+    ("is_echo",                             "u1"),
+    ("r_record_type",                       "u1"),
+    ("r_pkt_sent_time_sec",                 "f8"),
+    ("r_sender_interval_duration_sec",      "f8"),
+    ("r_sender_interval_pkts_sent",         "u8"),
+    ("r_sender_interval_bytes_sent",        "u8"),
+    ("r_sender_total_pkts_sent",            "u8") ] + [
+    ("r_sender_tcp_" + name,                "u8") for name in tcp_info_helper.TCP_INFO_FIELD_LIST ] + [
+    ("r_receiver_interval_duration_sec",    "f8"),
+    ("r_receiver_interval_pkts_received",   "u8"),
+    ("r_receiver_interval_bytes_received",  "u8"),
+    ("r_receiver_total_pkts_received",      "u8"),
+    ("r_stream_id",                         "u2"),
+    ("r_receiver_dwell_sec",                "f8"),
+    ("r_pkt_received_time_sec",             "f8"),
+    ("interval_dropped",                    "i8"),
+    ("interval_dropped_percent",            "f8"),
+    ("is_sample_valid",                     "u1"),
+    ("sweep_step",                          "i2"),
+    ("control_dwell_sec",                   "f8"),
+    ("rtt_sample_count",                    "u4"),
+    ("rtt_sample_min_sec",                  "f8"),
+    ("rtt_sample_p50_sec",                  "f8"),
+    ("rtt_sample_p99_sec",                  "f8"),
+    ("rtt_sample_max_sec",                  "f8") ]
+
+RAW_DATA_DTYPE = numpy.dtype([ (name, "<" + t) for name, t in RAW_DATA_FIELD_LIST ])
+
+# the fields after is_echo and r_record_type, taken from the record as they are
+RAW_DATA_VALUE_NAME_LIST = [ name for name, _ in RAW_DATA_FIELD_LIST[2:] ]
+
+get_raw_data_values = operator.attrgetter(*RAW_DATA_VALUE_NAME_LIST)
+
+# the ones an e_record has
+ECHO_RAW_DATA_VALUE_NAME_SET = set(RAW_DATA_VALUE_NAME_LIST) & set(EchoRecordClass.__slots__)
+
+# graph data file: the "run" interval records, as plotted by udp-graph.gp and tcp-graph.gp
+
+GRAPH_DATA_FIELD_LIST = [
+    ("sent_epoch",              "f8"),
+    ("sent_time",               "f8"),
+    ("recv_time",               "f8"),
+    ("sender_pps",              "i8"),
+    ("sender_Mbps",             "f8"),
+    ("receiver_pps",            "i8"),
+    ("receiver_Mbps",           "f8"),
+    ("unloaded_rtt_ms",         "f8"),
+    ("rtt_ms",                  "f8"),
+    ("BDP_bytes",               "i8"),
+    ("buffered_bytes",          "i8"),
+    ("bloat_factor",            "f8"),
+    ("pkts_dropped",            "i8"),
+    ("pkts_dropped_percent",    "f8"),
+    ("stream_id",               "u2"),
+    ("sweep_step",              "i2") ]
+
+# tcp only, after the fields above
+GRAPH_DATA_TCP_FIELD_LIST = [
+    ("tcp_srtt_ms",             "f8"),
+    ("tcp_rttvar_ms",           "f8"),
+    ("tcp_min_rtt_ms",          "f8"),
+    ("tcp_snd_cwnd",            "u8"),
+    ("tcp_lost",                "u8"),
+    ("tcp_notsent_bytes",       "u8"),
+    ("tcp_delivery_Mbps",       "f8"),
+    ("tcp_pacing_Mbps",         "f8"),
+    ("tcp_bytes_retrans",       "u8") ]
+
+
+def get_graph_data_field_list(args):
+    if args.udp:
+        return GRAPH_DATA_FIELD_LIST
+
+    return GRAPH_DATA_FIELD_LIST + GRAPH_DATA_TCP_FIELD_LIST
+
+
+def get_graph_data_dtype(args):
+    return numpy.dtype([ (name, "<" + t) for name, t in get_graph_data_field_list(args) ])
+
+
+# the header line of the text graph data file
+def get_graph_data_header(args):
+    return " ".join(name for name, _ in get_graph_data_field_list(args))
+
+
+# the format of a line of the text graph data file, .format of it takes a graph row
+def get_graph_data_line_format(args):
+    return " ".join([ "{}" ] * len(get_graph_data_field_list(args))).format
+
+
+# r_record or e_record (util) to a raw data file row
+def record_to_raw_row(record, is_echo):
+    if is_echo:
+        return ((1, control_record_helper.record_type_to_int(record.r_record_type)) +
+                tuple(getattr(record, name, 0) for name in RAW_DATA_VALUE_NAME_LIST))
+
+    # an r_record has them all
+    return ((0, control_record_helper.record_type_to_int(record.r_record_type)) +
+            get_raw_data_values(record))
+
+
+# a raw data file row back to an r_record or e_record, raw fields only (r_record_type as "cal" or "run")
+def raw_row_to_record(row):
+    if row[0]:
+        record = EchoRecordClass()
+        name_value_list = [ (name, value) for name, value in zip(RAW_DATA_VALUE_NAME_LIST, row[2:])
+                            if name in ECHO_RAW_DATA_VALUE_NAME_SET ]
+    else:
+        record = IntervalRecordClass()
+        name_value_list = zip(RAW_DATA_VALUE_NAME_LIST, row[2:])
+
+    record.r_record_type = control_record_helper.record_type_to_str(row[1])
+
+    for name, value in name_value_list:
+        setattr(record, name, value)
+
+    return record
+
+
+# gnuplot reads text, this writes the text form of a .npy graph data file
+def write_graph_data_text_file(npy_filename, text_filename):
+    graph_data = numpy.load(npy_filename, mmap_mode="r")
+
+    with open(text_filename, "w") as f:
+        f.write(" ".join(graph_data.dtype.names) + "\n")
+
+        for row in graph_data.tolist():
+            f.write(" ".join(str(x) for x in row) + "\n")
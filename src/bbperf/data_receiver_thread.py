@@ -7,17 +7,90 @@ import socket
 from . import const
 from . import util
 
+from . import binary_header_helper
+from . import timestamp_helper
+from . import control_record_helper
+
+from .udp_batch_receiver_class import UdpBatchReceiverClass
+from .session_metrics_class import get_stream_worker_idx
+from .binary_frame_parser_class import BinaryFrameParserClass
+
+# returns the most recent binary data header, or None if there is not one in what we just read
+def get_binary_header(args, bytes_read, frame_parser):
+    if not args.udp:
+        # most recent header seen by the parser, which may have arrived in an earlier recv
+        return frame_parser.last_header
+
+    if binary_header_helper.is_binary_header(bytes_read):
+        return binary_header_helper.unpack_header(bytes_read)
+
+    return None
+
+
+# returns the " a ... b " block of the most recent data header, or None if there is not one
+# in what we just read
+def get_a_b_block(args, bytes_read, frame_parser):
+    a_b_block = None
+
+    if args.data_header == "binary":
+        header = get_binary_header(args, bytes_read, frame_parser)
+
+        if header is not None:
+            a_b_block = binary_header_helper.header_to_a_b_block(header)
+
+    elif bytes_read is not None:
+        # copy free recv hands us a memoryview, which cannot be searched
+        bytes_read = bytes(bytes_read)
+
+        idx_of_a = bytes_read.find(b' a ')
+        if idx_of_a > -1:
+            idx_of_b = bytes_read.find(b' b ', idx_of_a)
+            if idx_of_b > -1:
+                a_b_block = bytes_read[ idx_of_a : idx_of_b + 3 ]
+
+    return a_b_block
+
+
+# same as get_a_b_block(), but the fields of the block for the binary control protocol
+def get_a_b_fields(args, bytes_read, frame_parser):
+    if args.data_header == "binary":
+        header = get_binary_header(args, bytes_read, frame_parser)
+
+        if header is None:
+            return None
+
+        return control_record_helper.binary_header_to_a_b_fields(header)
+
+    a_b_block = get_a_b_block(args, bytes_read, frame_parser)
+
+    if a_b_block is None:
+        return None
+
+    return control_record_helper.a_b_block_to_fields(a_b_block)
+
+
+# how long the data we are reporting on sat in our socket buffer and in this process,
+# which is taken out of the rtt on the other end (--kernel-timestamps)
+def get_receiver_dwell_sec(data_kernel_time_sec):
+    if data_kernel_time_sec is None:
+        return 0
+
+    return time.time() - data_kernel_time_sec
+
+
 # args are client args
-def run(readyevent, args, control_conn, data_sock, peer_addr):
+# with parallel streams, every data receiver sends its interval records over the same
+# control connection, so sends are serialized with control_send_lock, and the last
+# receiver to exit closes the control connection
+# session_metrics is a SessionMetricsClass on a server with a metrics exporter, otherwise None
+def run(readyevent, args, control_conn, data_sock, peer_addr, stream_id, control_send_lock, shared_num_receivers_running, session_metrics=None):
 
     if args.verbosity:
         print("starting data receiver process", flush=True)
 
-    # do not block for very long on the below recv calls as we want to do these thing even
-    # if the flow of data packets has stopped:
-    # 1. to send our interval stats on the intervals
-    # 2. to exit the process when the "end of run" timer expires
-    data_sock.settimeout(0.01)
+    # interval records and rtt echoes are only sent when data arrives, so there is nothing
+    # to do until then, block until data arrives (or the peer has been silent for too long)
+    data_sock.settimeout(const.SOCKET_TIMEOUT_SEC)
 
     total_recv_calls = 0
 
@@ -29,11 +102,38 @@ def run(readyevent, args, control_conn, data_sock, peer_addr):
     interval_pkts_received = 0
     interval_bytes_received = 0
 
-    socket_timeout_timer_active = False
-    socket_timeout_timer_start_time = None
-
     readyevent.set()
 
+    if args.udp:
+        udp_batch_receiver = UdpBatchReceiverClass(args, data_sock, peer_addr)
+
+    elif args.copy_free_recv:
+        # reused for every recv, nothing is allocated per call
+        recv_buffer = bytearray(const.BUFSZ)
+        recv_view = memoryview(recv_buffer)
+
+    # time the kernel received the data we are reading, with --kernel-timestamps
+    data_kernel_time_sec = None
+    if args.kernel_timestamps and not args.udp:
+        timestamp_helper.enable_rx_timestamps(data_sock)
+
+    binary_control = (args.control_protocol == "binary")
+
+    binary_header = (args.data_header == "binary")
+    if binary_header and not args.udp:
+        frame_parser = BinaryFrameParserClass()
+    else:
+        frame_parser = None
+
+    # rtt echoes in between interval records, with --rtt-sample-interval
+    if args.rtt_sample_interval is not None:
+        rtt_sample_interval_sec = args.rtt_sample_interval / 1000.0
+        next_rtt_sample_time = start_time_sec + rtt_sample_interval_sec
+    else:
+        next_rtt_sample_time = None
+
+    curr_time_sec = start_time_sec
+
     # do until end of test duration
     # we will not get a connection close with udp
     while True:
@@ -41,55 +141,117 @@ def run(readyevent, args, control_conn, data_sock, peer_addr):
 
         try:
             if args.udp:
-                # recv with short timeout
-                bytes_read, pkt_from_addr = data_sock.recvfrom(const.BUFSZ)
+                num_pkts_read, num_bytes_read, bytes_read, stop_received = udp_batch_receiver.recv()
 
-                # validate peer address
-                # only accept packets from our client
+                if stop_received:
+                    if args.verbosity:
+                        print("data receiver thread: received udp stop message, exiting", flush=True)
+                    break
 
-                if pkt_from_addr != peer_addr:
-                    # ignore this datagram
+                if num_pkts_read == 0:
+                    # nothing from our peer
                     continue
 
+                data_kernel_time_sec = udp_batch_receiver.last_pkt_kernel_time_sec
+
             else:
                 # tcp
-                # recv with short timeout
-                bytes_read = data_sock.recv(const.BUFSZ)
+                is_rtt_sample_due = (next_rtt_sample_time is not None) and (curr_time_sec > next_rtt_sample_time)
+
+                if args.kernel_timestamps:
+                    # same as below, but with recvmsg so we get the timestamp
+                    if not args.copy_free_recv:
+                        bytes_read, ancdata, _, _ = data_sock.recvmsg(const.BUFSZ, timestamp_helper.RX_TIMESTAMP_CMSG_SPACE)
+                        num_bytes_read = len(bytes_read)
+
+                    elif binary_header or (curr_time_sec > interval_end_time) or is_rtt_sample_due:
+                        num_bytes_read, ancdata, _, _ = data_sock.recvmsg_into([recv_view], timestamp_helper.RX_TIMESTAMP_CMSG_SPACE)
+                        bytes_read = recv_view[ 0 : num_bytes_read ]
+
+                    else:
+                        num_bytes_read, ancdata, _, _ = data_sock.recvmsg_into([recv_view], timestamp_helper.RX_TIMESTAMP_CMSG_SPACE, socket.MSG_TRUNC)
+                        bytes_read = None
+
+                    data_kernel_time_sec = timestamp_helper.get_rx_timestamp_sec(ancdata)
+
+                elif not args.copy_free_recv:
+                    bytes_read = data_sock.recv(const.BUFSZ)
+                    num_bytes_read = len(bytes_read)
+
+                elif binary_header or (curr_time_sec > interval_end_time) or is_rtt_sample_due:
+                    # we need a header to end this interval (or for an rtt echo), so copy this time
+                    # (with binary framing every byte has to go through the frame parser,
+                    # so nothing can be discarded in the kernel)
+                    num_bytes_read = data_sock.recv_into(recv_view)
+                    bytes_read = recv_view[ 0 : num_bytes_read ]
+
+                else:
+                    # mid-interval, throw the bytes away in the kernel
+                    num_bytes_read = data_sock.recv_into(recv_view, len(recv_buffer), socket.MSG_TRUNC)
+                    bytes_read = None
+
+                num_pkts_read = 1
+
+                if num_bytes_read == 0:
+                    # peer has disconnected
+                    if args.verbosity:
+                        print("peer disconnected (data socket)", flush=True)
+                    # exit process
+                    break
+
+                if binary_header:
+                    frame_parser.feed(bytes_read, data_kernel_time_sec)
+                    # the header we report on may have arrived in an earlier recv
+                    data_kernel_time_sec = frame_parser.last_header_rx_time_sec
 
-            num_bytes_read = len(bytes_read)
+        except socket.timeout:
+            raise Exception("FATAL: data_receiver_thread: timeout during data socket read")
 
-            if num_bytes_read == 0:
-                # (tcp only) peer has disconnected
-                if args.verbosity:
-                    print("peer disconnected (data socket)", flush=True)
-                # exit process
-                break
+        curr_time_sec = time.time()
 
-            socket_timeout_timer_active = False
+        total_recv_calls += num_pkts_read
+
+        interval_pkts_received += num_pkts_read         # valid for udp only
+        interval_bytes_received += num_bytes_read
+
+        # rtt echo, in between interval records (the interval record is a sample itself)
+        if (next_rtt_sample_time is not None) and (curr_time_sec > next_rtt_sample_time) and (curr_time_sec <= interval_end_time):
+
+            if binary_control:
+                a_b_fields = get_a_b_fields(args, bytes_read, frame_parser)
+
+                if a_b_fields is not None:
+                    with control_send_lock:
+                        control_conn.send_bytes(control_record_helper.pack_echo_f_record(
+                            a_b_fields[0],
+                            a_b_fields[1],
+                            stream_id,
+                            get_receiver_dwell_sec(data_kernel_time_sec)))
+
+                    next_rtt_sample_time = curr_time_sec + rtt_sample_interval_sec
 
-        except socket.timeout:
-            if socket_timeout_timer_active:
-                if (time.time() - socket_timeout_timer_start_time) > const.SOCKET_TIMEOUT_SEC:
-                    raise Exception("FATAL: data_receiver_thread: timeout during data socket read")
             else:
-                socket_timeout_timer_active = True
-                socket_timeout_timer_start_time = time.time()
+                a_b_block = get_a_b_block(args, bytes_read, frame_parser)
 
-        if args.udp and num_bytes_read == len(const.UDP_STOP_MSG) and (bytes_read.decode() == const.UDP_STOP_MSG):
-            if args.verbosity:
-                print("data receiver thread: received udp stop message, exiting", flush=True)
-            break
+                if a_b_block is not None:
+                    # " e <record type> <sent time> <stream id> <receiver dwell> f "
+                    a_b_words = a_b_block.split()
 
-        if num_bytes_read == 0:
-            # recv must have timed out, skip the rest of this loop
-            continue
+                    ba = bytearray(b' e ')
+                    ba.extend(a_b_words[1])
+                    ba.extend(b' ')
+                    ba.extend(a_b_words[2])
+                    ba.extend(b' ')
+                    ba.extend(str(stream_id).encode())
+                    ba.extend(b' ')
 
-        curr_time_sec = time.time()
+                    with control_send_lock:
+                        ba.extend(str(get_receiver_dwell_sec(data_kernel_time_sec)).encode())
+                        ba.extend(b' f ')
 
-        total_recv_calls += 1
+                        control_conn.send_bytes(ba)
 
-        interval_pkts_received += 1                     # valid for udp only
-        interval_bytes_received += num_bytes_read
+                    next_rtt_sample_time = curr_time_sec + rtt_sample_interval_sec
 
         # end of interval
         # send interval record over control connection
@@ -98,32 +260,56 @@ def run(readyevent, args, control_conn, data_sock, peer_addr):
 
             # find the packet send time in the user payload
 
-            a_b_block = None
+            if binary_control:
+                a_b_fields = get_a_b_fields(args, bytes_read, frame_parser)
 
-            idx_of_a = bytes_read.find(b' a ')
-            if idx_of_a > -1:
-                idx_of_b = bytes_read.find(b' b ', idx_of_a)
-                if idx_of_b > -1:
-                    a_b_block = bytes_read[ idx_of_a : idx_of_b + 3 ]
+                if a_b_fields is None:
+                    # skip sending for this packet, but stay "in" sample interval
+                    continue
 
-            if a_b_block is None:
-                # skip sending for this packet, but stay "in" sample interval
-                continue
+                # sending info back to client on control connection
 
-            # sending info back to client on control connection
+                with control_send_lock:
+                    control_conn.send_bytes(control_record_helper.pack_interval_c_record(
+                        a_b_fields,
+                        interval_time_sec,
+                        interval_pkts_received,
+                        interval_bytes_received,
+                        total_recv_calls,           # num of pkts received, valid for udp only
+                        stream_id,
+                        get_receiver_dwell_sec(data_kernel_time_sec)))
 
-            ba = bytearray()
-            ba.extend(a_b_block)
-            ba.extend(str(interval_time_sec).encode())
-            ba.extend(b' ')
-            ba.extend(str(interval_pkts_received).encode())
-            ba.extend(b' ')
-            ba.extend(str(interval_bytes_received).encode())
-            ba.extend(b' ')
-            ba.extend(str(total_recv_calls).encode())       # num of pkts received, valid for udp only
-            ba.extend(b' c ')
+            else:
+                a_b_block = get_a_b_block(args, bytes_read, frame_parser)
+
+                if a_b_block is None:
+                    # skip sending for this packet, but stay "in" sample interval
+                    continue
 
-            control_conn.send_bytes(ba)
+                # sending info back to client on control connection
+
+                ba = bytearray()
+                ba.extend(a_b_block)
+                ba.extend(str(interval_time_sec).encode())
+                ba.extend(b' ')
+                ba.extend(str(interval_pkts_received).encode())
+                ba.extend(b' ')
+                ba.extend(str(interval_bytes_received).encode())
+                ba.extend(b' ')
+                ba.extend(str(total_recv_calls).encode())       # num of pkts received, valid for udp only
+                ba.extend(b' ')
+                ba.extend(str(stream_id).encode())
+                ba.extend(b' ')
+
+                with control_send_lock:
+                    ba.extend(str(get_receiver_dwell_sec(data_kernel_time_sec)).encode())
+                    ba.extend(b' c ')
+
+                    control_conn.send_bytes(ba)
+
+            if session_metrics is not None:
+                session_metrics.add_stream_interval(stream_id, interval_bytes_received, interval_pkts_received, interval_time_sec)
+                session_metrics.set_worker_cpu_time(get_stream_worker_idx(stream_id))
 
             interval_bytes_received = 0
             interval_pkts_received = 0
@@ -137,7 +323,13 @@ def run(readyevent, args, control_conn, data_sock, peer_addr):
 
     # peer disconnected (or an error)
     util.done_with_socket(data_sock)
-    control_conn.close()
+
+    with shared_num_receivers_running.get_lock():
+        shared_num_receivers_running.value -= 1
+        is_last_receiver = (shared_num_receivers_running.value == 0)
+
+    if is_last_receiver:
+        control_conn.close()
 
     if args.verbosity:
         print("exiting data receiver process", flush=True)
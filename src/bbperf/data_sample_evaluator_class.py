@@ -19,12 +19,17 @@ class DataSampleEvaluatorClass:
             else:
                 self.max_ramp_time = const.DATA_SAMPLE_IGNORE_TIME_TCP_MAX_SEC
 
+        # per stream, in mbps
+        self.tcp_target_rate = None
+        if self.args.tcp_target_rate is not None:
+            self.tcp_target_rate = self.args.tcp_target_rate / self.args.parallel
+
         if self.args.verbosity:
             print("max_ramp_time is {}".format(self.max_ramp_time), flush=True)
 
 
     # once a sample is valid then all subsequent samples are valid
-    def is_sample_valid(self, run_mode_running_start_time, dropped_this_interval_percent, curr_time):
+    def is_sample_valid(self, run_mode_running_start_time, dropped_this_interval_percent, receiver_interval_rate_mbps, curr_time):
         if self.valid_flag:
             return True
 
@@ -38,6 +43,13 @@ class DataSampleEvaluatorClass:
                 self.valid_flag = True
                 return True
 
+        # paced tcp -- the flow never saturates the path, so it is done ramping once it gets
+        # close to the rate it was asked for
+        if self.tcp_target_rate is not None:
+            if receiver_interval_rate_mbps >= (self.tcp_target_rate * const.DATA_SAMPLE_TCP_TARGET_RATE_VALID_FRACTION):
+                self.valid_flag = True
+                return True
+
         if curr_time > (run_mode_running_start_time + self.max_ramp_time):
             self.valid_flag = True
             return True
@@ -8,17 +8,60 @@ import select
 from . import util
 from . import const
 from . import udp_helper
+from . import binary_header_helper
+from . import pacing_helper
+from . import tcp_info_helper
 
+from .udp_batch_sender_class import UdpBatchSenderClass
+from .udp_pacer_class import UdpPacerClass
+from .session_metrics_class import get_stream_worker_idx
 
+# session_metrics is a SessionMetricsClass on a server with a metrics exporter, otherwise None
 # falling off the end of this method terminates the process
-def run(args, data_sock, peer_addr, shared_run_mode, shared_udp_sending_rate_pps):
+def run(args, data_sock, peer_addr, shared_run_mode, shared_udp_sending_rate_pps, shared_tcp_pacing_rate, sender_stats_queue=None,
+        session_metrics=None, stream_id=0):
     if args.verbosity:
         print("data sender: start of process", flush=True)
 
+    kernel_pacing = False
+
+    # tcp pacing set by the sweep manager
+    tcp_pacing_rate = 0.0
+
     # udp autorate
     if args.udp:
         udp_pps = shared_udp_sending_rate_pps.value
-        udp_batch_size = util.convert_udp_pps_to_batch_size(udp_pps)
+        udp_batch_sender = UdpBatchSenderClass(args, data_sock, peer_addr)
+
+        udp_pacing = args.udp_pacing
+        if udp_pacing == "kernel" and not pacing_helper.is_fq_on_route(peer_addr):
+            print("WARNING: fq qdisc not found on the route to {}, falling back to udp pacing precise".format(peer_addr[0]), flush=True)
+            udp_pacing = "precise"
+
+        udp_pacer = None
+
+        if udp_pacing == "kernel":
+            kernel_pacing = True
+            # fq spaces the datagrams out, so send as many at once as the burst limit allows
+            udp_batch_size = args.udp_max_burst
+            udp_kernel_pacing_pps = udp_pps
+            pacing_helper.set_max_pacing_rate(data_sock, util.convert_udp_pps_to_kernel_pacing_rate(udp_pps))
+        elif udp_pacing == "precise":
+            udp_pacer = UdpPacerClass(args)
+            udp_batch_size = udp_pacer.get_batch_size(udp_pps)
+        else:
+            udp_batch_size = util.convert_udp_pps_to_batch_size(udp_pps)
+
+        if args.verbosity:
+            print("data sender: udp pacing {}".format(udp_pacing), flush=True)
+
+    binary_header = (args.data_header == "binary")
+    if binary_header:
+        frame_buffer_1k = binary_header_helper.create_frame_buffer(const.PAYLOAD_1K)
+        frame_view_1k = memoryview(frame_buffer_1k)
+        frame_buffer_4k = binary_header_helper.create_frame_buffer(const.PAYLOAD_4K)
+        frame_view_4k = memoryview(frame_buffer_4k)
+        tcp_pending_view = None
 
     # start sending
 
@@ -42,6 +85,10 @@ def run(args, data_sock, peer_addr, shared_run_mode, shared_udp_sending_rate_pps
     total_send_counter = 1
     num_negative_delay = 0
 
+    # sampled at the end of every interval, tcp only
+    tcp_info = tcp_info_helper.TCP_INFO_NONE
+    tcp_info_bytes = tcp_info_helper.tcp_info_to_bytes(tcp_info)
+
     while True:
         curr_time_sec = time.time()
 
@@ -56,24 +103,50 @@ def run(args, data_sock, peer_addr, shared_run_mode, shared_udp_sending_rate_pps
         else:
             is_calibrated = True
 
-        record_type = b'run' if is_calibrated else b'cal'
+        if binary_header:
+            if tcp_pending_view is None:
+                # patch the header of a preallocated frame in place
+                if args.udp or not is_calibrated:
+                    ba = frame_buffer_1k
+                    send_view = frame_view_1k
+                else:
+                    ba = frame_buffer_4k
+                    send_view = frame_view_4k
+
+                binary_header_helper.pack_header_into(ba,
+                    is_calibrated,
+                    time.time_ns(),
+                    int(interval_time_sec * 1000000000),
+                    interval_send_count,
+                    interval_bytes_sent,
+                    total_send_counter,
+                    tcp_info)
+            else:
+                # finish the frame that was partially sent, or the receiver loses framing
+                send_view = tcp_pending_view
+
+        else:
+            record_type = b'run' if is_calibrated else b'cal'
 
-        # we want to be fast here, since this is data write loop, so use ba.extend
+            # we want to be fast here, since this is data write loop, so use ba.extend
 
-        ba = bytearray(b' a ' +
-                        record_type + b' ' +
-                        str(curr_time_sec).encode() + b' ' +
-                        str(interval_time_sec).encode() + b' ' +
-                        str(interval_send_count).encode() + b' ' +
-                        str(interval_bytes_sent).encode() + b' ' +
-                        str(total_send_counter).encode() + b' b ')
+            ba = bytearray(b' a ' +
+                            record_type + b' ' +
+                            str(curr_time_sec).encode() + b' ' +
+                            str(interval_time_sec).encode() + b' ' +
+                            str(interval_send_count).encode() + b' ' +
+                            str(interval_bytes_sent).encode() + b' ' +
+                            str(total_send_counter).encode() + b' ' +
+                            tcp_info_bytes + b' b ')
 
-        if args.udp:
-            ba.extend(const.PAYLOAD_1K)
-        elif is_calibrated:
-            ba.extend(const.PAYLOAD_4K)
-        else:
-            ba.extend(const.PAYLOAD_1K)
+            if args.udp:
+                ba.extend(const.PAYLOAD_1K)
+            elif is_calibrated:
+                ba.extend(const.PAYLOAD_4K)
+            else:
+                ba.extend(const.PAYLOAD_1K)
+
+            send_view = ba
 
         # send an entire batch
 
@@ -89,7 +162,7 @@ def run(args, data_sock, peer_addr, shared_run_mode, shared_udp_sending_rate_pps
                 # we want to block here, as blocked time should "count"
 
                 if args.udp:
-                    num_bytes_sent = data_sock.sendto(ba, peer_addr)
+                    num_pkts_sent, num_bytes_sent = udp_batch_sender.send(ba, batch_size - batch_counter)
                 else:
                     # tcp
                     # we use select to take advantage of tcp_notsent_lowat
@@ -97,14 +170,21 @@ def run(args, data_sock, peer_addr, shared_run_mode, shared_udp_sending_rate_pps
                     doing_select = True
                     _, _, _ = select.select( [], [data_sock], [], 0.001)
                     doing_select = False
-                    num_bytes_sent = data_sock.send(ba)
+                    num_bytes_sent = data_sock.send(send_view)
+                    num_pkts_sent = 1
+
+                    if binary_header:
+                        if num_bytes_sent < len(send_view):
+                            tcp_pending_view = send_view[ num_bytes_sent : ]
+                        else:
+                            tcp_pending_view = None
 
                 if num_bytes_sent <= 0:
                     raise Exception("ERROR: data_sender_thread.run(): send failed")
 
-                batch_counter += 1
-                total_send_counter += 1
-                accum_send_count += 1
+                batch_counter += num_pkts_sent
+                total_send_counter += num_pkts_sent
+                accum_send_count += num_pkts_sent
                 accum_bytes_sent += num_bytes_sent
 
         except ConnectionResetError:
@@ -143,10 +223,28 @@ def run(args, data_sock, peer_addr, shared_run_mode, shared_udp_sending_rate_pps
             accum_send_count = 0
             accum_bytes_sent = 0
 
+            if not args.udp:
+                tcp_info = tcp_info_helper.get_tcp_info(data_sock)
+                tcp_info_bytes = tcp_info_helper.tcp_info_to_bytes(tcp_info)
+
+            if session_metrics is not None:
+                session_metrics.set_worker_cpu_time(get_stream_worker_idx(stream_id))
+
             # update udp autorate
             if args.udp:
                 udp_pps = shared_udp_sending_rate_pps.value
-                udp_batch_size = util.convert_udp_pps_to_batch_size(udp_pps)
+                if udp_pacer is not None:
+                    udp_batch_size = udp_pacer.get_batch_size(udp_pps)
+                elif kernel_pacing:
+                    if udp_pps != udp_kernel_pacing_pps:
+                        udp_kernel_pacing_pps = udp_pps
+                        pacing_helper.set_max_pacing_rate(data_sock, util.convert_udp_pps_to_kernel_pacing_rate(udp_pps))
+                else:
+                    udp_batch_size = util.convert_udp_pps_to_batch_size(udp_pps)
+
+            elif shared_tcp_pacing_rate.value != tcp_pacing_rate:
+                tcp_pacing_rate = shared_tcp_pacing_rate.value
+                pacing_helper.set_max_pacing_rate(data_sock, tcp_pacing_rate)
 
         # send very slowly at first to establish unloaded latency
         if not is_calibrated:
@@ -155,6 +253,8 @@ def run(args, data_sock, peer_addr, shared_run_mode, shared_udp_sending_rate_pps
                 # initialize udp batch start here in case next loop is batch processing
                 current_udp_batch_start_time = time.time()
                 current_udp_batch_start_total_send_counter = total_send_counter
+                if udp_pacer is not None:
+                    udp_pacer.reset()
             continue
 
         # normal end of test
@@ -165,7 +265,15 @@ def run(args, data_sock, peer_addr, shared_run_mode, shared_udp_sending_rate_pps
             raise Exception("ERROR: max_run_time_failsafe_sec exceeded")
 
         # pause between udp batches if necessary
-        if args.udp:
+        # (with kernel pacing, fq holds the datagrams back and our sends block once the socket send buffer is full)
+        if not args.udp or kernel_pacing:
+            continue
+
+        if udp_pacer is not None:
+            udp_pacer.pace(total_send_counter - current_udp_batch_start_total_send_counter, shared_udp_sending_rate_pps.value)
+            current_udp_batch_start_total_send_counter = total_send_counter
+
+        else:
             this_batch_pkts_sent = total_send_counter - current_udp_batch_start_total_send_counter
 
             this_batch_actual_time_sec = curr_time_sec - current_udp_batch_start_time
@@ -195,5 +303,13 @@ def run(args, data_sock, peer_addr, shared_run_mode, shared_udp_sending_rate_pps
 
     util.done_with_socket(data_sock)
 
+    if args.udp and udp_pacer is not None:
+        udp_pacing_stats = udp_pacer.get_stats()
+        if sender_stats_queue is not None:
+            # the client adds these to the json output
+            sender_stats_queue.put(udp_pacing_stats)
+        elif not args.quiet:
+            print("data sender: udp pacing stats: {}".format(udp_pacing_stats), flush=True)
+
     if args.verbosity:
         print("data sender: end of process", flush=True)
@@ -0,0 +1,24 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+# an rtt echo record (e_record), with --rtt-sample-interval, see IntervalRecordClass
+#
+# made by util.parse_e_record() (ascii control protocol) and
+# control_record_helper.unpack_echo_record() (binary), then util.add_e_record_derived_fields()
+class EchoRecordClass:
+
+    __slots__ = (
+        # " e ... f " block, from the data receiver
+        "r_record_type",
+        "r_pkt_sent_time_sec",
+        "r_stream_id",
+        "r_receiver_dwell_sec",
+
+        # " f ... g " block, from the control receiver
+        "r_pkt_received_time_sec",
+        "control_dwell_sec",
+        "is_sample_valid",
+
+        # derived, see util.add_e_record_derived_fields()
+        "rtt_sec",
+        "rtt_ms" )
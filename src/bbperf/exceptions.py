@@ -3,3 +3,10 @@
 
 class PeerDisconnectedException(Exception):
     pass
+
+
+class ServerBusyException(Exception):
+
+    def __init__(self, retry_after_sec):
+        super().__init__("server busy, retry after {} seconds".format(retry_after_sec))
+        self.retry_after_sec = retry_after_sec
@@ -36,6 +36,33 @@ def create_graph(args, datafile1, pngfilename):
         print("stderr: {}".format(result.stderr), flush=True)
 
 
+# latency vs load curve for --sweep
+def create_sweep_graph(args, datafile1, pngfilename):
+
+    if args.graph_file:
+        filename_in_title = args.graph_file
+    else:
+        filename_in_title = pngfilename
+
+    this_script_dir = os.path.dirname(os.path.abspath(__file__))
+
+    gp_file = this_script_dir + "/sweep-graph.gp"
+    graph_title = "bbperf {} sweep {}".format("UDP" if args.udp else "TCP", filename_in_title)
+
+    gnuplot_script_list = ["gnuplot",
+          "-e", f"datafile1='{datafile1}'",
+          "-e", f"graphtitle='{graph_title}'",
+          "-e", f"load '{gp_file}'"]
+
+    result = subprocess.run(gnuplot_script_list, capture_output=True)
+
+    if args.verbosity or (result.returncode != 0):
+        print(" ".join(gnuplot_script_list), flush=True)
+        print("returncode: {}".format(result.returncode), flush=True)
+        print("stdout: {}".format(result.stdout), flush=True)
+        print("stderr: {}".format(result.stderr), flush=True)
+
+
 if __name__ == '__main__':
     datafile1 = "/tmp/bbperf-tcp-data-aa97m9xl"
 
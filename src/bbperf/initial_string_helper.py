@@ -0,0 +1,60 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import uuid
+
+# every connection to the server port starts with its initial string, "control <run_id>"
+# or "data <run_id>", and so does every udp flow.  both server engines (see
+# session_dispatcher_class and async_server) read them with this.
+
+# "control " + uuid of 36 characters
+LEN_CONTROL_INITIAL_STRING = 8 + 36
+# "data " + uuid of 36 characters
+LEN_DATA_INITIAL_STRING = 5 + 36
+# enough to tell them apart
+LEN_INITIAL_STRING_PREFIX = 5
+
+CONTROL_PREFIX = b'contr'
+DATA_PREFIX = b'data '
+
+
+# the length of the whole initial string, from its first LEN_INITIAL_STRING_PREFIX bytes,
+# or None if it is neither
+def get_initial_string_len(prefix_bytes):
+    if prefix_bytes == CONTROL_PREFIX:
+        return LEN_CONTROL_INITIAL_STRING
+
+    if prefix_bytes == DATA_PREFIX:
+        return LEN_DATA_INITIAL_STRING
+
+    return None
+
+
+def is_control_initial_string(initial_bytes):
+    return initial_bytes[ 0 : LEN_INITIAL_STRING_PREFIX ] == CONTROL_PREFIX
+
+
+# returns the run_id of a whole initial string
+def get_run_id(initial_bytes):
+    if is_control_initial_string(initial_bytes):
+        return initial_bytes[ 8 : ].decode(errors="replace")
+
+    return initial_bytes[ 5 : ].decode(errors="replace")
+
+
+# the run_id ends up in log lines and metrics labels, so only a uuid in its usual form
+# (what the client sends) is accepted
+def is_valid_run_id(run_id):
+    try:
+        return str(uuid.UUID(run_id)) == run_id
+    except ValueError:
+        return False
+
+
+# udp, returns the run_id of a data initial string, or None if the datagram is not one
+# (e.g. a data packet of a flow whose session has not connected its socket yet)
+def get_udp_run_id(payload_bytes):
+    if (len(payload_bytes) != LEN_DATA_INITIAL_STRING) or (not payload_bytes.startswith(DATA_PREFIX)):
+        return None
+
+    return get_run_id(payload_bytes)
@@ -0,0 +1,70 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+# an interval record (r_record), one per stream every SAMPLE_INTERVAL_SEC, through the control
+# receiver and the output.  the fields are attributes, r_record.rtt_ms, slots rather than a
+# dict, so a record is small and quick to make.
+#
+# made by util.parse_r_record() (ascii control protocol) and
+# control_record_helper.unpack_interval_record() (binary), which fill in the raw fields, then
+# util.add_r_record_derived_fields().  a field that has not been set raises AttributeError.
+class IntervalRecordClass:
+
+    __slots__ = (
+        # " a ... b " block, from the data sender
+        "r_record_type",                        # "cal" or "run"
+        "r_pkt_sent_time_sec",
+        "r_sender_interval_duration_sec",
+        "r_sender_interval_pkts_sent",          # valid for udp only
+        "r_sender_interval_bytes_sent",
+        "r_sender_total_pkts_sent",             # valid for udp only
+        # tcp only, tcp_info_helper.TCP_INFO_FIELD_LIST
+        "r_sender_tcp_srtt_us",
+        "r_sender_tcp_rttvar_us",
+        "r_sender_tcp_min_rtt_us",
+        "r_sender_tcp_snd_cwnd",
+        "r_sender_tcp_lost",
+        "r_sender_tcp_notsent_bytes",
+        "r_sender_tcp_delivery_rate",
+        "r_sender_tcp_pacing_rate",
+        "r_sender_tcp_bytes_retrans",
+
+        # " b ... c " block, from the data receiver
+        "r_receiver_interval_duration_sec",
+        "r_receiver_interval_pkts_received",    # valid for udp only
+        "r_receiver_interval_bytes_received",
+        "r_receiver_total_pkts_received",       # valid for udp only
+        "r_stream_id",
+        "r_receiver_dwell_sec",                 # with --kernel-timestamps only
+
+        # " c ... d " block, from the control receiver
+        "r_pkt_received_time_sec",
+        "interval_dropped",
+        "interval_dropped_percent",
+        "is_sample_valid",
+        "sweep_step",
+        "control_dwell_sec",                    # with --kernel-timestamps only
+        "rtt_sample_count",                     # with --rtt-sample-interval only
+        "rtt_sample_min_sec",
+        "rtt_sample_p50_sec",
+        "rtt_sample_p99_sec",
+        "rtt_sample_max_sec",
+
+        # derived, see util.add_r_record_derived_fields()
+        "userspace_rtt_sec",
+        "rtt_sec",
+        "rtt_ms",
+        "userspace_rtt_ms",
+        "sender_interval_rate_mbps",
+        "receiver_interval_rate_bytes_per_sec",
+        "receiver_interval_rate_mbps",
+        "buffered_bytes",
+        "sender_pps",
+        "receiver_pps",
+        "total_dropped",
+        # tcp only
+        "tcp_srtt_ms",
+        "tcp_rttvar_ms",
+        "tcp_min_rtt_ms",
+        "tcp_delivery_rate_mbps",
+        "tcp_pacing_rate_mbps" )
@@ -3,15 +3,53 @@
 
 import sys
 import json
-import numpy
 
+from . import const
+
+from .quantile_sketch_class import QuantileSketchClass
+from .summary_stats_class import SummaryStatsClass, add_column_stats, add_percentiles
+
+# tcp, percentiles of these entry fields (without the "tcp_" in front) go into the summary
+TCP_INFO_KEY_LIST = [ "srtt_ms", "rttvar_ms", "snd_cwnd", "lost", "notsent_bytes", "delivery_rate_mbps", "pacing_rate_mbps" ]
+
+# the summary is updated as every entry is added (see SummaryStatsClass and
+# QuantileSketchClass), so memory does not grow with the length of the test.  the entries
+# themselves are only kept for the json file, and not even then with --json-summary-only.
+#
+# every statistic gets percentiles, mean, stddev, min and max.  the json file also gets the
+# cdf of the summary statistics, as "cdf" next to "summary".
 class JsonOutputClass:
 
     def __init__(self, args):
         self.args = args
         self.output_dict = {}
-        self.output_dict["entries"] = []
+        self.keep_entries = bool(self.args.json_file) and not self.args.json_summary_only
+        if self.keep_entries:
+            self.output_dict["entries"] = []
         self.unloaded_rtt_ms = None
+        self.udp_pacing_stats_list = []
+
+        # valid entries
+        self.summary_stats = SummaryStatsClass(args, args.parallel)
+
+        # sweep step -> SummaryStatsClass, all entries of the step
+        self.step_stats_dict = {}
+
+        # --kernel-timestamps
+        # userspace_rtt_ms, kernel_timestamp_rtt_correction_ms
+        self.kernel_timestamps_sketch = QuantileSketchClass(2)
+
+        # --rtt-sample-interval, valid rtt echoes and valid entries
+        self.sampled_rtt_ms_sketch = QuantileSketchClass()
+
+        # tcp
+        # one column per key
+        self.tcp_info_sketch = QuantileSketchClass(len(TCP_INFO_KEY_LIST))
+        self.loaded_rtt_above_srtt_ms_sketch = QuantileSketchClass()
+        self.tcp_min_rtt_ms = None
+        # stream id -> bytes_retrans of its first and latest valid entries
+        self.first_bytes_retrans = {}
+        self.last_bytes_retrans = {}
 
         if self.args.json_file:
             self.json_output_file = open(self.args.json_file, 'w')
@@ -19,25 +57,59 @@ class JsonOutputClass:
     def set_unloaded_rtt_ms(self, rtt_ms):
         self.unloaded_rtt_ms = rtt_ms
 
+    # one per data sender, only with --udp-pacing precise
+    def add_udp_pacing_stats(self, udp_pacing_stats):
+        self.udp_pacing_stats_list.append(udp_pacing_stats)
+
+    def add_rtt_sample(self, rtt_ms):
+        self.sampled_rtt_ms_sketch.add(rtt_ms)
+
     def add_entry(self, entry):
-        self.output_dict["entries"].append(entry)
+        if self.keep_entries:
+            self.output_dict["entries"].append(entry)
+
+        # --sweep, the same stats as for the whole test, for each step
+        if entry["sweep_step"] != const.SWEEP_STEP_NONE:
+            if entry["sweep_step"] not in self.step_stats_dict:
+                self.step_stats_dict[entry["sweep_step"]] = SummaryStatsClass(self.args, self.args.parallel)
+            self.step_stats_dict[entry["sweep_step"]].add_entry(entry)
+
+        if not entry["is_sample_valid"]:
+            return
+
+        self.summary_stats.add_entry(entry)
+
+        if not self.args.udp:
+            self.add_tcp_info_entry(entry)
+
+        # --kernel-timestamps, loaded_rtt_ms is the kernel corrected rtt, this is what it would
+        # have been without the correction, and by how much the correction changed it (the
+        # latency added by bbperf itself)
+        if self.args.kernel_timestamps:
+            self.kernel_timestamps_sketch.add([ entry["userspace_rtt_ms"], entry["userspace_rtt_ms"] - entry["loaded_rtt_ms"] ])
+
+        # --rtt-sample-interval, percentiles over every rtt sample (the echoes and the interval
+        # records) rather than one per interval
+        if self.args.rtt_sample_interval is not None:
+            self.sampled_rtt_ms_sketch.add(entry["loaded_rtt_ms"])
+
+    # tcp, the kernel view of the sending data sockets, percentiles over the records of all
+    # streams.  loaded rtt above srtt is latency added above the tcp layer, mostly time in
+    # the socket buffers on both ends (see --tcp-notsent-lowat)
+    def add_tcp_info_entry(self, entry):
+        self.tcp_info_sketch.add([ entry["tcp_" + key] for key in TCP_INFO_KEY_LIST ])
+
+        if (self.tcp_min_rtt_ms is None) or (entry["tcp_min_rtt_ms"] < self.tcp_min_rtt_ms):
+            self.tcp_min_rtt_ms = entry["tcp_min_rtt_ms"]
+
+        self.loaded_rtt_above_srtt_ms_sketch.add(entry["loaded_rtt_ms"] - entry["tcp_srtt_ms"])
+
+        # bytes_retrans counts from the start of the connection, this is over the entries
+        self.first_bytes_retrans.setdefault(entry["stream_id"], entry["tcp_bytes_retrans"])
+        self.last_bytes_retrans[entry["stream_id"]] = entry["tcp_bytes_retrans"]
 
     def create_aggregate_stats(self):
-        loaded_rtt_ms_list = []
-        receiver_throughput_rate_mbps_list = []
-        excess_buffered_bytes_list = []
-        receiver_pps_list = []
-        pkt_loss_percent_list = []
-
-        for entry in self.output_dict["entries"]:
-            if entry["is_sample_valid"]:
-                loaded_rtt_ms_list.append(entry["loaded_rtt_ms"])
-                receiver_throughput_rate_mbps_list.append(entry["receiver_throughput_rate_mbps"])
-                excess_buffered_bytes_list.append(entry["excess_buffered_bytes"])
-                receiver_pps_list.append(entry["receiver_pps"])
-                pkt_loss_percent_list.append(entry["pkt_loss_percent"])
-
-        num_samples = len(loaded_rtt_ms_list)
+        num_samples = self.summary_stats.get_num_samples()
         if num_samples < 10:
             print("ERROR: not enough valid samples for summary statistics: {} samples".format(num_samples),
                   file=sys.stderr,
@@ -50,45 +122,66 @@ class JsonOutputClass:
 
         summary_dict["unloaded_rtt_ms"] = self.unloaded_rtt_ms
 
-        p1, p10, p50, p90, p99 = numpy.percentile(loaded_rtt_ms_list, [1, 10, 50, 90, 99])
-        summary_dict["loaded_rtt_ms"] = {}
-        summary_dict["loaded_rtt_ms"]["p1"]  = p1
-        summary_dict["loaded_rtt_ms"]["p10"] = p10
-        summary_dict["loaded_rtt_ms"]["p50"] = p50
-        summary_dict["loaded_rtt_ms"]["p90"] = p90
-        summary_dict["loaded_rtt_ms"]["p99"] = p99
-
-        p1, p10, p50, p90, p99 = numpy.percentile(receiver_throughput_rate_mbps_list, [1, 10, 50, 90, 99])
-        summary_dict["receiver_throughput_rate_mbps"] = {}
-        summary_dict["receiver_throughput_rate_mbps"]["p1"]  = p1
-        summary_dict["receiver_throughput_rate_mbps"]["p10"] = p10
-        summary_dict["receiver_throughput_rate_mbps"]["p50"] = p50
-        summary_dict["receiver_throughput_rate_mbps"]["p90"] = p90
-        summary_dict["receiver_throughput_rate_mbps"]["p99"] = p99
-
-        p1, p10, p50, p90, p99 = numpy.percentile(excess_buffered_bytes_list, [1, 10, 50, 90, 99])
-        summary_dict["excess_buffered_bytes"] = {}
-        summary_dict["excess_buffered_bytes"]["p1"]  = p1
-        summary_dict["excess_buffered_bytes"]["p10"] = p10
-        summary_dict["excess_buffered_bytes"]["p50"] = p50
-        summary_dict["excess_buffered_bytes"]["p90"] = p90
-        summary_dict["excess_buffered_bytes"]["p99"] = p99
-
-        p1, p10, p50, p90, p99 = numpy.percentile(receiver_pps_list, [1, 10, 50, 90, 99])
-        summary_dict["receiver_pps"] = {}
-        summary_dict["receiver_pps"]["p1"]  = p1
-        summary_dict["receiver_pps"]["p10"] = p10
-        summary_dict["receiver_pps"]["p50"] = p50
-        summary_dict["receiver_pps"]["p90"] = p90
-        summary_dict["receiver_pps"]["p99"] = p99
-
-        p1, p10, p50, p90, p99 = numpy.percentile(pkt_loss_percent_list, [1, 10, 50, 90, 99])
-        summary_dict["pkt_loss_percent"] = {}
-        summary_dict["pkt_loss_percent"]["p1"]  = p1
-        summary_dict["pkt_loss_percent"]["p10"] = p10
-        summary_dict["pkt_loss_percent"]["p50"] = p50
-        summary_dict["pkt_loss_percent"]["p90"] = p90
-        summary_dict["pkt_loss_percent"]["p99"] = p99
+        if self.args.tcp_target_rate is not None:
+            summary_dict["tcp_target_rate_mbps"] = self.args.tcp_target_rate
+
+        if len(self.udp_pacing_stats_list) > 0:
+            summary_dict["udp_pacing"] = self.udp_pacing_stats_list
+
+        self.summary_stats.add_stats_to(summary_dict)
+
+        if not self.args.udp:
+            self.add_tcp_info_stats(summary_dict)
+
+        if self.args.kernel_timestamps:
+            add_column_stats(summary_dict, [ "userspace_rtt_ms", "kernel_timestamp_rtt_correction_ms" ], self.kernel_timestamps_sketch, self.args.summary_percent_list)
+
+        if self.args.rtt_sample_interval is not None:
+            summary_dict["num_rtt_samples"] = self.sampled_rtt_ms_sketch.get_count()
+            add_percentiles(summary_dict, "sampled_rtt_ms", self.sampled_rtt_ms_sketch, self.args.summary_percent_list)
+
+        if self.args.sweep:
+            self.add_sweep_stats(summary_dict)
+
+        self.output_dict["cdf"] = self.summary_stats.get_cdf()
+
+    def add_tcp_info_stats(self, summary_dict):
+        tcp_info_dict = summary_dict["tcp_info"] = {}
+
+        add_column_stats(tcp_info_dict, TCP_INFO_KEY_LIST, self.tcp_info_sketch, self.args.summary_percent_list)
+
+        tcp_info_dict["min_rtt_ms"] = self.tcp_min_rtt_ms
+
+        add_percentiles(tcp_info_dict, "loaded_rtt_above_srtt_ms", self.loaded_rtt_above_srtt_ms_sketch, self.args.summary_percent_list)
+
+        tcp_info_dict["bytes_retrans"] = sum(self.last_bytes_retrans[s] - self.first_bytes_retrans[s] for s in self.last_bytes_retrans)
+
+    def add_sweep_stats(self, summary_dict):
+        steps_list = summary_dict["sweep"] = []
+
+        for step_idx, load_percent in enumerate(self.args.sweep_load_percent_list):
+            step_stats = self.step_stats_dict.get(step_idx)
+
+            step_dict = {}
+            step_dict["step"] = step_idx
+            step_dict["offered_load_percent"] = load_percent
+            step_dict["num_samples"] = step_stats.get_num_samples() if step_stats is not None else 0
+
+            steps_list.append(step_dict)
+
+            if step_stats is None:
+                continue
+
+            step_dict["sender_throughput_rate_mbps"] = step_stats.get_sum_of_stream_means("sender_throughput_rate_mbps")
+            step_dict["goodput_mbps"] = step_stats.get_sum_of_stream_means("receiver_throughput_rate_mbps")
+
+            step_stats.add_stats_to(step_dict)
+
+    def get_sweep_steps(self):
+        if "summary" not in self.output_dict:
+            return []
+
+        return self.output_dict["summary"].get("sweep", [])
 
     def write_output(self):
         self.create_aggregate_stats()
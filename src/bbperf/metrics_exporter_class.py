@@ -0,0 +1,278 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import os
+import time
+import types
+import socket
+import selectors
+import resource
+
+from . import const
+
+# server metrics in the prometheus text format, see session_dispatcher_class
+#
+#   --metrics-port       served over http, to whoever connects to the port
+#   --metrics-textfile   written every METRICS_TEXTFILE_INTERVAL_SEC, atomically, for the
+#                        node exporter textfile collector
+#
+# runs in the dispatcher process, so rendering and serving the metrics never run in a
+# process that is part of a test.  live numbers come from the SessionMetricsClass of each
+# running test, the dispatcher folds them into the totals here when a test ends.
+#
+# http connections are non-blocking and on the dispatcher's selector, like its pending
+# connections, so a slow scraper never holds up the dispatcher.
+
+# total time a scraper has, from connect to the end of the response, before we close it
+METRICS_HTTP_TIMEOUT_SEC = 5
+MAX_HTTP_REQUEST_LEN = 8192
+# further connections are closed right away
+MAX_HTTP_CONNECTIONS = 8
+
+DIRECTION_LIST = [ "up", "down" ]
+
+
+def get_direction(client_args):
+    return "down" if client_args.reverse else "up"
+
+
+def get_cpu_sec(rusage):
+    return rusage.ru_utime + rusage.ru_stime
+
+
+# prometheus text format label value
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class MetricsExporterClass:
+
+    # selector is the dispatcher's
+    def __init__(self, args, selector):
+        self.args = args
+        self.selector = selector
+
+        self.tests_completed = 0
+        self.tests_failed = 0
+        self.tests_rejected = 0
+
+        # of the tests that have ended, by direction
+        self.bytes_received_dict = { direction: 0 for direction in DIRECTION_LIST }
+        self.pkts_received_dict = { direction: 0 for direction in DIRECTION_LIST }
+
+        self.last_textfile_write_time = 0
+
+        # sock -> SimpleNamespace(request_bytes, response_bytes, accept_time)
+        self.http_conn_dict = {}
+
+        if args.metrics_port is not None:
+            self.listen_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.listen_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+            metrics_addr = (args.metrics_bind, args.metrics_port)
+            print("binding metrics http socket to local address {}".format(metrics_addr), flush=True)
+            self.listen_sock.bind(metrics_addr)
+            self.listen_sock.listen(8)
+            self.listen_sock.setblocking(False)
+
+            self.selector.register(self.listen_sock, selectors.EVENT_READ, ("metrics", None))
+        else:
+            self.listen_sock = None
+
+
+    def test_rejected(self):
+        self.tests_rejected += 1
+
+
+    # session is the dispatcher's SimpleNamespace, with client_args and metrics
+    def test_ended(self, session, is_failed):
+        if is_failed:
+            self.tests_failed += 1
+        else:
+            self.tests_completed += 1
+
+        direction = get_direction(session.client_args)
+
+        self.bytes_received_dict[direction] += session.metrics.get_bytes_received()
+        self.pkts_received_dict[direction] += session.metrics.get_pkts_received()
+
+
+    # session_dict is run_id -> SimpleNamespace(client_args, client_control_addr, metrics, ...)
+    def render(self, session_dict, queue_length):
+        lines = []
+
+        def add_metric(name, metric_type, help_str, sample_list):
+            lines.append("# HELP {} {}".format(name, help_str))
+            lines.append("# TYPE {} {}".format(name, metric_type))
+            for labels, value in sample_list:
+                if labels:
+                    label_str = ",".join("{}=\"{}\"".format(k, escape_label_value(v)) for k, v in labels)
+                    lines.append("{}{{{}}} {}".format(name, label_str, value))
+                else:
+                    lines.append("{} {}".format(name, value))
+
+        bytes_received_dict = dict(self.bytes_received_dict)
+        pkts_received_dict = dict(self.pkts_received_dict)
+
+        # tests that have ended, and their workers, are in the rusage of our children
+        cpu_sec = get_cpu_sec(resource.getrusage(resource.RUSAGE_CHILDREN))
+
+        session_label_list = []
+
+        for run_id, session in session_dict.items():
+            direction = get_direction(session.client_args)
+
+            bytes_received_dict[direction] += session.metrics.get_bytes_received()
+            pkts_received_dict[direction] += session.metrics.get_pkts_received()
+            cpu_sec += session.metrics.get_cpu_sec()
+
+            session_label_list.append(((("run_id", run_id),
+                                        ("client", session.client_control_addr[0]),
+                                        ("protocol", "udp" if session.client_args.udp else "tcp"),
+                                        ("direction", direction)),
+                                       session.metrics))
+
+        add_metric("bbperf_sessions_active", "gauge", "Tests running now.",
+                   [ ((), len(session_dict)) ])
+        add_metric("bbperf_sessions_queued", "gauge", "Clients waiting for their test to start.",
+                   [ ((), queue_length) ])
+        add_metric("bbperf_tests_completed_total", "counter", "Tests that ended normally.",
+                   [ ((), self.tests_completed) ])
+        add_metric("bbperf_tests_failed_total", "counter", "Tests that ended with an error.",
+                   [ ((), self.tests_failed) ])
+        add_metric("bbperf_tests_rejected_total", "counter", "Clients told that the server is busy.",
+                   [ ((), self.tests_rejected) ])
+        add_metric("bbperf_received_bytes_total", "counter", "Bytes received by the data receivers, by test direction.",
+                   [ ((("direction", d),), bytes_received_dict[d]) for d in DIRECTION_LIST ])
+        add_metric("bbperf_received_packets_total", "counter", "Packets (udp) or receive calls (tcp) of the data receivers, by test direction.",
+                   [ ((("direction", d),), pkts_received_dict[d]) for d in DIRECTION_LIST ])
+        add_metric("bbperf_worker_cpu_seconds_total", "counter", "CPU time of the test processes.",
+                   [ ((), cpu_sec) ])
+        add_metric("bbperf_session_goodput_bits_per_second", "gauge", "Receive rate of the running test, latest interval, all streams.",
+                   [ (labels, metrics.get_goodput_bps()) for labels, metrics in session_label_list ])
+        # the server only sees the rtt of tests in the down direction
+        add_metric("bbperf_session_rtt_seconds", "gauge", "RTT of the running test, latest interval (down tests only).",
+                   [ (labels, metrics.get_rtt_sec()) for labels, metrics in session_label_list if metrics.get_rtt_sec() > 0 ])
+
+        return "\n".join(lines) + "\n"
+
+
+    # the metrics listen socket is readable
+    def accept_http_connection(self):
+        try:
+            http_sock, _ = self.listen_sock.accept()
+        except BlockingIOError:
+            return
+
+        if len(self.http_conn_dict) >= MAX_HTTP_CONNECTIONS:
+            http_sock.close()
+            return
+
+        http_sock.setblocking(False)
+
+        self.http_conn_dict[http_sock] = types.SimpleNamespace(request_bytes=b'', response_bytes=None, accept_time=time.time())
+        self.selector.register(http_sock, selectors.EVENT_READ, ("metrics http", http_sock))
+
+
+    def drop_http_connection(self, http_sock):
+        self.selector.unregister(http_sock)
+        del self.http_conn_dict[http_sock]
+        http_sock.close()
+
+
+    def drop_stale_http_connections(self):
+        curr_time = time.time()
+
+        for http_sock, http_conn in list(self.http_conn_dict.items()):
+            if (curr_time - http_conn.accept_time) > METRICS_HTTP_TIMEOUT_SEC:
+                self.drop_http_connection(http_sock)
+
+
+    def get_http_sock_list(self):
+        return list(self.http_conn_dict.keys())
+
+
+    # an http connection is readable (still reading the request) or writable (sending the response)
+    def serve_http(self, http_sock, session_dict, queue_length):
+        http_conn = self.http_conn_dict[http_sock]
+
+        try:
+            if http_conn.response_bytes is None:
+                self.recv_http_request(http_sock, http_conn, session_dict, queue_length)
+            else:
+                self.send_http_response(http_sock, http_conn)
+
+        except BlockingIOError:
+            pass
+
+        except OSError:
+            self.drop_http_connection(http_sock)
+
+
+    def recv_http_request(self, http_sock, http_conn, session_dict, queue_length):
+        received_bytes = http_sock.recv(MAX_HTTP_REQUEST_LEN)
+
+        if len(received_bytes) == 0:
+            self.drop_http_connection(http_sock)
+            return
+
+        http_conn.request_bytes += received_bytes
+
+        if b'\r\n\r\n' not in http_conn.request_bytes:
+            if len(http_conn.request_bytes) > MAX_HTTP_REQUEST_LEN:
+                self.drop_http_connection(http_sock)
+            return
+
+        w = http_conn.request_bytes.split(b' ')
+
+        if (len(w) > 1) and (w[0] == b'GET') and (w[1] in [ b'/', b'/metrics' ]):
+            status = "200 OK"
+            body = self.render(session_dict, queue_length)
+        else:
+            status = "404 Not Found"
+            body = "not found\n"
+
+        body_bytes = body.encode()
+
+        http_conn.response_bytes = ("HTTP/1.0 {}\r\n"
+                                    "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                                    "Content-Length: {}\r\n"
+                                    "Connection: close\r\n"
+                                    "\r\n").format(status, len(body_bytes)).encode() + body_bytes
+
+        self.selector.modify(http_sock, selectors.EVENT_WRITE, ("metrics http", http_sock))
+
+        self.send_http_response(http_sock, http_conn)
+
+
+    def send_http_response(self, http_sock, http_conn):
+        num_bytes_sent = http_sock.send(http_conn.response_bytes)
+
+        http_conn.response_bytes = http_conn.response_bytes[ num_bytes_sent : ]
+
+        if len(http_conn.response_bytes) == 0:
+            self.drop_http_connection(http_sock)
+
+
+    # called from the dispatcher loop
+    def write_textfile_if_due(self, session_dict, queue_length):
+        if self.args.metrics_textfile is None:
+            return
+
+        curr_time = time.time()
+
+        if (curr_time - self.last_textfile_write_time) < const.METRICS_TEXTFILE_INTERVAL_SEC:
+            return
+
+        self.last_textfile_write_time = curr_time
+
+        # the collector never sees a partly written file
+        tmp_path = self.args.metrics_textfile + ".tmp"
+
+        try:
+            with open(tmp_path, "w") as f:
+                f.write(self.render(session_dict, queue_length))
+            os.replace(tmp_path, self.args.metrics_textfile)
+
+        except OSError as e:
+            print("ERROR: unable to write metrics textfile {}: {}".format(self.args.metrics_textfile, e), flush=True)
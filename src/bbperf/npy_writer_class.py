@@ -0,0 +1,95 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import numpy
+
+from . import const
+
+# writes a 1-d numpy structured array to an open file, one record at a time, in the .npy
+# format (numpy.lib.format, version 1.0), so it loads without parsing:
+#
+#   numpy.load(filename, mmap_mode="r")
+#
+# the header, which has the dtype (the field names and types, i.e. the schema), goes first,
+# followed by the records, NPY_WRITER_CHUNK_RECORDS at a time.  the number of records is not
+# known until close(), so the header is written with room for any number of them and is
+# rewritten in place with the real number at close().  until then the file reads as empty.
+
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+
+# header length is a little endian u16
+NPY_HEADER_LEN_SIZE = 2
+
+# the header, including the magic and its length, is padded to a multiple of this
+NPY_HEADER_ALIGN = 64
+
+# the widest shape the header needs room for
+MAX_NUM_RECORDS = 2 ** 63
+
+
+class NpyWriterClass:
+
+    def __init__(self, fileobj, dtype):
+        self.fileobj = fileobj
+        self.dtype = numpy.dtype(dtype)
+
+        self.chunk = numpy.zeros(const.NPY_WRITER_CHUNK_RECORDS, dtype=self.dtype)
+        self.chunk_len = 0
+        self.num_records = 0
+
+        self.header_len = len(self.get_header(MAX_NUM_RECORDS))
+
+        self.fileobj.write(self.get_header(0))
+
+
+    def get_header(self, num_records):
+        header_dict_str = repr({
+            "descr": numpy.lib.format.dtype_to_descr(self.dtype),
+            "fortran_order": False,
+            "shape": (num_records,) })
+
+        prefix_len = len(NPY_MAGIC) + NPY_HEADER_LEN_SIZE
+
+        if num_records == MAX_NUM_RECORDS:
+            # the widest header, sets the length all the others are padded to
+            unpadded_len = prefix_len + len(header_dict_str) + 1
+            total_len = ((unpadded_len + NPY_HEADER_ALIGN - 1) // NPY_HEADER_ALIGN) * NPY_HEADER_ALIGN
+        else:
+            total_len = self.header_len
+
+        header_bytes = header_dict_str.encode("latin1").ljust(total_len - prefix_len - 1, b' ') + b'\n'
+
+        return NPY_MAGIC + (total_len - prefix_len).to_bytes(NPY_HEADER_LEN_SIZE, "little") + header_bytes
+
+
+    # row is a tuple, in dtype field order
+    def append(self, row):
+        self.chunk[self.chunk_len] = row
+        self.chunk_len += 1
+
+        if self.chunk_len == len(self.chunk):
+            self.write_chunk()
+
+
+    def write_chunk(self):
+        if self.chunk_len == 0:
+            return
+
+        self.fileobj.write(self.chunk[:self.chunk_len].tobytes())
+        self.num_records += self.chunk_len
+        self.chunk_len = 0
+
+
+    def get_num_records(self):
+        return self.num_records + self.chunk_len
+
+
+    # does not close the file
+    def close(self):
+        self.write_chunk()
+
+        self.fileobj.seek(0)
+        self.fileobj.write(self.get_header(self.num_records))
+        self.fileobj.seek(0, 2)
+        self.fileobj.flush()
+
@@ -7,13 +7,24 @@ import tempfile
 
 from . import const
 from . import util
+from . import data_file_helper
+from . import control_record_helper
 
 from .json_output_class import JsonOutputClass
+from .npy_writer_class import NpyWriterClass
+from .echo_record_class import EchoRecordClass
+from .interval_record_class import IntervalRecordClass
 
 
 args = None
 tmpfile1 = None
 tmpfile2 = None
+tmpfile3 = None
+# --data-file-format npy
+graph_npy_writer = None
+raw_npy_writer = None
+# --data-file-format text
+graph_data_line_format = None
 last_line_to_stdout_time = 0
 print_header1 = True
 print_header2 = True
@@ -21,29 +32,63 @@ print_header3 = True
 relative_start_time_sec = None
 json_output = None
 unloaded_latency_rtt_ms = None
-last_total_pkts_sent = 0
-last_total_pkts_dropped = 0
+# per stream
+last_total_pkts_sent = {}
+last_total_pkts_dropped = {}
 
 
 def init(args0):
     global args
     global tmpfile1
     global tmpfile2
+    global tmpfile3
+    global graph_npy_writer
+    global raw_npy_writer
+    global graph_data_line_format
     global json_output
+    global last_line_to_stdout_time
+    global print_header1
+    global print_header2
+    global print_header3
+    global relative_start_time_sec
+    global unloaded_latency_rtt_ms
+    global last_total_pkts_sent
+    global last_total_pkts_dropped
 
     args = args0
 
+    # bbperf analyze runs one test after another in the same process
+    last_line_to_stdout_time = 0
+    print_header1 = True
+    print_header2 = True
+    print_header3 = True
+    relative_start_time_sec = None
+    unloaded_latency_rtt_ms = None
+    last_total_pkts_sent = {}
+    last_total_pkts_dropped = {}
+
     # create and open file
 
     if args.udp:
         tmp_graph_filename_prefix = "bbperf-graph-data-udp-"
         tmp_raw_filename_prefix = "bbperf-raw-data-udp-"
+        tmp_sweep_filename_prefix = "bbperf-sweep-data-udp-"
     else:
         tmp_graph_filename_prefix = "bbperf-graph-data-tcp-"
         tmp_raw_filename_prefix = "bbperf-raw-data-tcp-"
+        tmp_sweep_filename_prefix = "bbperf-sweep-data-tcp-"
 
-    tmpfile1 = tempfile.NamedTemporaryFile(prefix=tmp_graph_filename_prefix, delete=False)
-    tmpfile2 = tempfile.NamedTemporaryFile(prefix=tmp_raw_filename_prefix, delete=False)
+    if args.data_file_format == "npy":
+        tmpfile1 = tempfile.NamedTemporaryFile(prefix=tmp_graph_filename_prefix, suffix=".npy", delete=False)
+        tmpfile2 = tempfile.NamedTemporaryFile(prefix=tmp_raw_filename_prefix, suffix=".npy", delete=False)
+        graph_npy_writer = NpyWriterClass(tmpfile1.file, data_file_helper.get_graph_data_dtype(args))
+        raw_npy_writer = NpyWriterClass(tmpfile2.file, data_file_helper.RAW_DATA_DTYPE)
+    else:
+        tmpfile1 = tempfile.NamedTemporaryFile(prefix=tmp_graph_filename_prefix, delete=False)
+        tmpfile2 = tempfile.NamedTemporaryFile(prefix=tmp_raw_filename_prefix, delete=False)
+        graph_data_line_format = data_file_helper.get_graph_data_line_format(args)
+    if args.sweep:
+        tmpfile3 = tempfile.NamedTemporaryFile(prefix=tmp_sweep_filename_prefix, delete=False)
 
     json_output = JsonOutputClass(args)
 
@@ -54,12 +99,51 @@ def get_graph_data_file_name():
 def get_raw_data_file_name():
     return tmpfile2.name
 
+def get_sweep_data_file_name():
+    return tmpfile3.name
+
 def term():
+    if args.data_file_format == "npy":
+        graph_npy_writer.close()
+        raw_npy_writer.close()
+
     tmpfile1.close()
     tmpfile2.close()
 
     json_output.write_output()
 
+    if args.sweep:
+        write_sweep_data_file()
+
+
+# one line per sweep step, for the sweep graph
+def write_sweep_data_file():
+    lineout = "step offered_load_percent sender_Mbps goodput_Mbps rtt_p50_ms rtt_p99_ms excess_buffered_bytes_p50 excess_buffered_bytes_p99 pkt_loss_percent_p50"
+    write_data_to_file(lineout, tmpfile3)
+
+    for step_dict in json_output.get_sweep_steps():
+        if step_dict["num_samples"] == 0:
+            continue
+
+        lineout = "{} {} {} {} {} {} {} {} {}".format(
+            step_dict["step"],
+            step_dict["offered_load_percent"],
+            step_dict["sender_throughput_rate_mbps"],
+            step_dict["goodput_mbps"],
+            step_dict["loaded_rtt_ms"]["p50"],
+            step_dict["loaded_rtt_ms"]["p99"],
+            step_dict["excess_buffered_bytes"]["p50"],
+            step_dict["excess_buffered_bytes"]["p99"],
+            step_dict["pkt_loss_percent"]["p50"]
+            )
+        write_data_to_file(lineout, tmpfile3)
+
+    tmpfile3.close()
+
+
+def add_udp_pacing_stats(udp_pacing_stats):
+    json_output.add_udp_pacing_stats(udp_pacing_stats)
+
 
 def delete_tmp_data_files():
     if args.verbosity:
@@ -69,10 +153,14 @@ def delete_tmp_data_files():
     os.remove(tmpfile1.name)
     os.remove(tmpfile2.name)
 
+    if args.sweep:
+        if args.verbosity:
+            print("deleting sweep data file: {}".format(tmpfile3.name), flush=True)
+        os.remove(tmpfile3.name)
+
 
 def write_data_to_file(lineout, fileout):
-    lineout_bytes = "{}\n".format(lineout).encode()
-    fileout.file.write(lineout_bytes)
+    fileout.file.write((lineout + "\n").encode())
 
 def write_raw_data_to_file(lineout):
     write_data_to_file(lineout, tmpfile2)
@@ -84,8 +172,45 @@ def write_graph_data_to_file(lineout):
 # keep in mind here that the interval data is coming in at a faster
 # rate than what we want to (normally) display on stdout
 
-def print_output(s1):
-    global args
+def print_output(record):
+    raw_str = None
+
+    if isinstance(record, str):
+        # ascii control protocol, as received
+        raw_str = record
+
+        if record.startswith(" e "):
+            record = util.parse_e_record(args, record)
+        else:
+            record = util.parse_r_record(args, record)
+
+    elif not isinstance(record, (IntervalRecordClass, EchoRecordClass)):
+        # binary control protocol
+        if control_record_helper.get_record_kind(record) == control_record_helper.KIND_ECHO_G:
+            record = util.add_e_record_derived_fields(args, control_record_helper.unpack_echo_record(record))
+        else:
+            record = util.add_r_record_derived_fields(args, control_record_helper.unpack_interval_record(record))
+
+    # else from the control receiver in this process (asyncio engine), derived fields and all
+
+    is_echo = isinstance(record, EchoRecordClass)
+
+    if args.data_file_format == "npy":
+        raw_npy_writer.append(data_file_helper.record_to_raw_row(record, is_echo))
+    else:
+        if raw_str is None:
+            raw_str = util.e_record_to_str(record) if is_echo else util.r_record_to_str(record)
+        write_raw_data_to_file(raw_str)
+
+    if is_echo:
+        print_record(record, None)
+    else:
+        print_record(None, record)
+
+
+# one of e_record and r_record, with their derived fields (see util), the record is
+# already in the raw data file
+def print_record(e_record, r_record):
     global last_line_to_stdout_time
     global print_header1
     global print_header2
@@ -95,88 +220,134 @@ def print_output(s1):
     global last_total_pkts_sent
     global last_total_pkts_dropped
 
-    write_raw_data_to_file(s1)
-
     curr_time = time.time()
 
-    r_record = util.parse_r_record(args, s1)
+    if e_record is not None:
+        # rtt echo, only goes into the summary
+        if e_record.is_sample_valid:
+            json_output.add_rtt_sample(e_record.rtt_ms)
+        return
 
     if relative_start_time_sec is None:
         # first incoming result has arrived
-        relative_start_time_sec = r_record["r_pkt_sent_time_sec"]
+        relative_start_time_sec = r_record.r_pkt_sent_time_sec
         relative_pkt_sent_time_sec = 0
         relative_pkt_received_time_sec = 0
     else:
-        relative_pkt_sent_time_sec = r_record["r_pkt_sent_time_sec"] - relative_start_time_sec
-        relative_pkt_received_time_sec = r_record["r_pkt_received_time_sec"] - relative_start_time_sec
+        relative_pkt_sent_time_sec = r_record.r_pkt_sent_time_sec - relative_start_time_sec
+        relative_pkt_received_time_sec = r_record.r_pkt_received_time_sec - relative_start_time_sec
 
-    if r_record["r_record_type"] == "run":
+    if r_record.r_record_type == "run":
         json_output.set_unloaded_rtt_ms(unloaded_latency_rtt_ms)
 
-        bdp_bytes = int( r_record["receiver_interval_rate_bytes_per_sec"] * (unloaded_latency_rtt_ms / 1000.0) )
+        bdp_bytes = int( r_record.receiver_interval_rate_bytes_per_sec * (unloaded_latency_rtt_ms / 1000.0) )
 
         if bdp_bytes > 0:
-            bloat_factor = float(r_record["buffered_bytes"]) / bdp_bytes
+            bloat_factor = float(r_record.buffered_bytes) / bdp_bytes
         else:
             bloat_factor = 0
 
-        if print_header3:
-            lineout = "sent_epoch sent_time recv_time sender_pps sender_Mbps receiver_pps receiver_Mbps unloaded_rtt_ms rtt_ms BDP_bytes buffered_bytes bloat_factor pkts_dropped pkts_dropped_percent"
-            write_graph_data_to_file(lineout)
-            print_header3 = False
-
         # write to file the same data and same rate as what we are receiving over the control connection
-        lineout = "{} {} {} {} {} {} {} {} {} {} {} {} {} {}".format(
-            r_record["r_pkt_sent_time_sec"],
+        # (fields in data_file_helper.GRAPH_DATA_FIELD_LIST order)
+        graph_row = (
+            r_record.r_pkt_sent_time_sec,
             relative_pkt_sent_time_sec,
             relative_pkt_received_time_sec,
-            r_record["sender_pps"],
-            r_record["sender_interval_rate_mbps"],
-            r_record["receiver_pps"],
-            r_record["receiver_interval_rate_mbps"],
+            r_record.sender_pps,
+            r_record.sender_interval_rate_mbps,
+            r_record.receiver_pps,
+            r_record.receiver_interval_rate_mbps,
             unloaded_latency_rtt_ms,
-            r_record["rtt_ms"],
+            r_record.rtt_ms,
             bdp_bytes,
-            r_record["buffered_bytes"],
+            r_record.buffered_bytes,
             bloat_factor,
-            r_record["interval_dropped"],
-            r_record["interval_dropped_percent"]
+            r_record.interval_dropped,
+            r_record.interval_dropped_percent,
+            r_record.r_stream_id,
+            r_record.sweep_step
             )
 
-        write_graph_data_to_file(lineout)
+        if not args.udp:
+            graph_row += (
+                r_record.tcp_srtt_ms,
+                r_record.tcp_rttvar_ms,
+                r_record.tcp_min_rtt_ms,
+                r_record.r_sender_tcp_snd_cwnd,
+                r_record.r_sender_tcp_lost,
+                r_record.r_sender_tcp_notsent_bytes,
+                r_record.tcp_delivery_rate_mbps,
+                r_record.tcp_pacing_rate_mbps,
+                r_record.r_sender_tcp_bytes_retrans
+                )
+
+        if args.data_file_format == "npy":
+            graph_npy_writer.append(graph_row)
+        else:
+            if print_header3:
+                write_graph_data_to_file(data_file_helper.get_graph_data_header(args))
+                print_header3 = False
+
+            write_graph_data_to_file(graph_data_line_format(*graph_row))
 
         # add to JSON output
-        excess = r_record["buffered_bytes"] - bdp_bytes
+        excess = r_record.buffered_bytes - bdp_bytes
         if excess < 0:
             excess = 0
         new_entry = {
-            "sent_time_epoch_sec": r_record["r_pkt_sent_time_sec"],
-            "sent_time_sec": r_record["r_pkt_sent_time_sec"],
-            "received_time_sec": r_record["r_pkt_received_time_sec"],
-            "loaded_rtt_ms": r_record["rtt_ms"],
-            "sender_throughput_rate_mbps": r_record["sender_interval_rate_mbps"],
-            "receiver_throughput_rate_mbps": r_record["receiver_interval_rate_mbps"],
+            "sent_time_epoch_sec": r_record.r_pkt_sent_time_sec,
+            "sent_time_sec": r_record.r_pkt_sent_time_sec,
+            "received_time_sec": r_record.r_pkt_received_time_sec,
+            "loaded_rtt_ms": r_record.rtt_ms,
+            "sender_throughput_rate_mbps": r_record.sender_interval_rate_mbps,
+            "receiver_throughput_rate_mbps": r_record.receiver_interval_rate_mbps,
             "bdp_bytes": bdp_bytes,
+            "buffered_bytes": r_record.buffered_bytes,
             "excess_buffered_bytes": excess,
-            "receiver_pps": r_record["receiver_pps"],
-            "pkt_loss_percent": r_record["interval_dropped_percent"],
-            "is_sample_valid": r_record["is_sample_valid"]
+            "receiver_pps": r_record.receiver_pps,
+            "pkts_sent": r_record.r_sender_interval_pkts_sent,
+            "pkts_dropped": r_record.interval_dropped,
+            "pkt_loss_percent": r_record.interval_dropped_percent,
+            "is_sample_valid": r_record.is_sample_valid,
+            "stream_id": r_record.r_stream_id,
+            "sweep_step": r_record.sweep_step
         }
+        if not args.udp:
+            new_entry["tcp_srtt_ms"] = r_record.tcp_srtt_ms
+            new_entry["tcp_rttvar_ms"] = r_record.tcp_rttvar_ms
+            new_entry["tcp_min_rtt_ms"] = r_record.tcp_min_rtt_ms
+            new_entry["tcp_snd_cwnd"] = r_record.r_sender_tcp_snd_cwnd
+            new_entry["tcp_lost"] = r_record.r_sender_tcp_lost
+            new_entry["tcp_notsent_bytes"] = r_record.r_sender_tcp_notsent_bytes
+            new_entry["tcp_delivery_rate_mbps"] = r_record.tcp_delivery_rate_mbps
+            new_entry["tcp_pacing_rate_mbps"] = r_record.tcp_pacing_rate_mbps
+            new_entry["tcp_bytes_retrans"] = r_record.r_sender_tcp_bytes_retrans
+        if args.kernel_timestamps:
+            new_entry["userspace_rtt_ms"] = r_record.userspace_rtt_ms
+        if args.rtt_sample_interval is not None:
+            new_entry["rtt_sample_count"] = r_record.rtt_sample_count
+            new_entry["rtt_sample_min_ms"] = r_record.rtt_sample_min_sec * 1000
+            new_entry["rtt_sample_p50_ms"] = r_record.rtt_sample_p50_sec * 1000
+            new_entry["rtt_sample_p99_ms"] = r_record.rtt_sample_p99_sec * 1000
+            new_entry["rtt_sample_max_ms"] = r_record.rtt_sample_max_sec * 1000
         json_output.add_entry(new_entry)
 
         # write to stdout at the rate of one line per second
         # each stdout line will be a 0.1s snapshot
         if ((curr_time > (last_line_to_stdout_time + const.STDOUT_INTERVAL_SEC)) and not args.quiet) or args.verbosity > 2:
             if print_header2:
-                print("  sent_time   recv_time  sender_Mbps receiver_Mbps sender_pps receiver_pps unloaded_rtt_ms rtt_ms BDP_bytes buffered_bytes bloat pkts_dropped  drop%", flush=True)
+                print("  sent_time   recv_time  sender_Mbps receiver_Mbps sender_pps receiver_pps unloaded_rtt_ms rtt_ms BDP_bytes buffered_bytes bloat pkts_dropped  drop%{}".format(
+                    " stream" if args.parallel > 1 else ""), flush=True)
                 print_header2 = False
 
             if args.udp:
-                curr_total_pkts_sent = r_record["r_sender_total_pkts_sent"]
-                curr_total_pkts_dropped = r_record["total_dropped"]
+                stream_id = r_record.r_stream_id
+
+                curr_total_pkts_sent = r_record.r_sender_total_pkts_sent
+                curr_total_pkts_dropped = r_record.total_dropped
 
-                delta_pkts_sent = curr_total_pkts_sent - last_total_pkts_sent
-                delta_pkts_dropped = curr_total_pkts_dropped - last_total_pkts_dropped
+                delta_pkts_sent = curr_total_pkts_sent - last_total_pkts_sent.get(stream_id, 0)
+                delta_pkts_dropped = curr_total_pkts_dropped - last_total_pkts_dropped.get(stream_id, 0)
 
                 if delta_pkts_dropped < 0:
                     delta_pkts_dropped = 0
@@ -184,27 +355,33 @@ def print_output(s1):
                 delta_pkts_dropped_percent = (delta_pkts_dropped * 100) / delta_pkts_sent
                 delta_pkts_dropped_percent_str = "{:6.3f}%".format(delta_pkts_dropped_percent)
 
-                last_total_pkts_sent = curr_total_pkts_sent
-                last_total_pkts_dropped = curr_total_pkts_dropped
+                last_total_pkts_sent[stream_id] = curr_total_pkts_sent
+                last_total_pkts_dropped[stream_id] = curr_total_pkts_dropped
             else:
                 delta_pkts_dropped = -1
                 delta_pkts_dropped_percent_str = "   n/a"
 
 
-            print("{:11.6f} {:11.6f} {:11.3f}   {:11.3f}   {:8d}     {:8d}    {:8.3f}   {:9.3f} {:9d}    {:9d} {:6.1f}x   {:6d}    {}".format(
+            if args.parallel > 1:
+                stream_id_str = "  {:6d}".format(r_record.r_stream_id)
+            else:
+                stream_id_str = ""
+
+            print("{:11.6f} {:11.6f} {:11.3f}   {:11.3f}   {:8d}     {:8d}    {:8.3f}   {:9.3f} {:9d}    {:9d} {:6.1f}x   {:6d}    {}{}".format(
                 relative_pkt_sent_time_sec,
                 relative_pkt_received_time_sec,
-                r_record["sender_interval_rate_mbps"],
-                r_record["receiver_interval_rate_mbps"],
-                r_record["sender_pps"],
-                r_record["receiver_pps"],
+                r_record.sender_interval_rate_mbps,
+                r_record.receiver_interval_rate_mbps,
+                r_record.sender_pps,
+                r_record.receiver_pps,
                 unloaded_latency_rtt_ms,
-                r_record["rtt_ms"],
+                r_record.rtt_ms,
                 bdp_bytes,
-                r_record["buffered_bytes"],
+                r_record.buffered_bytes,
                 bloat_factor,
                 delta_pkts_dropped,
-                delta_pkts_dropped_percent_str
+                delta_pkts_dropped_percent_str,
+                stream_id_str
                 ),
                 flush=True)
 
@@ -213,8 +390,8 @@ def print_output(s1):
     else:
         # calibrating
         # do we have a new unloaded latency?
-        if (unloaded_latency_rtt_ms is None) or (r_record["rtt_ms"] < unloaded_latency_rtt_ms):
-            unloaded_latency_rtt_ms = r_record["rtt_ms"]
+        if (unloaded_latency_rtt_ms is None) or (r_record.rtt_ms < unloaded_latency_rtt_ms):
+            unloaded_latency_rtt_ms = r_record.rtt_ms
 
         if ((curr_time > (last_line_to_stdout_time + const.STDOUT_INTERVAL_SEC)) and not args.quiet) or args.verbosity > 2:
             if print_header1:
@@ -0,0 +1,65 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import socket
+import struct
+import subprocess
+
+from . import const
+
+# kernel pacing
+#
+# SO_MAX_PACING_RATE caps the rate of a socket.  tcp paces on its own, but udp is only
+# paced by the fq qdisc, so for udp we check that fq is actually on the outgoing device.
+
+
+# bytes_per_sec is a u64 (linux 4.19 and later)
+def set_max_pacing_rate(sock, bytes_per_sec):
+    bytes_per_sec = max(1, min(int(bytes_per_sec), const.SO_MAX_PACING_RATE_UNLIMITED))
+
+    sock.setsockopt(socket.SOL_SOCKET, const.SO_MAX_PACING_RATE, struct.pack('Q', bytes_per_sec))
+
+
+# returns the name of the outgoing device for peer_addr, or None
+def get_route_device(peer_addr):
+    try:
+        result = subprocess.run(["ip", "route", "get", peer_addr[0]], capture_output=True, text=True)
+    except OSError:
+        return None
+
+    if result.returncode != 0:
+        return None
+
+    words = result.stdout.split()
+
+    if "dev" not in words:
+        return None
+
+    idx = words.index("dev")
+    if (idx + 1) >= len(words):
+        return None
+
+    return words[idx + 1]
+
+
+# true if the fq qdisc is installed on the device we use to reach peer_addr
+# (either as the root qdisc or under mq, one per tx queue)
+def is_fq_on_route(peer_addr):
+    dev = get_route_device(peer_addr)
+    if dev is None:
+        return False
+
+    try:
+        result = subprocess.run(["tc", "qdisc", "show", "dev", dev], capture_output=True, text=True)
+    except OSError:
+        return False
+
+    if result.returncode != 0:
+        return False
+
+    for line in result.stdout.splitlines():
+        words = line.split()
+        if len(words) > 1 and words[0] == "qdisc" and words[1] == "fq":
+            return True
+
+    return False
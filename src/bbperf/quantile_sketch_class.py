@@ -0,0 +1,205 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import math
+import numpy
+
+from . import const
+
+# percentiles of one or more streams of values (columns, added a row at a time), with
+# bounded memory
+#
+# rows go into a preallocated numpy array, which is all the per row work there is.  the
+# first QUANTILE_SKETCH_MAX_EXACT_SAMPLES rows are kept as they are, and the percentiles
+# are exact (numpy.percentile, as for a list), for all the columns in one call.  past that,
+# the array is folded, a whole array at a time, into a histogram per column with logarithmic
+# buckets: bucket i holds the values in (gamma^(i-1), gamma^i], with gamma = (1 + a) / (1 - a),
+# a = QUANTILE_SKETCH_RELATIVE_ACCURACY.  a percentile is then within a relative error of a
+# of the true value (the same bucketing as DDSketch).  negative values get buckets of their
+# own, and values close to zero count as zero.
+#
+# the number of buckets depends on the range of the values, not on how many there are,
+# e.g. 1 microsecond to 1000 seconds is under 2100 buckets at the default accuracy
+#
+# min, max, mean and stddev are always exact (stddev as numpy.std, population)
+
+# values smaller than this, in absolute terms, are zero
+ZERO_THRESHOLD = 1e-9
+
+# rows, the array starts this small and doubles up to QUANTILE_SKETCH_MAX_EXACT_SAMPLES,
+# most sketches never see many rows
+INITIAL_ARRAY_ROWS = 256
+
+
+class QuantileSketchClass:
+
+    def __init__(self, num_columns=1):
+        self.num_columns = num_columns
+
+        self.array = numpy.empty((min(INITIAL_ARRAY_ROWS, const.QUANTILE_SKETCH_MAX_EXACT_SAMPLES), num_columns))
+        self.array_len = 0
+
+        # of the rows folded so far, per column
+        self.folded_count = 0
+        self.folded_min = numpy.full(num_columns, numpy.inf)
+        self.folded_max = numpy.full(num_columns, -numpy.inf)
+        self.folded_mean = numpy.zeros(num_columns)
+        # sum of the squared differences from the mean
+        self.folded_m2 = numpy.zeros(num_columns)
+
+        # per column, bucket index -> count
+        self.positive_bucket_dict_list = [ {} for _ in range(num_columns) ]
+        self.negative_bucket_dict_list = [ {} for _ in range(num_columns) ]
+        self.zero_count_list = [ 0 ] * num_columns
+
+        self.gamma = (1 + const.QUANTILE_SKETCH_RELATIVE_ACCURACY) / (1 - const.QUANTILE_SKETCH_RELATIVE_ACCURACY)
+        self.log_gamma = math.log(self.gamma)
+
+
+    # a value, or a list of num_columns values
+    def add(self, row):
+        if self.array_len == len(self.array):
+            if len(self.array) < const.QUANTILE_SKETCH_MAX_EXACT_SAMPLES:
+                self.grow_array()
+            else:
+                self.fold_array()
+
+        self.array[self.array_len] = row
+        self.array_len += 1
+
+
+    def grow_array(self):
+        new_array = numpy.empty((min(len(self.array) * 2, const.QUANTILE_SKETCH_MAX_EXACT_SAMPLES), self.num_columns))
+        new_array[:self.array_len] = self.array[:self.array_len]
+        self.array = new_array
+
+
+    def is_folded(self):
+        return self.folded_count > 0
+
+
+    def fold_array(self):
+        if self.array_len == 0:
+            return
+
+        rows = self.array[:self.array_len]
+
+        count, min_list, max_list, mean_list, m2_list = self.get_moments()
+
+        self.folded_count = count
+        self.folded_min = min_list
+        self.folded_max = max_list
+        self.folded_mean = mean_list
+        self.folded_m2 = m2_list
+
+        for column_idx in range(self.num_columns):
+            self.add_to_buckets(column_idx, rows[:, column_idx])
+
+        self.array_len = 0
+
+
+    def add_to_buckets(self, column_idx, values):
+        is_zero = numpy.abs(values) < ZERO_THRESHOLD
+        self.zero_count_list[column_idx] += int(numpy.count_nonzero(is_zero))
+
+        for bucket_dict, signed_values in [ (self.positive_bucket_dict_list[column_idx], values[(values > 0) & ~is_zero]),
+                                            (self.negative_bucket_dict_list[column_idx], -values[(values < 0) & ~is_zero]) ]:
+            bucket_idx_list, bucket_count_list = numpy.unique(numpy.ceil(numpy.log(signed_values) / self.log_gamma), return_counts=True)
+
+            for bucket_idx, bucket_count in zip(bucket_idx_list.tolist(), bucket_count_list.tolist()):
+                bucket_idx = int(bucket_idx)
+                bucket_dict[bucket_idx] = bucket_dict.get(bucket_idx, 0) + bucket_count
+
+
+    # count, and min, max, mean and m2 per column, of the folded rows and the rows in the
+    # array (merged as in Chan et al., without folding the array)
+    def get_moments(self):
+        rows = self.array[:self.array_len]
+
+        if self.array_len == 0:
+            return self.folded_count, self.folded_min, self.folded_max, self.folded_mean, self.folded_m2
+
+        rows_mean = rows.mean(axis=0)
+        rows_m2 = numpy.square(rows - rows_mean).sum(axis=0)
+
+        count = self.folded_count + self.array_len
+        delta = rows_mean - self.folded_mean
+
+        mean_list = self.folded_mean + delta * (self.array_len / count)
+        m2_list = self.folded_m2 + rows_m2 + numpy.square(delta) * (self.folded_count * self.array_len / count)
+        min_list = numpy.minimum(self.folded_min, rows.min(axis=0))
+        max_list = numpy.maximum(self.folded_max, rows.max(axis=0))
+
+        return count, min_list, max_list, mean_list, m2_list
+
+
+    # the value that represents the bucket, within the relative accuracy of all of them
+    def get_bucket_value(self, bucket_idx):
+        return 2 * (self.gamma ** bucket_idx) / (self.gamma + 1)
+
+
+    # returns an array of the percentiles, one row per percent and one column per column,
+    # same as numpy.percentile(rows, percent_list, axis=0)
+    def get_percentile_table(self, percent_list):
+        if self.get_count() == 0:
+            raise Exception("ERROR: no values for percentiles")
+
+        if not self.is_folded():
+            return numpy.percentile(self.array[:self.array_len], percent_list, axis=0)
+
+        self.fold_array()
+
+        # zero based rank, as numpy.percentile
+        rank_list = (numpy.asarray(percent_list, dtype=float) / 100.0) * (self.folded_count - 1)
+
+        percentile_table = numpy.empty((len(percent_list), self.num_columns))
+
+        for column_idx in range(self.num_columns):
+            positive_bucket_dict = self.positive_bucket_dict_list[column_idx]
+            negative_bucket_dict = self.negative_bucket_dict_list[column_idx]
+
+            # lowest first
+            negative_idx_list = sorted(negative_bucket_dict, reverse=True)
+            positive_idx_list = sorted(positive_bucket_dict)
+
+            value_list = ([ -self.get_bucket_value(idx) for idx in negative_idx_list ] +
+                          [ 0.0 ] +
+                          [ self.get_bucket_value(idx) for idx in positive_idx_list ])
+            count_list = ([ negative_bucket_dict[idx] for idx in negative_idx_list ] +
+                          [ self.zero_count_list[column_idx] ] +
+                          [ positive_bucket_dict[idx] for idx in positive_idx_list ])
+
+            # the first bucket with more values up to it than the rank
+            bucket_pos_list = numpy.searchsorted(numpy.cumsum(count_list), rank_list, side="right")
+
+            percentile_table[:, column_idx] = numpy.clip(numpy.asarray(value_list)[bucket_pos_list],
+                                                         self.folded_min[column_idx],
+                                                         self.folded_max[column_idx])
+
+        return percentile_table
+
+
+    # single column
+    def get_percentile_list(self, percent_list):
+        return self.get_percentile_table(percent_list)[:, 0].tolist()
+
+
+    def get_count(self):
+        return self.folded_count + self.array_len
+
+
+    def get_min(self, column_idx=0):
+        return float(self.get_moments()[1][column_idx])
+
+
+    def get_max(self, column_idx=0):
+        return float(self.get_moments()[2][column_idx])
+
+
+    def get_mean(self, column_idx=0):
+        return float(self.get_moments()[3][column_idx])
+
+
+    def get_stddev(self, column_idx=0):
+        count, _, _, _, m2_list = self.get_moments()
+        return math.sqrt(m2_list[column_idx] / count)
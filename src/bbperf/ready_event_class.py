@@ -0,0 +1,38 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import multiprocessing
+import multiprocessing.connection
+
+from . import const
+
+# "process is ready" signal, set() by the child like a multiprocessing.Event
+#
+# the parent blocks on both a pipe and the sentinel of the child, so it wakes up as soon
+# as the child is ready, and a child that dies during startup is reported right away
+# instead of at the end of the ready timeout
+class ReadyEventClass:
+
+    def __init__(self):
+        self.reader, self.writer = multiprocessing.Pipe(duplex=False)
+
+
+    # child
+    def set(self):
+        self.writer.send_bytes(b'r')
+
+
+    # parent, after process.start()
+    def wait_until_ready(self, process, timeout_sec=const.PROCESS_READY_TIMEOUT_SEC):
+        ready_list = multiprocessing.connection.wait([ self.reader, process.sentinel ], timeout_sec)
+
+        if self.reader in ready_list:
+            self.reader.recv_bytes()
+            return
+
+        if process.sentinel in ready_list:
+            process.join()
+            raise Exception("ERROR: process exited before becoming ready, name: {}, exitcode: {}".format(
+                process.name, process.exitcode))
+
+        raise Exception("ERROR: process failed to become ready")
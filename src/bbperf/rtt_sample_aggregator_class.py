@@ -0,0 +1,33 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import numpy
+
+from . import const
+
+# high resolution rtt (--rtt-sample-interval)
+#
+# the data receiver echoes a sent time every few ms, in between its interval records.
+# the control receiver adds the rtt of every echo (and of every interval record) here,
+# and at each interval record of a stream, takes the stats of the samples since the
+# previous one.  stats are in seconds, like the other record fields.
+class RttSampleAggregatorClass:
+
+    def __init__(self):
+        self.samples_per_stream = {}
+
+
+    def add_sample(self, stream_id, rtt_sec):
+        self.samples_per_stream.setdefault(stream_id, []).append(rtt_sec)
+
+
+    # returns (count, min, p50, p99, max) for the d block, and starts the next interval
+    def get_interval_stats(self, stream_id):
+        samples = self.samples_per_stream.pop(stream_id, [])
+
+        if len(samples) == 0:
+            return const.RTT_SAMPLE_STATS_NONE
+
+        p50, p99 = numpy.percentile(samples, [50, 99])
+
+        return (len(samples), min(samples), float(p50), float(p99), max(samples))
@@ -1,8 +1,6 @@
 # Copyright (c) 2024 Cloudflare, Inc.
 # Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
 
-import time
-
 from . import const
 
 from .data_sample_evaluator_class import DataSampleEvaluatorClass
@@ -18,23 +16,23 @@ class RunModeManagerClass:
         self.run_mode_running_start_time = None
         self.min_rtt_ms = None
         self.last_10_rtt_list = []
-        self.total_dropped_as_of_last_interval = 0
+        self.total_dropped_as_of_last_interval = {}         # per stream
         self.data_sample_evaluator = DataSampleEvaluatorClass(self.args)
         self.first_valid_sample_time = None
 
 
-    # updates shared_run_mode and r_record["is_sample_valid"]
-    def update(self, r_record):
-        curr_time = time.time()
+    # updates shared_run_mode and r_record.is_sample_valid
+    # curr_time is when the record was received (bbperf analyze replays saved records)
+    def update(self, r_record, curr_time):
 
         # first record
         if self.job_start_time is None:
             self.job_start_time = curr_time
 
-        curr_rtt_ms = r_record["rtt_ms"]
+        curr_rtt_ms = r_record.rtt_ms
 
         # update unloaded latency?
-        if r_record["r_record_type"] == "cal":
+        if r_record.r_record_type == "cal":
             if (self.min_rtt_ms is None) or (curr_rtt_ms < self.min_rtt_ms):
                 self.min_rtt_ms = curr_rtt_ms
 
@@ -65,30 +63,36 @@ class RunModeManagerClass:
         # check to see if we should stop RUNNING
 
         if self.args.udp:
-            dropped_this_interval = r_record["total_dropped"] - self.total_dropped_as_of_last_interval
+            stream_id = r_record.r_stream_id
+            dropped_this_interval = r_record.total_dropped - self.total_dropped_as_of_last_interval.get(stream_id, 0)
             if dropped_this_interval < 0:
                 dropped_this_interval = 0
-            dropped_this_interval_percent = (dropped_this_interval * 100.0) / r_record["r_sender_interval_pkts_sent"]
+            dropped_this_interval_percent = (dropped_this_interval * 100.0) / r_record.r_sender_interval_pkts_sent
             # remember this for next loop:
-            self.total_dropped_as_of_last_interval = r_record["total_dropped"]
+            self.total_dropped_as_of_last_interval[stream_id] = r_record.total_dropped
         else:
             dropped_this_interval = -1
             dropped_this_interval_percent = -1
 
-        r_record["interval_dropped"] = dropped_this_interval
-        r_record["interval_dropped_percent"] = dropped_this_interval_percent
+        r_record.interval_dropped = dropped_this_interval
+        r_record.interval_dropped_percent = dropped_this_interval_percent
 
         if self.data_sample_evaluator.is_sample_valid(
                 self.run_mode_running_start_time,
                 dropped_this_interval_percent,
+                r_record.receiver_interval_rate_mbps,
                 curr_time):
 
-            r_record["is_sample_valid"] = 1
+            r_record.is_sample_valid = 1
             if self.first_valid_sample_time is None:
                 self.first_valid_sample_time = curr_time
 
         else:
-            r_record["is_sample_valid"] = 0
+            r_record.is_sample_valid = 0
+
+        # with --sweep, the sweep manager decides when we are done
+        if self.args.sweep:
+            return
 
         if self.first_valid_sample_time and (curr_time > (self.first_valid_sample_time + self.args.time)):
             self.shared_run_mode.value = const.RUN_MODE_STOP
@@ -0,0 +1,463 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import math
+import time
+import types
+import selectors
+import multiprocessing
+
+from . import session_thread
+from . import session_handoff_helper
+from . import initial_string_helper
+from . import util
+from . import const
+
+from .admission_controller_class import AdmissionControllerClass
+from .metrics_exporter_class import MetricsExporterClass
+from .session_metrics_class import SessionMetricsClass
+
+# runs concurrent tests on the server
+#
+# every connection to the server port starts with its initial string, "control <run_id>"
+# or "data <run_id>".  the dispatcher reads it, starts a session process (session_thread)
+# for each control connection, and hands each data connection to the session with its
+# run_id.  udp flows start with "data <run_id>" on the dispatcher's unconnected socket on
+# the server port, the session is handed the client addr and connects a socket of its own.
+#
+# the dispatcher also sends the control initial ack and reads the client args, so the
+# admission controller can decide whether the test starts now, waits in the queue, or the
+# client is told to retry later.  a session starts with sending the control args ack.
+
+# far more than the args of any client
+MAX_CLIENT_ARGS_LEN = 65536
+
+SELECT_TIMEOUT_SEC = 1.0
+
+
+class SessionDispatcherClass:
+
+    def __init__(self, args, listen_sock, udp_sock):
+        self.args = args
+        self.listen_sock = listen_sock
+        self.udp_sock = udp_sock
+        self.server_addr = (args.bind, listen_sock.getsockname()[1])
+
+        self.selector = selectors.DefaultSelector()
+
+        self.admission_controller = AdmissionControllerClass(args)
+
+        # accepted connections whose initial string (or, for control connections, client
+        # args) is not complete yet
+        # sock -> SimpleNamespace(received_bytes, accept_time, run_id)
+        self.pending_conn_dict = {}
+
+        # run_id -> SimpleNamespace(process, handoff_sock, udp_addr_set, client_args, client_control_addr, metrics)
+        self.session_dict = {}
+
+        # run_id -> control sock, clients waiting in the admission queue
+        self.queued_sock_dict = {}
+
+        self.listen_sock.setblocking(False)
+        self.udp_sock.setblocking(False)
+
+        self.selector.register(self.listen_sock, selectors.EVENT_READ, ("listen", None))
+        self.selector.register(self.udp_sock, selectors.EVENT_READ, ("udp", None))
+
+        self.last_queue_update_time = time.time()
+
+        if (args.metrics_port is not None) or (args.metrics_textfile is not None):
+            self.metrics_exporter = MetricsExporterClass(args, self.selector)
+        else:
+            self.metrics_exporter = None
+
+
+    # does not return
+    def run(self):
+        while True:
+            for key, _ in self.selector.select(SELECT_TIMEOUT_SEC):
+                event_type, event_data = key.data
+
+                if event_type == "listen":
+                    self.accept_connection()
+                elif event_type == "udp":
+                    self.recv_udp_initial_string()
+                elif event_type == "pending":
+                    if self.pending_conn_dict[event_data].run_id is None:
+                        self.recv_initial_string(event_data)
+                    else:
+                        self.recv_client_args(event_data)
+                elif event_type == "queued":
+                    self.queued_client_readable(event_data)
+                elif event_type == "session":
+                    self.end_session(event_data)
+                elif event_type == "metrics":
+                    self.metrics_exporter.accept_http_connection()
+                elif event_type == "metrics http":
+                    self.metrics_exporter.serve_http(event_data, self.session_dict, self.admission_controller.get_queue_length())
+
+            self.drop_stale_pending_connections()
+
+            if (time.time() - self.last_queue_update_time) > const.QUEUE_UPDATE_INTERVAL_SEC:
+                self.send_queue_updates()
+
+            if self.metrics_exporter is not None:
+                self.metrics_exporter.drop_stale_http_connections()
+                self.metrics_exporter.write_textfile_if_due(self.session_dict, self.admission_controller.get_queue_length())
+
+
+    def accept_connection(self):
+        try:
+            sock, _ = self.listen_sock.accept()
+        except BlockingIOError:
+            return
+
+        sock.setblocking(False)
+
+        self.pending_conn_dict[sock] = types.SimpleNamespace(received_bytes=b'', accept_time=time.time(), run_id=None)
+        self.selector.register(sock, selectors.EVENT_READ, ("pending", sock))
+
+
+    def drop_pending_connection(self, sock, close_sock):
+        self.selector.unregister(sock)
+        del self.pending_conn_dict[sock]
+
+        if close_sock:
+            util.done_with_socket(sock)
+
+
+    def drop_stale_pending_connections(self):
+        curr_time = time.time()
+
+        for sock, pending in list(self.pending_conn_dict.items()):
+            if (curr_time - pending.accept_time) > const.SOCKET_TIMEOUT_SEC:
+                print("ERROR: timeout waiting for {}, client addr {}".format(
+                    "initial string" if pending.run_id is None else "client args", self.get_peer_addr(sock)), flush=True)
+                self.drop_pending_connection(sock, True)
+
+
+    def get_peer_addr(self, sock):
+        try:
+            return sock.getpeername()
+        except OSError:
+            return None
+
+
+    def recv_initial_string(self, sock):
+        pending = self.pending_conn_dict[sock]
+
+        if initial_string_helper.is_control_initial_string(pending.received_bytes):
+            expected_len = initial_string_helper.LEN_CONTROL_INITIAL_STRING
+        else:
+            # never read past the end of the shorter one
+            expected_len = initial_string_helper.LEN_DATA_INITIAL_STRING
+
+        try:
+            received_bytes = sock.recv(expected_len - len(pending.received_bytes))
+        except BlockingIOError:
+            return
+        except OSError:
+            received_bytes = b''
+
+        if len(received_bytes) == 0:
+            # peer disconnected
+            self.drop_pending_connection(sock, True)
+            return
+
+        pending.received_bytes += received_bytes
+
+        if len(pending.received_bytes) < initial_string_helper.LEN_INITIAL_STRING_PREFIX:
+            return
+
+        prefix_bytes = pending.received_bytes[ 0 : initial_string_helper.LEN_INITIAL_STRING_PREFIX ]
+
+        initial_string_len = initial_string_helper.get_initial_string_len(prefix_bytes)
+
+        if initial_string_len is None:
+            print("ERROR: invalid initial string from client addr {}: {}".format(self.get_peer_addr(sock), prefix_bytes), flush=True)
+            self.drop_pending_connection(sock, True)
+            return
+
+        if len(pending.received_bytes) < initial_string_len:
+            return
+
+        run_id = initial_string_helper.get_run_id(pending.received_bytes)
+
+        if initial_string_helper.is_control_initial_string(pending.received_bytes):
+            self.new_control_connection(sock, pending, run_id)
+        else:
+            self.drop_pending_connection(sock, False)
+            self.new_tcp_data_connection(sock, run_id)
+
+
+    def new_control_connection(self, control_sock, pending, run_id):
+        if not initial_string_helper.is_valid_run_id(run_id):
+            print("ERROR: invalid run_id from client addr {}: {}".format(self.get_peer_addr(control_sock), ascii(run_id)), flush=True)
+            self.drop_pending_connection(control_sock, True)
+            return
+
+        pending.run_id = run_id
+        pending.received_bytes = b''
+
+        print("client connected (control socket): client addr {}, server addr {}, run_id {}".format(
+            self.get_peer_addr(control_sock), self.server_addr, pending.run_id), flush=True)
+
+        if self.admission_controller.is_known(pending.run_id):
+            print("ERROR: run_id already in use: {}".format(pending.run_id), flush=True)
+            self.drop_pending_connection(control_sock, True)
+            return
+
+        if not self.send_control_string(control_sock, const.TCP_CONTROL_INITIAL_ACK):
+            self.drop_pending_connection(control_sock, True)
+
+
+    # the client sends its args once it has the control initial ack
+    def recv_client_args(self, control_sock):
+        pending = self.pending_conn_dict[control_sock]
+
+        try:
+            received_bytes = control_sock.recv(const.BUFSZ)
+        except BlockingIOError:
+            return
+        except OSError:
+            received_bytes = b''
+
+        if len(received_bytes) == 0:
+            # peer disconnected
+            self.drop_pending_connection(control_sock, True)
+            return
+
+        pending.received_bytes += received_bytes
+
+        # starts with "{" and ends with "}", nothing follows until we answer
+        if not pending.received_bytes.endswith(b'}'):
+            if len(pending.received_bytes) > MAX_CLIENT_ARGS_LEN:
+                print("ERROR: client args too long, run_id {}".format(pending.run_id), flush=True)
+                self.drop_pending_connection(control_sock, True)
+            return
+
+        run_id = pending.run_id
+
+        self.drop_pending_connection(control_sock, False)
+
+        try:
+            client_args = util.client_args_from_json(pending.received_bytes)
+        except ValueError as e:
+            print("ERROR: invalid client args, run_id {}: {}".format(run_id, e), flush=True)
+            util.done_with_socket(control_sock)
+            return
+
+        print("received args from client: {}".format(vars(client_args)), flush=True)
+
+        error_str = util.check_client_protocol_version(client_args)
+        if error_str is not None:
+            print("ERROR: {}, run_id {}".format(error_str, run_id), flush=True)
+            self.send_control_string(control_sock, const.TCP_CONTROL_ARGS_VERSION_MISMATCH)
+            util.done_with_socket(control_sock)
+            return
+
+        self.admit_client(run_id, client_args, control_sock)
+
+
+    def admit_client(self, run_id, client_args, control_sock):
+        client_control_addr = self.get_peer_addr(control_sock)
+
+        decision, decision_sec = self.admission_controller.request(run_id, client_args, (control_sock, client_control_addr))
+
+        if decision == "admit":
+            self.start_session(run_id, client_args, control_sock, client_control_addr)
+
+        elif decision == "queued":
+            print("client queued, run_id {}, {} sessions running, queue length {}, estimated wait {:.1f} seconds".format(
+                run_id, self.admission_controller.get_num_running(), self.admission_controller.get_queue_length(),
+                decision_sec), flush=True)
+
+            self.send_queued_message(control_sock, decision_sec)
+
+            # a queued client that goes away leaves the queue
+            self.selector.register(control_sock, selectors.EVENT_READ, ("queued", run_id))
+            self.queued_sock_dict[run_id] = control_sock
+
+        else:
+            print("server busy, client told to retry after {} seconds, run_id {}".format(decision_sec, run_id), flush=True)
+
+            self.send_control_string(control_sock, const.TCP_CONTROL_ARGS_BUSY.format(decision_sec))
+
+            if self.metrics_exporter is not None:
+                self.metrics_exporter.test_rejected()
+
+            util.done_with_socket(control_sock)
+
+
+    def send_queued_message(self, control_sock, estimated_wait_sec):
+        self.send_control_string(control_sock, const.TCP_CONTROL_ARGS_QUEUED.format(math.ceil(estimated_wait_sec)))
+
+
+    # a fresh estimate for every queued client now and then, which also keeps their wait for
+    # the args ack from timing out
+    def send_queue_updates(self):
+        self.last_queue_update_time = time.time()
+
+        for run_id, client_args, (control_sock, _), estimated_wait_sec in self.admission_controller.get_queued_list():
+            self.send_queued_message(control_sock, estimated_wait_sec)
+
+
+    # short strings only, they always fit in the socket buffer
+    def send_control_string(self, control_sock, str0):
+        try:
+            control_sock.send(str0.encode())
+        except OSError:
+            return False
+
+        return True
+
+
+    def queued_client_readable(self, run_id):
+        control_sock = self.queued_sock_dict[run_id]
+
+        try:
+            received_bytes = control_sock.recv(const.BUFSZ)
+        except BlockingIOError:
+            return
+        except OSError:
+            received_bytes = b''
+
+        if len(received_bytes) > 0:
+            # the client has nothing to say until its args ack
+            return
+
+        print("queued client disconnected, run_id {}".format(run_id), flush=True)
+
+        self.unregister_queued_client(run_id)
+        util.done_with_socket(control_sock)
+
+        self.start_admitted_sessions(self.admission_controller.remove_queued(run_id))
+
+
+    def unregister_queued_client(self, run_id):
+        control_sock = self.queued_sock_dict.pop(run_id)
+        self.selector.unregister(control_sock)
+
+
+    def start_admitted_sessions(self, admitted_list):
+        for run_id, client_args, (control_sock, client_control_addr) in admitted_list:
+            self.unregister_queued_client(run_id)
+            self.start_session(run_id, client_args, control_sock, client_control_addr)
+
+
+    def start_session(self, run_id, client_args, control_sock, client_control_addr):
+        handoff_sock, session_handoff_sock = session_handoff_helper.create_handoff_socketpair()
+
+        control_sock.setblocking(True)
+
+        # live counters for the metrics exporter, shared with the session and its workers
+        if self.metrics_exporter is not None:
+            session_metrics = SessionMetricsClass()
+        else:
+            session_metrics = None
+
+        session_process = multiprocessing.Process(
+            name = "session",
+            target = session_thread.run,
+            args = (self.args, self.server_addr, control_sock, client_control_addr, run_id, client_args, session_handoff_sock,
+                    session_metrics, self.get_dispatcher_sock_list()),
+            daemon = False)
+
+        session_process.start()
+
+        # the session process has its own copies now
+        control_sock.close()
+        session_handoff_sock.close()
+
+        self.session_dict[run_id] = types.SimpleNamespace(
+            process=session_process, handoff_sock=handoff_sock, udp_addr_set=set(),
+            client_args=client_args, client_control_addr=client_control_addr, metrics=session_metrics)
+
+        self.selector.register(session_process.sentinel, selectors.EVENT_READ, ("session", run_id))
+
+        if self.args.verbosity:
+            print("session started, run_id {}, {} sessions running".format(run_id, len(self.session_dict)), flush=True)
+
+
+    # everything the dispatcher has open, a new session process closes its copies, so that a
+    # connection is closed when its own process is done with it
+    def get_dispatcher_sock_list(self):
+        dispatcher_sock_list = [ self.listen_sock, self.udp_sock ]
+        dispatcher_sock_list.extend(self.pending_conn_dict.keys())
+        dispatcher_sock_list.extend(self.queued_sock_dict.values())
+        dispatcher_sock_list.extend(session.handoff_sock for session in self.session_dict.values())
+
+        if (self.metrics_exporter is not None) and (self.metrics_exporter.listen_sock is not None):
+            dispatcher_sock_list.append(self.metrics_exporter.listen_sock)
+            dispatcher_sock_list.extend(self.metrics_exporter.get_http_sock_list())
+
+        return dispatcher_sock_list
+
+
+    def end_session(self, run_id):
+        session = self.session_dict.pop(run_id)
+
+        self.selector.unregister(session.process.sentinel)
+        session.process.join()
+        session.handoff_sock.close()
+
+        if session.process.exitcode != 0:
+            print("ERROR: session exited abnormally, run_id {}, exitcode {}".format(run_id, session.process.exitcode), flush=True)
+
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.test_ended(session, session.process.exitcode != 0)
+
+        if self.args.verbosity:
+            print("session ended, run_id {}, {} sessions running".format(run_id, len(self.session_dict)), flush=True)
+
+        self.start_admitted_sessions(self.admission_controller.end(run_id))
+
+
+    def new_tcp_data_connection(self, data_sock, run_id):
+        session = self.session_dict.get(run_id)
+
+        if session is None:
+            print("ERROR: data connection for unknown run_id {}, client addr {}".format(
+                run_id, self.get_peer_addr(data_sock)), flush=True)
+            util.done_with_socket(data_sock)
+            return
+
+        data_sock.setblocking(True)
+
+        try:
+            session_handoff_helper.send_tcp_data_connection(session.handoff_sock, data_sock)
+        except OSError:
+            # the session is gone, it is reaped on its sentinel
+            util.done_with_socket(data_sock)
+            return
+
+        # the session has its own copy now
+        data_sock.close()
+
+
+    # the client resends its initial string until acked, only the first one of each flow counts
+    def recv_udp_initial_string(self):
+        try:
+            payload_bytes, client_data_addr = self.udp_sock.recvfrom(const.BUFSZ)
+        except (BlockingIOError, ConnectionRefusedError):
+            return
+
+        run_id = initial_string_helper.get_udp_run_id(payload_bytes)
+
+        if run_id is None:
+            return
+
+        session = self.session_dict.get(run_id)
+
+        if (session is None) or (client_data_addr in session.udp_addr_set):
+            return
+
+        session.udp_addr_set.add(client_data_addr)
+
+        if self.args.verbosity:
+            print("received data initial string: client data addr: {} run_id: {}".format(client_data_addr, run_id), flush=True)
+
+        try:
+            session_handoff_helper.send_udp_data_flow(session.handoff_sock, client_data_addr)
+        except OSError:
+            pass
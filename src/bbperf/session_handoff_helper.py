@@ -0,0 +1,55 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import socket
+import select
+
+from . import const
+
+# hands data connections from the session dispatcher to the session process with the
+# same run_id, over a unix socketpair per session (see session_dispatcher_class)
+#
+#   tcp   "tcp" with the accepted data socket attached (SCM_RIGHTS)
+#   udp   "udp <ip> <port>", the client addr of the flow, the session connects its own socket
+
+MAX_HANDOFF_MSG_LEN = 128
+
+
+def create_handoff_socketpair():
+    # one message per data connection, boundaries kept
+    return socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+
+
+# dispatcher
+def send_tcp_data_connection(handoff_sock, data_sock):
+    socket.send_fds(handoff_sock, [ b"tcp" ], [ data_sock.fileno() ])
+
+
+# dispatcher
+def send_udp_data_flow(handoff_sock, client_data_addr):
+    handoff_sock.sendall("udp {} {}".format(client_data_addr[0], client_data_addr[1]).encode())
+
+
+# session, returns ("tcp", data_sock) or ("udp", client_data_addr)
+def recv_data_connection(handoff_sock):
+    ready_list, _, _ = select.select([ handoff_sock ], [], [], const.SOCKET_TIMEOUT_SEC)
+
+    if len(ready_list) == 0:
+        raise Exception("ERROR: timeout waiting for data connection")
+
+    msg_bytes, fd_list, _, _ = socket.recv_fds(handoff_sock, MAX_HANDOFF_MSG_LEN, 1)
+
+    if len(msg_bytes) == 0:
+        raise Exception("ERROR: session dispatcher closed the handoff socket")
+
+    w = msg_bytes.decode().split(" ")
+
+    if w[0] == "tcp":
+        if len(fd_list) != 1:
+            raise Exception("ERROR: tcp data connection handoff without a socket")
+        return "tcp", socket.socket(fileno=fd_list[0])
+
+    if w[0] == "udp":
+        return "udp", (w[1], int(w[2]))
+
+    raise Exception("ERROR: invalid data connection handoff: {}".format(msg_bytes))
@@ -0,0 +1,104 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import time
+import multiprocessing
+
+from . import const
+
+# live counters of one test on the server, for the metrics exporter (see metrics_exporter_class)
+#
+# a plain array of doubles in shared memory, created by the session dispatcher before it
+# starts the session, and inherited by the session and its worker processes.  each slot has
+# a single writer, so no lock is needed, and the workers write only at interval boundaries
+# (every SAMPLE_INTERVAL_SEC), never per packet.  the dispatcher reads it when it renders
+# the metrics.
+#
+#   per stream   bytes received, packets received (recv calls for tcp), goodput bits per
+#                second in the last interval.  written by the server data receiver of the
+#                stream (up), or by the server control receiver from the interval records of
+#                the client data receivers (down)
+#   rtt          seconds, latest interval record, written by the server control receiver
+#                (down only, in the up direction the client measures rtt)
+#   per worker   cpu seconds, written by the worker itself
+
+STREAM_BYTES_RECEIVED = 0
+STREAM_PKTS_RECEIVED = 1
+STREAM_GOODPUT_BPS = 2
+NUM_STREAM_FIELDS = 3
+
+# control receiver, then one data sender or data receiver per stream
+CONTROL_RECEIVER_WORKER_IDX = 0
+
+RTT_OFFSET = 0
+STREAM_OFFSET = 1
+WORKER_CPU_OFFSET = STREAM_OFFSET + (const.MAX_PARALLEL_STREAMS * NUM_STREAM_FIELDS)
+ARRAY_SIZE = WORKER_CPU_OFFSET + 1 + const.MAX_PARALLEL_STREAMS
+
+
+def get_stream_worker_idx(stream_id):
+    return 1 + stream_id
+
+
+class SessionMetricsClass:
+
+    def __init__(self):
+        # zeroed
+        self.array = multiprocessing.RawArray('d', ARRAY_SIZE)
+
+
+    def get_stream_offset(self, stream_id, field):
+        return STREAM_OFFSET + (stream_id * NUM_STREAM_FIELDS) + field
+
+
+    # writers
+
+    def add_stream_interval(self, stream_id, interval_bytes_received, interval_pkts_received, interval_duration_sec):
+        self.array[self.get_stream_offset(stream_id, STREAM_BYTES_RECEIVED)] += interval_bytes_received
+        self.array[self.get_stream_offset(stream_id, STREAM_PKTS_RECEIVED)] += interval_pkts_received
+
+        if interval_duration_sec > 0:
+            self.array[self.get_stream_offset(stream_id, STREAM_GOODPUT_BPS)] = (interval_bytes_received * 8) / interval_duration_sec
+
+
+    # interval record processed by the server control receiver
+    def add_r_record(self, r_record):
+        self.add_stream_interval(
+            r_record.r_stream_id,
+            r_record.r_receiver_interval_bytes_received,
+            r_record.r_receiver_interval_pkts_received,
+            r_record.r_receiver_interval_duration_sec)
+
+        self.array[RTT_OFFSET] = r_record.rtt_sec
+
+
+    # cpu time of the calling process so far
+    def set_worker_cpu_time(self, worker_idx):
+        self.array[WORKER_CPU_OFFSET + worker_idx] = time.process_time()
+
+
+    # readers
+
+    def get_stream_sum(self, field):
+        return sum(self.array[ STREAM_OFFSET + field : WORKER_CPU_OFFSET : NUM_STREAM_FIELDS ])
+
+
+    def get_bytes_received(self):
+        return self.get_stream_sum(STREAM_BYTES_RECEIVED)
+
+
+    def get_pkts_received(self):
+        return self.get_stream_sum(STREAM_PKTS_RECEIVED)
+
+
+    def get_goodput_bps(self):
+        return self.get_stream_sum(STREAM_GOODPUT_BPS)
+
+
+    # zero until the first interval record
+    def get_rtt_sec(self):
+        return self.array[RTT_OFFSET]
+
+
+    def get_cpu_sec(self):
+        return sum(self.array[ WORKER_CPU_OFFSET : ARRAY_SIZE ])
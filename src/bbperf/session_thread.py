@@ -0,0 +1,209 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import time
+import socket
+import multiprocessing
+
+from . import data_sender_thread
+from . import data_receiver_thread
+from . import control_receiver_thread
+from . import udp_string_sender_thread
+from . import session_handoff_helper
+from . import util
+from . import const
+from . import tcp_helper
+
+from .tcp_control_connection_class import TcpControlConnectionClass
+from .ready_event_class import ReadyEventClass
+
+
+# one test on the server, started by the session dispatcher once the test is admitted (the
+# dispatcher has sent the control initial ack and read client_args), the data connections
+# of the test arrive on handoff_sock
+#
+# session_metrics is a SessionMetricsClass, or None without a metrics exporter
+#
+# dispatcher_sock_list is what the dispatcher had open when it started us, see
+# SessionDispatcherClass.get_dispatcher_sock_list()
+#
+# not a daemon process, so it can have processes of its own
+# falling off the end of this method terminates the process
+def run(args, server_addr, control_sock, client_control_addr, run_id, client_args, handoff_sock, session_metrics, dispatcher_sock_list):
+    for dispatcher_sock in dispatcher_sock_list:
+        dispatcher_sock.close()
+
+    control_conn = TcpControlConnectionClass(control_sock)
+    control_conn.set_args(args)
+
+    curr_client_start_time = time.time()
+
+    client_args.control_protocol = control_conn.send_control_args_ack(client_args)
+
+    control_conn.set_args(client_args)
+
+    # accept data connections
+
+    data_sock_list = []
+    client_data_addr_list = []
+    doneevent_list = []
+
+    # one flow per stream, all under the same run_id
+    # the client sets up its flows one at a time, and so do we
+    for stream_id in range(client_args.parallel):
+        if client_args.verbosity:
+            print("waiting for data connection {}, run_id {}".format(stream_id, run_id), flush=True)
+
+        data_conn_type, data_conn = session_handoff_helper.recv_data_connection(handoff_sock)
+
+        if data_conn_type != ("udp" if client_args.udp else "tcp"):
+            raise Exception("ERROR: data connection invalid (wrong protocol) run_id {} received {}".format(run_id, data_conn_type))
+
+        if client_args.udp:
+            # data connection is udp
+            client_data_addr = data_conn
+
+            # the dispatcher caught the first packet on its unconnected socket on the server port,
+            # this flow gets its own socket there, once it is connected to the client flow the
+            # kernel only hands it datagrams from that flow
+            data_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            data_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            data_sock.bind(server_addr)
+            data_sock.connect(client_data_addr)
+            data_sock.settimeout(const.SOCKET_TIMEOUT_SEC)
+
+            if client_args.verbosity:
+                print("created udp data connection, client {}, server {}".format(client_data_addr, server_addr), flush=True)
+
+            if client_args.verbosity:
+                print("sending data initial ack (async udp)", flush=True)
+
+            # start and keep sending the data initial ack asynchronously
+            readyevent = ReadyEventClass()
+            doneevent = multiprocessing.Event()
+            udp_data_initial_ack_sender_process = multiprocessing.Process(
+                name = "udpdatainitialacksender",
+                target = udp_string_sender_thread.run,
+                args = (readyevent, doneevent, client_args, data_sock, client_data_addr, const.UDP_DATA_INITIAL_ACK),
+                daemon = True)
+            udp_data_initial_ack_sender_process.start()
+            readyevent.wait_until_ready(udp_data_initial_ack_sender_process)
+
+            doneevent_list.append(doneevent)
+
+        else:
+            # data connection is tcp
+            data_sock = data_conn
+            data_sock.settimeout(const.SOCKET_TIMEOUT_SEC)
+            tcp_helper.set_congestion_control(client_args, data_sock)
+            tcp_helper.set_tcp_notsent_lowat(data_sock, client_args.tcp_notsent_lowat)
+            tcp_helper.set_tcp_target_rate(client_args, data_sock)
+            client_data_addr = data_sock.getpeername()
+
+            if client_args.verbosity:
+                print("accepted tcp data connection, client {}, server {}".format(
+                    client_data_addr, server_addr), flush=True)
+
+        data_sock_list.append(data_sock)
+        client_data_addr_list.append(client_data_addr)
+
+    # the dispatcher keeps its end until we exit
+    handoff_sock.close()
+
+    shared_run_mode = multiprocessing.Value('i', const.RUN_MODE_CALIBRATING)
+    shared_udp_sending_rate_pps = multiprocessing.Value('i', const.UDP_DEFAULT_INITIAL_RATE)
+    # bytes per second, zero is not paced
+    shared_tcp_pacing_rate = multiprocessing.Value('d', 0.0)
+
+    if client_args.reverse:
+        # direction down
+
+        control_conn.send_setup_complete_message()
+
+        readyevent = ReadyEventClass()
+
+        control_receiver_process = multiprocessing.Process(
+            name = "controlreceiver",
+            target = control_receiver_thread.run_recv_term_send,
+            args = (readyevent, client_args, control_conn, shared_run_mode, shared_udp_sending_rate_pps, shared_tcp_pacing_rate, session_metrics),
+            daemon = True)
+
+        data_sender_process_list = []
+
+        for stream_id, data_sock in enumerate(data_sock_list):
+            data_sender_process = multiprocessing.Process(
+                name = "datasender{}".format(stream_id),
+                target = data_sender_thread.run,
+                args = (client_args, data_sock, client_data_addr_list[stream_id], shared_run_mode, shared_udp_sending_rate_pps, shared_tcp_pacing_rate,
+                        None, session_metrics, stream_id),
+                daemon = True)
+
+            data_sender_process_list.append(data_sender_process)
+
+        control_conn.wait_for_start_message()
+
+        if client_args.udp:
+            # stop sending UDP data init acks
+            if client_args.verbosity:
+                print("stopping sending udp data initial acks to client", flush=True)
+            for doneevent in doneevent_list:
+                doneevent.set()
+
+        control_receiver_process.start()
+        readyevent.wait_until_ready(control_receiver_process)
+
+        for data_sender_process in data_sender_process_list:
+            data_sender_process.start()
+
+        thread_list = []
+        thread_list.append(control_receiver_process)
+        thread_list.extend(data_sender_process_list)
+
+    else:
+        # direction up
+
+        thread_list = []
+
+        # data receivers share the control connection
+        control_send_lock = multiprocessing.Lock()
+        shared_num_receivers_running = multiprocessing.Value('i', len(data_sock_list))
+
+        for stream_id, data_sock in enumerate(data_sock_list):
+            readyevent = ReadyEventClass()
+
+            data_receiver_process = multiprocessing.Process(
+                name = "datareceiver{}".format(stream_id),
+                target = data_receiver_thread.run,
+                args = (readyevent, client_args, control_conn, data_sock, client_data_addr_list[stream_id], stream_id, control_send_lock, shared_num_receivers_running,
+                        session_metrics),
+                daemon = True)
+
+            data_receiver_process.start()
+            readyevent.wait_until_ready(data_receiver_process)
+
+            thread_list.append(data_receiver_process)
+
+        control_conn.send_setup_complete_message()
+
+    print("test running, {} {}, run_id {}, control conn addr {}, data conn addr {}, server addr {}, elapsed startup time {} seconds".format(
+          "udp" if client_args.udp else "tcp",
+          "down" if client_args.reverse else "up",
+          run_id,
+          client_control_addr,
+          client_data_addr_list,
+          server_addr,
+          (time.time() - curr_client_start_time)),
+          flush=True)
+
+    start_time_sec = time.time()
+
+    util.wait_for_threads(thread_list, start_time_sec + client_args.max_run_time_failsafe_sec)
+
+    if client_args.verbosity:
+        print("test finished, cleaning up", flush=True)
+
+    for data_sock in data_sock_list:
+        util.done_with_socket(data_sock)
+    control_conn.close()
+
+    print("client ended, run_id {}".format(run_id), flush=True)
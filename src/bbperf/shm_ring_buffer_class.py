@@ -0,0 +1,161 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import os
+import struct
+import multiprocessing.connection
+
+from multiprocessing import shared_memory
+
+from . import const
+
+# single producer, single consumer ring of fixed size slots in shared memory
+#
+# the control receiver process puts records, the output loop takes them in batches.
+# the head (next slot to write) is only written by the producer and the tail (next slot
+# to read) only by the consumer, so no lock is needed.  both are free running counters,
+# the slot is the counter modulo the number of slots.
+#
+# nobody polls.  the producer writes a byte to the record pipe after every put, and the
+# consumer sleeps on that pipe (and on whatever else it passes to wait()) when the ring is
+# empty.  records come at about 10 per second per stream, so a byte per put costs nothing,
+# and as the byte is written after the head, a wakeup cannot be missed.  the same goes the
+# other way when the ring is full: the consumer writes a byte to the space pipe after it
+# frees slots, and the producer sleeps on it.
+#
+# must be created before the processes are forked, the owner calls close() at the end
+
+# head and tail each on their own cache line
+HEAD_OFFSET = 0
+TAIL_OFFSET = 64
+RING_HEADER_SIZE = 128
+
+COUNTER_STRUCT = struct.Struct('Q')
+# every slot starts with the length of the record in it
+SLOT_LEN_STRUCT = struct.Struct('H')
+
+
+class ShmRingBufferClass:
+
+    def __init__(self, max_record_size, num_slots):
+        self.max_record_size = max_record_size
+        self.slot_size = SLOT_LEN_STRUCT.size + max_record_size
+        self.num_slots = num_slots
+
+        self.shm = shared_memory.SharedMemory(create=True, size=RING_HEADER_SIZE + (self.slot_size * num_slots))
+        self.buf = self.shm.buf
+        self.buf[ 0 : RING_HEADER_SIZE ] = bytes(RING_HEADER_SIZE)
+
+        # producer -> consumer, a record was put
+        self.record_read_fd, self.record_write_fd = os.pipe()
+        # consumer -> producer, slots were freed
+        self.space_read_fd, self.space_write_fd = os.pipe()
+
+        for fd in [ self.record_read_fd, self.record_write_fd, self.space_read_fd, self.space_write_fd ]:
+            os.set_blocking(fd, False)
+
+        self.num_full_waits = 0
+
+
+    def get_counter(self, offset):
+        return COUNTER_STRUCT.unpack_from(self.buf, offset)[0]
+
+
+    def set_counter(self, offset, value):
+        COUNTER_STRUCT.pack_into(self.buf, offset, value)
+
+
+    def get_slot_offset(self, idx):
+        return RING_HEADER_SIZE + ((idx % self.num_slots) * self.slot_size)
+
+
+    # a byte to the other side, if the pipe is full a wakeup is pending anyway
+    def notify(self, write_fd):
+        try:
+            os.write(write_fd, b'w')
+        except BlockingIOError:
+            pass
+
+
+    def drain(self, read_fd):
+        try:
+            os.read(read_fd, const.BUFSZ)
+        except BlockingIOError:
+            pass
+
+
+    # producer only
+    def put(self, record):
+        record_len = len(record)
+
+        if record_len > self.max_record_size:
+            raise Exception("ERROR: record too big for ring buffer: {} bytes".format(record_len))
+
+        head = self.get_counter(HEAD_OFFSET)
+
+        # full, the output loop is behind, wait for it rather than drop the record
+        while (head - self.get_counter(TAIL_OFFSET)) >= self.num_slots:
+            self.num_full_waits += 1
+
+            if len(multiprocessing.connection.wait([ self.space_read_fd ], const.RESULTS_RING_FULL_MAX_WAIT_SEC)) == 0:
+                raise Exception("ERROR: results ring full for {} seconds".format(const.RESULTS_RING_FULL_MAX_WAIT_SEC))
+
+            self.drain(self.space_read_fd)
+
+        slot_offset = self.get_slot_offset(head)
+
+        SLOT_LEN_STRUCT.pack_into(self.buf, slot_offset, record_len)
+        data_offset = slot_offset + SLOT_LEN_STRUCT.size
+        self.buf[ data_offset : data_offset + record_len ] = record
+
+        # publish
+        self.set_counter(HEAD_OFFSET, head + 1)
+
+        self.notify(self.record_write_fd)
+
+
+    # consumer only, returns every record in the ring (as bytes), possibly none
+    def get_batch(self):
+        tail = self.get_counter(TAIL_OFFSET)
+        head = self.get_counter(HEAD_OFFSET)
+
+        if head == tail:
+            return []
+
+        record_list = []
+
+        for idx in range(tail, head):
+            slot_offset = self.get_slot_offset(idx)
+            record_len = SLOT_LEN_STRUCT.unpack_from(self.buf, slot_offset)[0]
+            data_offset = slot_offset + SLOT_LEN_STRUCT.size
+            record_list.append(bytes(self.buf[ data_offset : data_offset + record_len ]))
+
+        # free the slots
+        self.set_counter(TAIL_OFFSET, head)
+
+        self.notify(self.space_write_fd)
+
+        return record_list
+
+
+    # consumer only, returns when the ring is not empty, one of the objects in
+    # other_wait_list is ready (see multiprocessing.connection.wait), or after timeout_sec
+    def wait(self, timeout_sec, other_wait_list=None):
+        if other_wait_list is None:
+            other_wait_list = []
+
+        if self.get_counter(HEAD_OFFSET) == self.get_counter(TAIL_OFFSET):
+            multiprocessing.connection.wait([ self.record_read_fd ] + other_wait_list, max(0, timeout_sec))
+
+        # the records of the bytes read here are in the ring already
+        self.drain(self.record_read_fd)
+
+
+    # owner only, after the other processes are done with it
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        self.shm.unlink()
+
+        for fd in [ self.record_read_fd, self.record_write_fd, self.space_read_fd, self.space_write_fd ]:
+            os.close(fd)
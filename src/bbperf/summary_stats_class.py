@@ -0,0 +1,210 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import sys
+
+from . import const
+
+from .quantile_sketch_class import QuantileSketchClass
+
+# the summary statistics of a set of interval entries (the valid entries of the test, or
+# the entries of one sweep step), updated as every entry is added, so the entries do not
+# have to be kept (see JsonOutputClass)
+#
+# entries are added in received time order, which is the order the records arrive in
+
+PERCENTILE_KEY_LIST = [
+    "loaded_rtt_ms",
+    "receiver_throughput_rate_mbps",
+    "excess_buffered_bytes",
+    "receiver_pps",
+    "pkt_loss_percent" ]
+
+# parallel streams, the aggregate of the streams at every record
+AGGREGATE_KEY_LIST = [
+    "receiver_throughput_rate_mbps",
+    "buffered_bytes",
+    "excess_buffered_bytes",
+    "receiver_pps" ]
+
+# the keys get_sum_of_stream_means() works for
+STREAM_MEAN_KEY_LIST = [
+    "sender_throughput_rate_mbps",
+    "receiver_throughput_rate_mbps" ]
+
+
+# the stats of the columns of the sketch, named by column_key_list, go into stats_dict,
+# for the keys in key_list (default all of them).  percent_list is args.summary_percent_list.
+def add_column_stats(stats_dict, column_key_list, sketch, percent_list, key_list=None):
+    percentile_table = sketch.get_percentile_table(percent_list)
+    count, min_list, max_list, mean_list, m2_list = sketch.get_moments()
+
+    for column_idx, key in enumerate(column_key_list):
+        if (key_list is not None) and (key not in key_list):
+            continue
+
+        column_dict = stats_dict[key] = {}
+        for percent, value in zip(percent_list, percentile_table[:, column_idx].tolist()):
+            # p1, p99.9
+            column_dict["p{:g}".format(percent)] = value
+        column_dict["mean"] = float(mean_list[column_idx])
+        column_dict["stddev"] = float((m2_list[column_idx] / count) ** 0.5)
+        column_dict["min"] = float(min_list[column_idx])
+        column_dict["max"] = float(max_list[column_idx])
+
+
+# single column sketch
+def add_percentiles(stats_dict, key, sketch, percent_list):
+    add_column_stats(stats_dict, [ key ], sketch, percent_list)
+
+
+# the cdf of the columns of the sketch, as (value, percent) points at const.SUMMARY_CDF_PERCENT_LIST
+def get_column_cdf(column_key_list, sketch):
+    percentile_table = sketch.get_percentile_table(const.SUMMARY_CDF_PERCENT_LIST)
+
+    return { key: [ [ value, percent ] for percent, value in zip(const.SUMMARY_CDF_PERCENT_LIST, percentile_table[:, column_idx].tolist()) ]
+             for column_idx, key in enumerate(column_key_list) }
+
+
+class SummaryStatsClass:
+
+    # num_streams is 1, or args.parallel for the parallel stream stats
+    def __init__(self, args, num_streams):
+        self.args = args
+        self.num_streams = num_streams
+
+        self.num_samples = 0
+
+        # one column per key
+        self.sketch = QuantileSketchClass(len(PERCENTILE_KEY_LIST))
+
+        # stream id -> key -> [ sum, count ]
+        self.stream_sum_dict = {}
+
+        if num_streams > 1:
+            # stream id -> SummaryStatsClass of the stream
+            self.stream_stats_dict = {}
+            self.latest_entry_per_stream = {}
+            self.aggregate_sketch = QuantileSketchClass(len(AGGREGATE_KEY_LIST))
+            self.aggregate_pkt_loss_percent_sketch = QuantileSketchClass()
+
+
+    def add_entry(self, entry):
+        self.num_samples += 1
+
+        self.sketch.add([ entry[key] for key in PERCENTILE_KEY_LIST ])
+
+        stream_sums = self.stream_sum_dict.setdefault(entry["stream_id"], { key: [ 0.0, 0 ] for key in STREAM_MEAN_KEY_LIST })
+        for key in STREAM_MEAN_KEY_LIST:
+            stream_sums[key][0] += entry[key]
+            stream_sums[key][1] += 1
+
+        if self.num_streams > 1:
+            self.add_parallel_entry(entry)
+
+
+    # parallel streams
+    #
+    # the interval records of the streams are not aligned in time, so the aggregate is
+    # sampled every time a record arrives, as the sum of the latest record of every stream
+    #
+    # rtt is not additive, that is the percentiles over the records of all streams, and
+    # so is loss for tcp (where it is always -1)
+    def add_parallel_entry(self, entry):
+        stream_id = entry["stream_id"]
+
+        if stream_id not in self.stream_stats_dict:
+            self.stream_stats_dict[stream_id] = SummaryStatsClass(self.args, 1)
+        self.stream_stats_dict[stream_id].add_entry(entry)
+
+        self.latest_entry_per_stream[stream_id] = entry
+
+        if len(self.latest_entry_per_stream) < self.num_streams:
+            # not every stream has reported yet
+            return
+
+        latest_entries = self.latest_entry_per_stream.values()
+
+        self.aggregate_sketch.add([ sum(e[key] for e in latest_entries) for key in AGGREGATE_KEY_LIST ])
+
+        if self.args.udp:
+            pkts_sent = sum(e["pkts_sent"] for e in latest_entries)
+            pkts_dropped = sum(e["pkts_dropped"] for e in latest_entries)
+            self.aggregate_pkt_loss_percent_sketch.add((pkts_dropped * 100.0) / pkts_sent if pkts_sent > 0 else 0.0)
+
+
+    def get_num_samples(self):
+        return self.num_samples
+
+
+    # mean of each stream, summed over the streams
+    def get_sum_of_stream_means(self, key):
+        return sum(stream_sums[key][0] / stream_sums[key][1] for stream_sums in self.stream_sum_dict.values())
+
+
+    def add_stats_to(self, stats_dict):
+        if self.num_streams > 1:
+            self.add_parallel_stats_to(stats_dict)
+        else:
+            self.add_percentile_stats_to(stats_dict)
+
+
+    def add_percentile_stats_to(self, stats_dict):
+        add_column_stats(stats_dict, PERCENTILE_KEY_LIST, self.sketch, self.args.summary_percent_list)
+
+
+    def get_cdf(self):
+        return get_column_cdf(PERCENTILE_KEY_LIST, self.sketch)
+
+
+    def add_parallel_stats_to(self, stats_dict):
+        stats_dict["num_streams"] = self.num_streams
+
+        add_column_stats(stats_dict, PERCENTILE_KEY_LIST, self.sketch, self.args.summary_percent_list, [ "loaded_rtt_ms" ])
+
+        if self.aggregate_sketch.get_count() == 0:
+            print("ERROR: not every stream has valid samples, no aggregate statistics",
+                  file=sys.stderr,
+                  flush=True)
+        else:
+            add_column_stats(stats_dict, AGGREGATE_KEY_LIST, self.aggregate_sketch, self.args.summary_percent_list)
+
+        if self.args.udp:
+            if self.aggregate_pkt_loss_percent_sketch.get_count() > 0:
+                add_percentiles(stats_dict, "pkt_loss_percent", self.aggregate_pkt_loss_percent_sketch, self.args.summary_percent_list)
+        else:
+            add_column_stats(stats_dict, PERCENTILE_KEY_LIST, self.sketch, self.args.summary_percent_list, [ "pkt_loss_percent" ])
+
+        # per stream breakdown
+
+        stream_mean_throughput_list = []
+        streams_list = stats_dict["streams"] = []
+
+        for stream_id in sorted(self.stream_stats_dict.keys()):
+            stream_stats = self.stream_stats_dict[stream_id]
+
+            stream_dict = {}
+            stream_dict["stream_id"] = stream_id
+            stream_dict["num_samples"] = stream_stats.get_num_samples()
+            stream_stats.add_percentile_stats_to(stream_dict)
+
+            mean_throughput = stream_stats.get_sum_of_stream_means("receiver_throughput_rate_mbps")
+            stream_dict["mean_receiver_throughput_rate_mbps"] = mean_throughput
+            stream_mean_throughput_list.append(mean_throughput)
+
+            streams_list.append(stream_dict)
+
+        # streams without any valid samples count as zero throughput
+        stream_mean_throughput_list.extend([0.0] * (self.num_streams - len(stream_mean_throughput_list)))
+
+        stats_dict["fairness_index"] = self.get_jain_fairness_index(stream_mean_throughput_list)
+
+
+    # Jain's fairness index: 1.0 when all streams get the same throughput, 1/n when one stream gets everything
+    def get_jain_fairness_index(self, values_list):
+        sum_of_squares = sum(x * x for x in values_list)
+
+        if sum_of_squares == 0:
+            return None
+
+        return (sum(values_list) ** 2) / (len(values_list) * sum_of_squares)
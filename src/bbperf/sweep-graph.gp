@@ -0,0 +1,48 @@
+#!/usr/bin/gnuplot
+
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+#datafile1 = "/tmp/bbperf-sweep-data-aa97m9xl"
+
+# columns:
+#   1 step  2 offered_load_percent  3 sender_Mbps  4 goodput_Mbps  5 rtt_p50_ms  6 rtt_p99_ms
+#   7 excess_buffered_bytes_p50  8 excess_buffered_bytes_p99  9 pkt_loss_percent_p50
+
+pngfile1 = datafile1.".png"
+
+set grid
+
+set key left top
+set key box opaque
+
+set style data linespoints
+
+# noenhanced to avoid need to escape underscores in labels
+set terminal pngcairo size 1200,1000 noenhanced
+set output pngfile1
+
+set multiplot title graphtitle layout 3,1
+
+set lmargin 12
+
+# dt 1 (solid), dt 2 (dotted), dt 4 (dot dash)
+# lc 1 (purple), lc 4 (orange), lc 6 (blue), lc 7 (red), lc 8 (black)
+
+set xlabel "goodput (Mbps)"
+set ylabel "ms"
+
+plot datafile1 using 4:5 title "RTT p50" lw 2 lc 6 pt 7, \
+     ""        using 4:6 title "RTT p99" lw 2 lc 7 pt 7
+
+set xlabel "offered load (percent of capacity estimate)"
+set ylabel "bytes"
+
+plot datafile1 using 2:7 title "excess buffered p50" lw 2 lc 6 pt 7, \
+     ""        using 2:8 title "excess buffered p99" lw 2 lc 7 pt 7
+
+set ylabel "percent"
+
+plot datafile1 using 2:9 title "pkt loss % p50" lw 2 lc 6 pt 7
+
+unset multiplot
@@ -0,0 +1,120 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import numpy
+
+from . import const
+
+# stepped load sweep (--sweep)
+#
+# once samples are valid, the flow keeps running at full rate (udp autorate, or unpaced tcp)
+# for SWEEP_CAPACITY_ESTIMATE_TIME_SEC to estimate capacity.  then the offered load steps
+# through args.sweep_load_percent_list, each for args.sweep_step_time, and the test stops
+# after the last step.
+#
+# udp steps set shared_udp_sending_rate_pps (the udp rate manager is idle during the sweep),
+# tcp steps set shared_tcp_pacing_rate, which the data sender applies with SO_MAX_PACING_RATE.
+# both are per flow.
+#
+# r_record.sweep_step is the index of the step a record belongs to, or SWEEP_STEP_NONE
+# for records before the sweep and records taken while a step settles
+class SweepManagerClass:
+
+    # args are client args
+    def __init__(self, args, shared_run_mode, shared_udp_sending_rate_pps, shared_tcp_pacing_rate):
+        self.args = args
+        self.shared_run_mode = shared_run_mode
+        self.shared_udp_sending_rate_pps = shared_udp_sending_rate_pps
+        self.shared_tcp_pacing_rate = shared_tcp_pacing_rate
+        self.num_flows = args.parallel
+        self.load_percent_list = args.sweep_load_percent_list
+
+        self.capacity_estimate_start_time = None
+        self.latest_rate_per_flow = {}
+        self.aggregate_rate_list = []
+        # pps for udp, bytes per second for tcp
+        self.capacity = None
+
+        self.step_idx = None
+        self.step_start_time = None
+
+
+    # true once the sweep sets the sending rate
+    def is_controlling_rate(self):
+        return self.capacity is not None
+
+
+    # control receiver calls this after the run mode manager, for every record
+    def update(self, r_record, curr_time):
+        r_record.sweep_step = const.SWEEP_STEP_NONE
+
+        if self.shared_run_mode.value != const.RUN_MODE_RUNNING:
+            return
+
+        if not r_record.is_sample_valid:
+            return
+
+        if self.capacity is None:
+            self.update_capacity_estimate(r_record, curr_time)
+            return
+
+        if curr_time > (self.step_start_time + self.args.sweep_step_time):
+            if (self.step_idx + 1) >= len(self.load_percent_list):
+                # all done
+                self.shared_run_mode.value = const.RUN_MODE_STOP
+                return
+
+            self.start_step(self.step_idx + 1, curr_time)
+            return
+
+        if curr_time > (self.step_start_time + const.SWEEP_STEP_SETTLE_TIME_SEC):
+            r_record.sweep_step = self.step_idx
+
+
+    def update_capacity_estimate(self, r_record, curr_time):
+        if self.capacity_estimate_start_time is None:
+            self.capacity_estimate_start_time = curr_time
+
+        if self.args.udp:
+            self.latest_rate_per_flow[r_record.r_stream_id] = r_record.receiver_pps
+        else:
+            self.latest_rate_per_flow[r_record.r_stream_id] = r_record.receiver_interval_rate_bytes_per_sec
+
+        if len(self.latest_rate_per_flow) == self.num_flows:
+            self.aggregate_rate_list.append(sum(self.latest_rate_per_flow.values()))
+
+        if curr_time < (self.capacity_estimate_start_time + const.SWEEP_CAPACITY_ESTIMATE_TIME_SEC):
+            return
+
+        if len(self.aggregate_rate_list) == 0:
+            raise Exception("ERROR: sweep: no capacity estimate, not every stream reported")
+
+        self.capacity = numpy.percentile(self.aggregate_rate_list, 50)
+
+        if self.args.verbosity:
+            print("SweepManager: capacity estimate {:.0f} {}".format(
+                self.capacity, "pps" if self.args.udp else "bytes/sec"), flush=True)
+
+        self.start_step(0, curr_time)
+
+
+    def start_step(self, step_idx, curr_time):
+        self.step_idx = step_idx
+        self.step_start_time = curr_time
+
+        flow_rate = (self.capacity * self.load_percent_list[step_idx]) / (100.0 * self.num_flows)
+
+        if self.args.udp:
+            new_rate = int(flow_rate)
+            if new_rate < const.UDP_MIN_RATE:
+                new_rate = const.UDP_MIN_RATE
+            if new_rate > const.UDP_MAX_RATE:
+                new_rate = const.UDP_MAX_RATE
+            self.shared_udp_sending_rate_pps.value = new_rate
+        else:
+            new_rate = flow_rate
+            self.shared_tcp_pacing_rate.value = new_rate
+
+        if self.args.verbosity:
+            print("SweepManager: step {} load {}% rate per flow {:.0f} {}".format(
+                step_idx, self.load_percent_list[step_idx], new_rate, "pps" if self.args.udp else "bytes/sec"), flush=True)
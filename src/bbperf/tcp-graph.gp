@@ -38,8 +38,9 @@ plot datafile1 using ($2-XRANGE_min):7 title "receiver throughput (L7)" lw 2 lc
 
 set ylabel "ms"
 
-plot datafile1 using ($2-XRANGE_min):8 title "unloaded RTT (L7)" lw 2 lc 1, \
-     ""        using ($2-XRANGE_min):9 title "RTT (L7)"          lw 2 lc 6
+plot datafile1 using ($2-XRANGE_min):8  title "unloaded RTT (L7)" lw 2 lc 1, \
+     ""        using ($2-XRANGE_min):9  title "RTT (L7)"          lw 2 lc 6, \
+     ""        using ($2-XRANGE_min):17 title "srtt (kernel)"     lw 2 lc 7
 
 unset multiplot
 
@@ -1,13 +1,14 @@
 # Copyright (c) 2024 Cloudflare, Inc.
 # Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
 
-import json
-import argparse
 import socket
 import select
+import collections
 
 from . import const
 from . import util
+from . import timestamp_helper
+from . import control_record_helper
 
 from .exceptions import PeerDisconnectedException
 
@@ -20,7 +21,18 @@ class TcpControlConnectionClass:
         self.control_sock = control_sock
         self.args = None
 
+        # bytes before read_offset have been consumed, they are dropped from the front of the
+        # buffer only once they are at least half of it, so no byte is moved more than once
         self.read_buffer = bytearray()
+        self.read_offset = 0
+        # while waiting for a substr, find() resumes from here instead of rescanning
+        self.scan_offset = 0
+
+        # see enable_kernel_timestamps()
+        self.kernel_timestamps = False
+        # [ end offset in read_buffer, kernel receive time ] for each recv not fully consumed yet
+        self.recv_time_list = collections.deque()
+        self.last_record_kernel_time_sec = None
 
         # set TCP_NODELAY because the control messages back to the
         # sender from the data receiver are part of the RTT measurement
@@ -31,11 +43,25 @@ class TcpControlConnectionClass:
         self.args = args
 
 
+    # from now on, last_record_kernel_time_sec is the time the kernel received the recv that
+    # completed the most recently consumed record (not that of the latest recv, which may
+    # hold later records)
+    def enable_kernel_timestamps(self):
+        timestamp_helper.enable_rx_timestamps(self.control_sock)
+        self.kernel_timestamps = True
+
+
     def send_bytes(self, payload_bytes):
         self.control_sock.sendall(payload_bytes)
 
         if self.args.verbosity > 3:
-            print("control conn sending: {}".format(payload_bytes.decode()), flush=True)
+            # binary records do not decode as text
+            if self.args.control_protocol == "binary":
+                payload_str = bytes(payload_bytes).hex()
+            else:
+                payload_str = payload_bytes.decode()
+
+            print("control conn sending: {}".format(payload_str), flush=True)
 
 
     def send_string(self, str0):
@@ -55,33 +81,6 @@ class TcpControlConnectionClass:
             print("sent control initial string", flush=True)
 
 
-    def wait_for_control_initial_string(self):
-
-        print("waiting to receive control initial string from client", flush=True)
-
-        # "control " + uuid of 36 characters
-        len_str = 8 + 36
-
-        received_bytes = self.recv_exact_num_bytes(len_str)
-
-        received_str = received_bytes.decode()
-
-        uuid = received_str[8:]
-
-        print("received control initial string: run_id: {}".format(uuid), flush=True)
-
-        return uuid
-
-
-    def send_control_initial_ack(self):
-
-        print("sending control initial ack", flush=True)
-
-        self.send_string(const.TCP_CONTROL_INITIAL_ACK)
-
-        print("sent control initial ack", flush=True)
-
-
     def wait_for_control_initial_ack(self):
 
         if self.args.verbosity:
@@ -103,60 +102,60 @@ class TcpControlConnectionClass:
         if self.args.verbosity:
             print("sending args to server: {}".format(vars(args)), flush=True)
 
-        args_json = json.dumps(vars(args))
-
-        self.send_string(args_json)
+        self.send_string(util.client_args_to_json(args))
 
         if self.args.verbosity:
             print("sent args to server", flush=True)
 
 
-    def wait_for_args_from_client(self):
-
-        print("waiting for args from client", flush=True)
-
-        # starts with "{" and ends with "}"
-
-        substr_idx = self.recv_into_buffer_until_substr_found(b'}')
-
-        received_bytes = self.read_buffer[ 0 : substr_idx + 1 ]
-        self.read_buffer = self.read_buffer[ substr_idx + 1 : ]
-
-        received_str = received_bytes.decode()
-
-        args_d = json.loads(received_str)
-
-        # recreate args as if it came directly from argparse
-        args = argparse.Namespace(**args_d)
-
-        print("received args from client: {}".format(vars(args)), flush=True)
+    # the ack also settles the control protocol: binary if the client asked for it
+    # returns the control protocol to use
+    def send_control_args_ack(self, client_args):
 
-        return args
+        if client_args.control_protocol in [ "auto", "binary" ]:
+            control_protocol = "binary"
+            args_ack = const.TCP_CONTROL_ARGS_ACK_BINARY
+        else:
+            control_protocol = "ascii"
+            args_ack = const.TCP_CONTROL_ARGS_ACK
 
+        print("sending control args ack, control protocol {}".format(control_protocol), flush=True)
 
-    def send_control_args_ack(self):
-
-        print("sending control args ack", flush=True)
-
-        self.send_string(const.TCP_CONTROL_ARGS_ACK)
+        self.send_string(args_ack)
 
         print("sent control args ack", flush=True)
 
+        return control_protocol
 
+
+    # the server may queue us first (see admission_controller_class)
+    # returns the control protocol to use
     def wait_for_control_args_ack(self):
 
         if self.args.verbosity:
             print("waiting for control args ack", flush=True)
 
-        received_bytes = self.recv_exact_num_bytes(len(const.TCP_CONTROL_ARGS_ACK))
+        while True:
+            # all replies are the same length
+            received_bytes = self.recv_exact_num_bytes(len(const.TCP_CONTROL_ARGS_ACK))
+
+            # raises ServerBusyException if we are to come back later
+            reply_type, reply_value = util.parse_control_args_reply(received_bytes.decode())
 
-        received_str = received_bytes.decode()
+            if reply_type == "ack":
+                control_protocol = reply_value
+                break
 
-        if received_str != const.TCP_CONTROL_ARGS_ACK:
-            raise Exception("ERROR: received invalid control args ack: {}".format(received_str))
+            if reply_type == "error":
+                error_str = self.recv_exact_num_bytes(reply_value).decode(errors="replace")
+                raise Exception("ERROR: the server cannot run this test: {}".format(error_str))
+
+            print("server busy, queued, estimated wait {} seconds".format(reply_value), flush=True)
 
         if self.args.verbosity:
-            print("received control args ack", flush=True)
+            print("received control args ack, control protocol {}".format(control_protocol), flush=True)
+
+        return control_protocol
 
 
     def send_setup_complete_message(self):
@@ -220,19 +219,68 @@ class TcpControlConnectionClass:
         if len(rlist) == 0:
             raise Exception("ERROR: select() timed out")
 
-        recv_bytes = self.control_sock.recv(max_bytes_to_read)
+        if self.kernel_timestamps:
+            recv_bytes, ancdata, _, _ = self.control_sock.recvmsg(max_bytes_to_read, timestamp_helper.RX_TIMESTAMP_CMSG_SPACE)
+        else:
+            recv_bytes = self.control_sock.recv(max_bytes_to_read)
 
         if len(recv_bytes) == 0:
             raise PeerDisconnectedException()
 
         self.read_buffer.extend(recv_bytes)
 
+        if self.kernel_timestamps:
+            self.recv_time_list.append([ len(self.read_buffer), timestamp_helper.get_rx_timestamp_sec(ancdata) ])
+
+
+    # number of bytes received but not consumed yet
+    def get_num_unread_bytes(self):
+        return len(self.read_buffer) - self.read_offset
+
+
+    # returns the next num_bytes unread bytes, and marks them as consumed
+    def consume(self, num_bytes):
+        received_bytes = self.read_buffer[ self.read_offset : self.read_offset + num_bytes ]
+
+        self.read_offset += num_bytes
+        self.scan_offset = self.read_offset
+
+        if self.kernel_timestamps:
+            self.update_last_record_kernel_time()
+
+        if self.read_offset > (len(self.read_buffer) // 2):
+            for recv_time in self.recv_time_list:
+                recv_time[0] -= self.read_offset
+            del self.read_buffer[ 0 : self.read_offset ]
+            self.read_offset = 0
+            self.scan_offset = 0
+
+        return received_bytes
+
+
+    # the bytes just consumed end at read_offset, their last byte came with the first
+    # recv that ends at or after it
+    def update_last_record_kernel_time(self):
+
+        while self.recv_time_list and (self.recv_time_list[0][0] < self.read_offset):
+            self.recv_time_list.popleft()
+
+        if not self.recv_time_list:
+            # received before enable_kernel_timestamps()
+            self.last_record_kernel_time_sec = None
+            return
+
+        self.last_record_kernel_time_sec = self.recv_time_list[0][1]
+
+        if self.recv_time_list[0][0] == self.read_offset:
+            self.recv_time_list.popleft()
+
 
     def recv_into_buffer_until_minimum_size(self, minimum_buffer_size):
 
-        while len(self.read_buffer) < minimum_buffer_size:
+        while self.get_num_unread_bytes() < minimum_buffer_size:
 
-            num_bytes_remaining = minimum_buffer_size - len(self.read_buffer)
+            num_bytes_remaining = minimum_buffer_size - self.get_num_unread_bytes()
 
             self.recv(num_bytes_remaining)
 
@@ -241,54 +289,67 @@ class TcpControlConnectionClass:
 
         self.recv_into_buffer_until_minimum_size(exact_num_bytes_to_read)
 
-        received_bytes = self.read_buffer[ 0 : exact_num_bytes_to_read ]
-        self.read_buffer = self.read_buffer[ exact_num_bytes_to_read : ]
-
-        return received_bytes
+        return self.consume(exact_num_bytes_to_read)
 
 
+    # returns the index of substr_bytes, relative to the unread bytes
     def recv_into_buffer_until_substr_found(self, substr_bytes):
 
         while True:
 
-            substr_idx = self.read_buffer.find(substr_bytes)
+            substr_idx = self.read_buffer.find(substr_bytes, self.scan_offset)
             if substr_idx > -1:
                 # found
                 break
 
+            # substr may straddle what we have and what comes next
+            self.scan_offset = max(self.read_offset, len(self.read_buffer) - len(substr_bytes) + 1)
+
             self.recv(const.BUFSZ)
 
-        return substr_idx
+        return substr_idx - self.read_offset
 
 
-    def recv_a_c_block(self):
-        start_bytes = b' a '
-        end_bytes = b' c '
+    # the data receivers send interval records (" a ... c ") and, with --rtt-sample-interval,
+    # rtt echo records (" e ... f ")
+    def recv_a_c_or_e_f_block(self):
+        return self.recv_block_of_types([ (b' a ', b' c '), (b' e ', b' f ') ])
 
-        substr_idx = self.recv_into_buffer_until_substr_found(end_bytes)
 
-        received_bytes = self.read_buffer[ 0 : substr_idx + 3 ]
-        self.read_buffer = self.read_buffer[ substr_idx + 3 : ]
+    # passthru of the above, after the control receiver on the server has added its fields
+    def recv_a_d_or_e_g_block(self):
+        return self.recv_block_of_types([ (b' a ', b' d '), (b' e ', b' g ') ])
 
-        if not (received_bytes.startswith(start_bytes) and received_bytes.endswith(end_bytes)):
-            raise Exception("recv_a_c_block failed")
 
-        return received_bytes
+    # block_types is a list of (start bytes, end bytes), all three bytes long
+    def recv_block_of_types(self, block_types):
 
+        while True:
+
+            for start_bytes, end_bytes in block_types:
+                if self.read_buffer.startswith(start_bytes, self.read_offset):
+                    substr_idx = self.recv_into_buffer_until_substr_found(end_bytes)
+                    return self.consume(substr_idx + 3)
 
-    def recv_a_d_block(self):
-        start_bytes = b' a '
-        end_bytes = b' d '
+            if self.get_num_unread_bytes() >= 3:
+                raise Exception("recv_block_of_types failed")
 
-        substr_idx = self.recv_into_buffer_until_substr_found(end_bytes)
+            self.recv(const.BUFSZ)
 
-        received_bytes = self.read_buffer[ 0 : substr_idx + 3 ]
-        self.read_buffer = self.read_buffer[ substr_idx + 3 : ]
 
-        if not (received_bytes.startswith(start_bytes) and received_bytes.endswith(end_bytes)):
-            raise Exception("recv_a_d_block failed")
+    # binary control protocol, returns one whole record (see control_record_helper)
+    def recv_binary_record(self):
 
-        return received_bytes
+        self.recv_into_buffer_until_minimum_size(control_record_helper.RECORD_HEADER_SIZE)
+
+        record_len, _ = control_record_helper.RECORD_HEADER_STRUCT.unpack_from(self.read_buffer, self.read_offset)
+
+        if record_len < control_record_helper.RECORD_HEADER_SIZE:
+            raise Exception("ERROR: invalid control record length: {}".format(record_len))
+
+        self.recv_into_buffer_until_minimum_size(record_len)
+
+        return self.consume(record_len)
 
 
     def close(self):
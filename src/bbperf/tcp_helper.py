@@ -4,6 +4,7 @@
 import socket
 import struct
 
+from . import pacing_helper
 from .exceptions import PeerDisconnectedException
 
 
@@ -54,3 +55,13 @@ def set_congestion_control(client_args, data_sock):
 def set_tcp_notsent_lowat(data_sock, tcp_notsent_lowat_value):
     lowat_val_bytes = struct.pack('I', tcp_notsent_lowat_value)
     data_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NOTSENT_LOWAT, lowat_val_bytes)
+
+
+# --tcp-target-rate, tcp paces itself so no particular qdisc is needed
+def set_tcp_target_rate(client_args, data_sock):
+    if client_args.tcp_target_rate is None:
+        return
+
+    stream_rate_bytes_per_sec = (client_args.tcp_target_rate * (10 ** 6)) / (8 * client_args.parallel)
+
+    pacing_helper.set_max_pacing_rate(data_sock, stream_rate_bytes_per_sec)
@@ -0,0 +1,53 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import socket
+import struct
+
+# the fields of the kernel's struct tcp_info (linux/tcp.h) that go into the interval records,
+# sampled by the data sender once per interval
+#
+#   lost            u32 at 32    segments currently considered lost
+#   rtt             u32 at 68    smoothed rtt, microseconds
+#   rttvar          u32 at 72    microseconds
+#   snd_cwnd        u32 at 80    segments
+#   pacing_rate     u64 at 104   bytes per second
+#   notsent_bytes   u32 at 144   in the send buffer, not sent yet
+#   min_rtt         u32 at 148   microseconds
+#   delivery_rate   u64 at 160   bytes per second
+#   bytes_retrans   u64 at 208   since the connection was established
+#
+# older kernels return a shorter struct, the fields they do not have read as zero
+
+TCP_INFO_STRUCT = struct.Struct('=32xI32xII4xI20xQ32xII8xQ40xQ')
+TCP_INFO_LEN = TCP_INFO_STRUCT.size
+
+# the order the fields are carried in, everywhere (data header, interval records, raw data file)
+TCP_INFO_FIELD_LIST = [
+    "srtt_us",
+    "rttvar_us",
+    "min_rtt_us",
+    "snd_cwnd",
+    "lost",
+    "notsent_bytes",
+    "delivery_rate",
+    "pacing_rate",
+    "bytes_retrans" ]
+
+# udp, or before the first sample
+TCP_INFO_NONE = (0,) * len(TCP_INFO_FIELD_LIST)
+
+
+# returns the fields in TCP_INFO_FIELD_LIST order
+def get_tcp_info(data_sock):
+    tcp_info_bytes = data_sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, TCP_INFO_LEN)
+
+    (lost, srtt_us, rttvar_us, snd_cwnd, pacing_rate, notsent_bytes, min_rtt_us, delivery_rate,
+     bytes_retrans) = TCP_INFO_STRUCT.unpack(tcp_info_bytes.ljust(TCP_INFO_LEN, b'\x00'))
+
+    return (srtt_us, rttvar_us, min_rtt_us, snd_cwnd, lost, notsent_bytes, delivery_rate, pacing_rate, bytes_retrans)
+
+
+# the fields as they go into the ascii " a ... b " block, formatted once per interval
+def tcp_info_to_bytes(tcp_info):
+    return " ".join(str(x) for x in tcp_info).encode()
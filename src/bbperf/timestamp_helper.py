@@ -0,0 +1,33 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import socket
+import struct
+
+from . import const
+
+# kernel receive timestamps ("--kernel-timestamps")
+#
+# with SO_TIMESTAMPNS the kernel stamps every incoming skb with CLOCK_REALTIME (the same
+# clock as time.time()) and hands the stamp to recvmsg() as a control message, so we can
+# tell how long data sat in the socket before python got around to reading it.  for tcp
+# the stamp is that of the most recent skb in the read.
+
+# struct timespec, 64 bit
+TIMESPEC_STRUCT = struct.Struct('qq')
+
+RX_TIMESTAMP_CMSG_SPACE = socket.CMSG_SPACE(TIMESPEC_STRUCT.size)
+
+
+def enable_rx_timestamps(sock):
+    sock.setsockopt(socket.SOL_SOCKET, const.SO_TIMESTAMPNS, 1)
+
+
+# returns the kernel receive time in seconds, or None if there is no timestamp in ancdata
+def get_rx_timestamp_sec(ancdata):
+    for cmsg_level, cmsg_type, cmsg_data in ancdata:
+        if cmsg_level == socket.SOL_SOCKET and cmsg_type == const.SCM_TIMESTAMPNS:
+            tv_sec, tv_nsec = TIMESPEC_STRUCT.unpack_from(cmsg_data)
+            return tv_sec + (tv_nsec / 1000000000)
+
+    return None
@@ -0,0 +1,190 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import socket
+import select
+import struct
+
+from . import const
+from . import timestamp_helper
+
+# receives udp datagrams for the data receiver
+#
+# recv modes:
+#   loop - one recvfrom() per datagram, peer address is checked here
+#   gro  - connected socket (the kernel filters by peer address), UDP_GRO enabled so the kernel
+#          can hand us many datagrams per recvmsg(), and the socket is drained on every call
+#   auto - gro if UDP_GRO can be enabled, otherwise loop
+#
+# with copy_free_recv, datagrams are read into a reusable buffer and only the header region
+# is copied out of the kernel, the rest of the payload is discarded (MSG_TRUNC)
+#
+# with kernel_timestamps, last_pkt_kernel_time_sec is the time the kernel received last_pkt
+class UdpBatchReceiverClass:
+
+    # args are client args
+    def __init__(self, args, data_sock, peer_addr):
+        self.args = args
+        self.data_sock = data_sock
+        self.peer_addr = peer_addr
+
+        # the caller sets the recv timeout on the socket before handing it to us
+        self.recv_timeout = data_sock.gettimeout()
+
+        self.stop_msg_bytes = const.UDP_STOP_MSG.encode()
+
+        self.copy_free = self.args.copy_free_recv
+        if self.copy_free:
+            self.recv_buffer = bytearray(const.DATA_HEADER_REGION_SIZE)
+            self.recv_view = memoryview(self.recv_buffer)
+
+        self.kernel_timestamps = self.args.kernel_timestamps
+        self.last_pkt_kernel_time_sec = None
+        if self.kernel_timestamps:
+            timestamp_helper.enable_rx_timestamps(self.data_sock)
+
+        self.recv_mode = self.args.udp_recv_mode
+
+        if self.recv_mode in [ "auto", "gro" ]:
+            try:
+                self.data_sock.setsockopt(socket.SOL_UDP, const.UDP_GRO, 1)
+                self.recv_mode = "gro"
+
+            except OSError as e:
+                if self.recv_mode == "gro":
+                    print("WARNING: unable to enable UDP_GRO, falling back to recv mode loop: {}".format(e), flush=True)
+                self.recv_mode = "loop"
+
+        if self.recv_mode == "gro":
+            # let the kernel drop datagrams that are not from our peer
+            self.data_sock.connect(self.peer_addr)
+            # we do our own waiting with select, so that draining the socket never blocks
+            self.data_sock.setblocking(False)
+
+        if self.args.verbosity:
+            print("udp batch receiver: recv mode {}, copy free: {}".format(self.recv_mode, self.copy_free), flush=True)
+
+
+    # returns (num_pkts, num_bytes, last_pkt, stop_received)
+    #   last_pkt is the payload of the most recently received datagram (only the header
+    #   region, and only valid until the next call, when copy free)
+    # raises socket.timeout if nothing arrives within the recv timeout
+    def recv(self):
+        if self.recv_mode == "gro":
+            return self.recv_gro()
+
+        return self.recv_loop()
+
+
+    def recv_loop(self):
+        if self.copy_free:
+            return self.recv_loop_copy_free()
+
+        if self.kernel_timestamps:
+            bytes_read, ancdata, _, pkt_from_addr = self.data_sock.recvmsg(const.BUFSZ, timestamp_helper.RX_TIMESTAMP_CMSG_SPACE)
+            self.last_pkt_kernel_time_sec = timestamp_helper.get_rx_timestamp_sec(ancdata)
+        else:
+            bytes_read, pkt_from_addr = self.data_sock.recvfrom(const.BUFSZ)
+
+        # validate peer address
+        # only accept packets from our client
+
+        if pkt_from_addr != self.peer_addr:
+            # ignore this datagram
+            return 0, 0, None, False
+
+        return 1, len(bytes_read), bytes_read, self.is_stop_msg(bytes_read)
+
+
+    def recv_loop_copy_free(self):
+        # with MSG_TRUNC the return value is the full length of the datagram
+        if self.kernel_timestamps:
+            num_bytes_read, ancdata, _, pkt_from_addr = self.data_sock.recvmsg_into([self.recv_view], timestamp_helper.RX_TIMESTAMP_CMSG_SPACE, socket.MSG_TRUNC)
+            self.last_pkt_kernel_time_sec = timestamp_helper.get_rx_timestamp_sec(ancdata)
+        else:
+            num_bytes_read, pkt_from_addr = self.data_sock.recvfrom_into(self.recv_view, len(self.recv_buffer), socket.MSG_TRUNC)
+
+        if pkt_from_addr != self.peer_addr:
+            # ignore this datagram
+            return 0, 0, None, False
+
+        last_pkt = self.recv_view[ 0 : min(num_bytes_read, len(self.recv_buffer)) ]
+
+        return 1, num_bytes_read, last_pkt, self.is_stop_msg(last_pkt)
+
+
+    def recv_gro(self):
+        rlist, _, _ = select.select( [self.data_sock], [], [], self.recv_timeout)
+
+        if len(rlist) == 0:
+            raise socket.timeout()
+
+        total_pkts = 0
+        total_bytes = 0
+        last_pkt = None
+        stop_received = False
+
+        ancbufsize = socket.CMSG_SPACE(4)
+        if self.kernel_timestamps:
+            ancbufsize += timestamp_helper.RX_TIMESTAMP_CMSG_SPACE
+
+        for _ in range(const.UDP_RECV_MAX_CALLS_PER_BATCH):
+            try:
+                if self.copy_free:
+                    # with MSG_TRUNC the return value is the full length of the (coalesced) datagram
+                    num_bytes_read, ancdata, _, _ = self.data_sock.recvmsg_into([self.recv_view], ancbufsize, socket.MSG_TRUNC)
+                else:
+                    bytes_read, ancdata, _, _ = self.data_sock.recvmsg(const.BUFSZ, ancbufsize)
+                    num_bytes_read = len(bytes_read)
+
+            except BlockingIOError:
+                # socket is drained
+                break
+
+            except ConnectionRefusedError:
+                # the socket is connected, an icmp error for something we sent earlier
+                continue
+
+            segment_size = num_bytes_read
+            for cmsg_level, cmsg_type, cmsg_data in ancdata:
+                if cmsg_level == socket.SOL_UDP and cmsg_type == const.UDP_GRO:
+                    segment_size = struct.unpack('i', cmsg_data[:4])[0]
+
+            if segment_size == 0:
+                # empty datagram
+                continue
+
+            # the last segment is allowed to be shorter than the others
+            num_pkts = -(-num_bytes_read // segment_size)
+
+            last_segment_offset = (num_pkts - 1) * segment_size
+
+            if self.copy_free:
+                # we only have the head of the first segment, which is good enough for the header
+                last_pkt = self.recv_view[ 0 : min(num_bytes_read, len(self.recv_buffer)) ]
+                # the stop message may have been coalesced behind the data as a short last
+                # segment whose bytes we do not have, but data datagrams always carry a header,
+                # so a last segment of this length can only be the stop message
+                if (num_pkts > 1) and ((num_bytes_read - last_segment_offset) == len(self.stop_msg_bytes)):
+                    stop_received = True
+            else:
+                last_pkt = bytes_read[ last_segment_offset : ]
+
+            if self.kernel_timestamps:
+                # coalesced datagrams share one timestamp
+                self.last_pkt_kernel_time_sec = timestamp_helper.get_rx_timestamp_sec(ancdata)
+
+            total_pkts += num_pkts
+            total_bytes += num_bytes_read
+
+            if self.is_stop_msg(last_pkt):
+                stop_received = True
+
+            if stop_received:
+                break
+
+        return total_pkts, total_bytes, last_pkt, stop_received
+
+
+    def is_stop_msg(self, pkt):
+        return len(pkt) == len(self.stop_msg_bytes) and bytes(pkt) == self.stop_msg_bytes
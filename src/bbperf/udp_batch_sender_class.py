@@ -0,0 +1,76 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import errno
+import socket
+import struct
+
+from . import const
+
+# sends the datagrams of a udp batch using as few syscalls as possible
+#
+# send modes:
+#   loop - one sendto() per datagram
+#   gso  - one sendmsg() per group of datagrams, the kernel splits them apart (UDP_SEGMENT),
+#          it is an error if the kernel or the nic does not support it
+#   auto - gso if it works, otherwise loop
+class UdpBatchSenderClass:
+
+    # args are client args
+    def __init__(self, args, data_sock, peer_addr):
+        self.args = args
+        self.data_sock = data_sock
+        self.peer_addr = peer_addr
+
+        self.send_mode = self.args.udp_send_mode
+        if self.send_mode == "auto":
+            self.send_mode = "gso"
+
+        if self.args.verbosity:
+            print("udp batch sender: send mode {}".format(self.send_mode), flush=True)
+
+
+    # sends up to max_pkts copies of payload_bytes
+    # returns the number of datagrams sent and the number of bytes sent
+    def send(self, payload_bytes, max_pkts):
+        if self.send_mode == "gso":
+            try:
+                return self.send_gso(payload_bytes, max_pkts)
+
+            except OSError as e:
+                if e.errno not in [ errno.EINVAL, errno.EIO, errno.ENOPROTOOPT, errno.EOPNOTSUPP ]:
+                    raise
+
+                # not supported by the kernel or the nic
+                if self.args.udp_send_mode == "gso":
+                    raise Exception("ERROR: udp gso send failed, try --udp-send-mode auto or loop: {}".format(e))
+
+                # auto, fall back to the plain loop
+                if self.args.verbosity:
+                    print("udp gso send failed, falling back to send mode loop: {}".format(e), flush=True)
+                self.send_mode = "loop"
+
+        return self.send_loop(payload_bytes)
+
+
+    def send_loop(self, payload_bytes):
+        num_bytes_sent = self.data_sock.sendto(payload_bytes, self.peer_addr)
+
+        return 1, num_bytes_sent
+
+
+    def send_gso(self, payload_bytes, max_pkts):
+        segment_size = len(payload_bytes)
+
+        num_pkts = min(max_pkts, const.UDP_GSO_MAX_SEGMENTS, const.UDP_MAX_PAYLOAD // segment_size)
+
+        if num_pkts < 2:
+            # nothing to gain here
+            return self.send_loop(payload_bytes)
+
+        # every datagram in a batch is identical, so just repeat the same buffer in the iovec
+        ancdata = [ (socket.SOL_UDP, const.UDP_SEGMENT, struct.pack('H', segment_size)) ]
+
+        num_bytes_sent = self.data_sock.sendmsg([payload_bytes] * num_pkts, ancdata, 0, self.peer_addr)
+
+        return num_pkts, num_bytes_sent
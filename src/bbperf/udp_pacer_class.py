@@ -0,0 +1,134 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import math
+import time
+
+import numpy
+
+from . import const
+
+# paces udp batches on a monotonic clock ("--udp-pacing precise")
+#
+# batches are kept small: just big enough that the gap between batches is at least
+# UDP_PACING_MIN_GAP_SEC, and never bigger than the burst limit.  the wait before a batch
+# is a sleep followed by a short spin, since sleep alone overshoots by tens of microseconds.
+#
+# the actual gap between the start of consecutive batches is compared to the target gap
+# to report how smooth the traffic really was
+class UdpPacerClass:
+
+    # args are client args
+    def __init__(self, args):
+        self.args = args
+        self.max_burst = args.udp_max_burst
+
+        self.next_batch_time = None
+        self.last_batch_start_time = None
+
+        self.num_batches = 0
+        self.num_batch_pkts = 0
+        self.num_late_batches = 0
+        self.sum_target_gap_sec = 0.0
+
+        # gap errors in microseconds, decimated when full so memory stays bounded
+        self.gap_error_us_list = []
+        self.gap_error_stride = 1
+        self.gap_error_stride_counter = 0
+
+
+    def get_batch_size(self, pps):
+        batch_size = math.ceil(pps * const.UDP_PACING_MIN_GAP_SEC)
+
+        return max(1, min(self.max_burst, batch_size))
+
+
+    # start the schedule over, call just before sending the first batch of it (e.g. while
+    # calibrating), so that the first batch is paced from here too
+    def reset(self):
+        now = time.perf_counter()
+
+        self.next_batch_time = now
+        self.last_batch_start_time = now
+
+
+    # call after sending a batch, returns when the next batch is due
+    def pace(self, num_pkts_sent, pps):
+        target_gap_sec = num_pkts_sent / pps
+
+        now = time.perf_counter()
+
+        if self.next_batch_time is None:
+            # never reset, nothing to measure the first batch against
+            self.next_batch_time = now
+            self.last_batch_start_time = now
+            return
+
+        self.next_batch_time += target_gap_sec
+
+        if (now - self.next_batch_time) > target_gap_sec:
+            # we are more than a whole gap behind, do not try to catch up with a burst
+            self.num_late_batches += 1
+            if (self.num_late_batches % const.UDP_NEGATIVE_DELAY_BETWEEN_BATCHES_WARNING_EVERY) == 0:
+                print("WARNING: udp sender is cpu constrained, results may be invalid: {}".format(self.num_late_batches), flush=True)
+            self.next_batch_time = now
+
+        else:
+            remaining_sec = self.next_batch_time - now
+
+            if remaining_sec > const.UDP_PACING_SPIN_SEC:
+                time.sleep(remaining_sec - const.UDP_PACING_SPIN_SEC)
+
+            while time.perf_counter() < self.next_batch_time:
+                pass
+
+            now = time.perf_counter()
+
+        actual_gap_sec = now - self.last_batch_start_time
+        self.add_gap_error((actual_gap_sec - target_gap_sec) * 1000000)
+
+        self.num_batches += 1
+        self.num_batch_pkts += num_pkts_sent
+        self.sum_target_gap_sec += target_gap_sec
+
+        self.last_batch_start_time = now
+
+
+    def add_gap_error(self, gap_error_us):
+        self.gap_error_stride_counter += 1
+        if self.gap_error_stride_counter < self.gap_error_stride:
+            return
+        self.gap_error_stride_counter = 0
+
+        self.gap_error_us_list.append(gap_error_us)
+
+        if len(self.gap_error_us_list) >= const.UDP_PACING_MAX_GAP_ERROR_SAMPLES:
+            self.gap_error_us_list = self.gap_error_us_list[::2]
+            self.gap_error_stride *= 2
+
+
+    def get_stats(self):
+        stats = {}
+        stats["num_batches"] = self.num_batches
+        stats["num_late_batches"] = self.num_late_batches
+
+        if self.num_batches == 0:
+            return stats
+
+        stats["mean_batch_size_pkts"] = self.num_batch_pkts / self.num_batches
+        stats["mean_target_gap_us"] = (self.sum_target_gap_sec / self.num_batches) * 1000000
+
+        gap_error_us_array = numpy.array(self.gap_error_us_list)
+
+        p1, p50, p99 = numpy.percentile(gap_error_us_array, [1, 50, 99])
+
+        stats["gap_error_us"] = {}
+        stats["gap_error_us"]["mean"] = float(numpy.mean(gap_error_us_array))
+        stats["gap_error_us"]["stddev"] = float(numpy.std(gap_error_us_array))
+        stats["gap_error_us"]["mean_abs"] = float(numpy.mean(numpy.abs(gap_error_us_array)))
+        stats["gap_error_us"]["p1"] = float(p1)
+        stats["gap_error_us"]["p50"] = float(p50)
+        stats["gap_error_us"]["p99"] = float(p99)
+        stats["gap_error_us"]["max"] = float(numpy.max(gap_error_us_array))
+
+        return stats
@@ -6,12 +6,18 @@ import numpy
 from . import const
 
 # this is a simple congestion control algorithm for the udp test
+#
+# with multiple flows (-P), the rate is managed for all flows together, based on the sum of
+# the receiver pps of every flow for an interval, and then split evenly across the flows
+# shared_udp_sending_rate_pps is the per flow sending rate
 class UdpRateManagerClass:
 
     # args are client args
     def __init__(self, args, shared_udp_sending_rate_pps):
         self.args = args
         self.shared_udp_sending_rate_pps = shared_udp_sending_rate_pps
+        self.num_flows = args.parallel
+        self.receiver_pps_per_flow = {}         # flows that reported since the last sample
         self.receiver_pps_list = []
         self.last_new_rate = 0
         self.initial_climb = True
@@ -19,14 +25,23 @@ class UdpRateManagerClass:
     # control receiver calls this with interval pps (every 0.1 seconds)
     def update(self, r_record):
         # gut checks to avoid updating based on bogus input
-        if r_record["r_sender_total_pkts_sent"] < 100:
+        if r_record.r_sender_total_pkts_sent < 100:
             return
-        if r_record["r_sender_interval_pkts_sent"] < 10:
+        if r_record.r_sender_interval_pkts_sent < 10:
             return
-        if r_record["receiver_pps"] < 100:
+        if r_record.receiver_pps < 100:
             return
 
-        self.receiver_pps_list.append(r_record["receiver_pps"])
+        # one aggregate sample per interval, once every flow has reported for it
+        # (a flow that reports again before the others just updates its pps)
+        self.receiver_pps_per_flow[r_record.r_stream_id] = r_record.receiver_pps
+        if len(self.receiver_pps_per_flow) < self.num_flows:
+            return
+
+        aggregate_receiver_pps = sum(self.receiver_pps_per_flow.values())
+        self.receiver_pps_per_flow = {}
+
+        self.receiver_pps_list.append(aggregate_receiver_pps)
         if len(self.receiver_pps_list) > 10:
             self.receiver_pps_list = self.receiver_pps_list[1:]
 
@@ -49,6 +64,9 @@ class UdpRateManagerClass:
             # maintain steady state at configured overshoot factor
             new_rate = int(receiver_pps_p50 * self.args.udp_steady_state_factor)
 
+        # split across flows
+        new_rate = int(new_rate / self.num_flows)
+
         if new_rate < const.UDP_MIN_RATE:
             new_rate = const.UDP_MIN_RATE
         # cap it to something big
@@ -63,7 +81,7 @@ class UdpRateManagerClass:
 
         if self.args.verbosity > 1:
             print("UdpRateManager: update: receiver pps {:6d} old rate {:6d} new rate {:6d} delta {:7d} initial_climb: {}".format(
-                r_record["receiver_pps"],
+                aggregate_receiver_pps,
                 self.shared_udp_sending_rate_pps.value,
                 new_rate,
                 delta_rate,
@@ -1,7 +1,6 @@
 # Copyright (c) 2024 Cloudflare, Inc.
 # Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
 
-import time
 
 from . import udp_helper
 
@@ -20,13 +19,12 @@ def run(readyevent, doneevent, args, data_sock, peer_addr, string_to_send):
     readyevent.set()
 
     while True:
-        if doneevent.is_set():
-            break
-
         udp_helper.sendto(data_sock, peer_addr, string_to_send.encode())
         send_count += 1
 
-        time.sleep(ping_interval_sec)
+        # returns early once we are done
+        if doneevent.wait(ping_interval_sec):
+            break
 
         if send_count > total_pings_to_send:
             break
@@ -2,10 +2,20 @@
 # Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
 
 import sys
+import json
+import time
+import random
 import socket
+import argparse
+import multiprocessing
+import multiprocessing.connection
 
 from . import const
 
+from .exceptions import ServerBusyException
+from .echo_record_class import EchoRecordClass
+from .interval_record_class import IntervalRecordClass
+
 
 def validate_and_finalize_args(args):
     if args.server and args.client:
@@ -23,12 +33,73 @@ def validate_and_finalize_args(args):
     if args.congestion not in [ "cubic", "bbr", "reno"]:
         raise Exception("ERROR: congestion control algorithm is invalid: {}".format(args.congestion))
 
+    if args.json_summary_only and (not args.json_file):
+        raise Exception("ERROR: --json-summary-only requires --json-file")
+
     if args.graph_file and (not args.graph_file.endswith(".png")):
         raise Exception("ERROR: argument --graph-file must end with \".png\"")
 
+    if args.parallel < 1 or args.parallel > const.MAX_PARALLEL_STREAMS:
+        raise Exception("ERROR: --parallel must be between 1 and {}, got {}".format(const.MAX_PARALLEL_STREAMS, args.parallel))
+
+    if args.max_concurrent_sessions < 1:
+        raise Exception("ERROR: --max-concurrent-sessions must be at least 1, got {}".format(args.max_concurrent_sessions))
+
+    if args.max_queue_length < 0:
+        raise Exception("ERROR: --max-queue-length must not be negative, got {}".format(args.max_queue_length))
+
+    if args.max_queue_wait < 0:
+        raise Exception("ERROR: --max-queue-wait must not be negative, got {}".format(args.max_queue_wait))
+
+    if args.bandwidth_budget is not None and args.bandwidth_budget <= 0:
+        raise Exception("ERROR: --bandwidth-budget must be greater than 0, got {}".format(args.bandwidth_budget))
+
+    if args.session_bandwidth <= 0:
+        raise Exception("ERROR: --session-bandwidth must be greater than 0, got {}".format(args.session_bandwidth))
+
+    if args.busy_retries < 0:
+        raise Exception("ERROR: --busy-retries must not be negative, got {}".format(args.busy_retries))
+
+    if args.metrics_port is not None and (args.metrics_port < 1 or args.metrics_port > 65535):
+        raise Exception("ERROR: invalid --metrics-port {}".format(args.metrics_port))
+
     if args.udp_target_loss <= 0 or args.udp_target_loss >= 100:
         raise Exception("ERROR: --udp-target-loss must be between 0 and 100 (exclusive), got {}".format(args.udp_target_loss))
 
+    if args.tcp_target_rate is not None:
+        if args.udp:
+            raise Exception("ERROR: --tcp-target-rate is for tcp mode only")
+        if args.tcp_target_rate <= 0:
+            raise Exception("ERROR: --tcp-target-rate must be greater than 0, got {}".format(args.tcp_target_rate))
+
+    if args.sweep:
+        if args.tcp_target_rate is not None:
+            raise Exception("ERROR: cannot specify both --sweep and --tcp-target-rate")
+        if args.sweep_step_time <= const.SWEEP_STEP_SETTLE_TIME_SEC:
+            raise Exception("ERROR: --sweep-step-time must be greater than {}, got {}".format(const.SWEEP_STEP_SETTLE_TIME_SEC, args.sweep_step_time))
+
+    try:
+        sweep_load_percent_list = [ float(x) for x in args.sweep_steps.split(",") ]
+    except ValueError:
+        raise Exception("ERROR: invalid --sweep-steps: {}".format(args.sweep_steps))
+
+    for load_percent in sweep_load_percent_list:
+        if load_percent <= 0:
+            raise Exception("ERROR: --sweep-steps must be greater than 0, got {}".format(load_percent))
+
+    summary_percent_list = get_summary_percent_list(args.extra_percentiles)
+
+    if args.rtt_sample_interval is not None and args.rtt_sample_interval <= 0:
+        raise Exception("ERROR: --rtt-sample-interval must be greater than 0, got {}".format(args.rtt_sample_interval))
+
+    if args.udp_max_burst < 1:
+        raise Exception("ERROR: --udp-max-burst must be at least 1, got {}".format(args.udp_max_burst))
+
+    if args.engine == "asyncio":
+        unsupported_option_list = get_asyncio_engine_unsupported_options(args)
+        if len(unsupported_option_list) > 0:
+            raise Exception("ERROR: not supported with --engine asyncio: {}".format(", ".join(unsupported_option_list)))
+
     d = vars(args)
 
     # compute UDP steady-state sending rate factor from --udp-target-loss
@@ -36,6 +107,9 @@ def validate_and_finalize_args(args):
     # times the receiver rate. E.g., 1% loss -> factor 1.0101, 5% -> 1.0526
     d["udp_steady_state_factor"] = 1.0 / (1.0 - args.udp_target_loss / 100.0)
 
+    d["sweep_load_percent_list"] = sweep_load_percent_list
+    d["summary_percent_list"] = summary_percent_list
+
     # set max_run_time_failsafe_sec
     # never run longer than this under any circumstances
     max_run_time_failsafe_sec = const.MAX_DURATION_CALIBRATION_TIME_SEC
@@ -46,11 +120,134 @@ def validate_and_finalize_args(args):
         max_run_time_failsafe_sec += const.DATA_SAMPLE_IGNORE_TIME_TCP_MAX_SEC
 
     max_run_time_failsafe_sec += const.MAX_DATA_COLLECTION_TIME_WITHOUT_VALID_DATA
-    max_run_time_failsafe_sec += args.time
+    if args.sweep:
+        max_run_time_failsafe_sec += const.SWEEP_CAPACITY_ESTIMATE_TIME_SEC
+        max_run_time_failsafe_sec += len(sweep_load_percent_list) * args.sweep_step_time
+    else:
+        max_run_time_failsafe_sec += args.time
 
     d["max_run_time_failsafe_sec"] = max_run_time_failsafe_sec
 
 
+# const.SUMMARY_PERCENT_LIST plus --extra-percentiles (client and bbperf analyze)
+def get_summary_percent_list(extra_percentiles):
+    if extra_percentiles is None:
+        return const.SUMMARY_PERCENT_LIST
+
+    try:
+        extra_percent_list = [ float(x) for x in extra_percentiles.split(",") ]
+    except ValueError:
+        raise Exception("ERROR: invalid --extra-percentiles: {}".format(extra_percentiles))
+
+    for percent in extra_percent_list:
+        if percent < 0 or percent > 100:
+            raise Exception("ERROR: --extra-percentiles must be between 0 and 100, got {}".format(percent))
+
+    return sorted(set(const.SUMMARY_PERCENT_LIST + extra_percent_list))
+
+
+# the asyncio engine does without the socket level features that need a process of their own
+# (the server checks client args with this too)
+def get_asyncio_engine_unsupported_options(args):
+    unsupported_option_list = []
+
+    if args.data_header != "ascii":
+        unsupported_option_list.append("--data-header {}".format(args.data_header))
+    if args.copy_free_recv:
+        unsupported_option_list.append("--copy-free-recv")
+    if args.kernel_timestamps:
+        unsupported_option_list.append("--kernel-timestamps")
+    if args.rtt_sample_interval is not None:
+        unsupported_option_list.append("--rtt-sample-interval")
+    if args.udp_pacing != "batch":
+        unsupported_option_list.append("--udp-pacing {}".format(args.udp_pacing))
+    if args.udp_send_mode == "gso":
+        unsupported_option_list.append("--udp-send-mode gso")
+    if args.udp_recv_mode == "gro":
+        unsupported_option_list.append("--udp-recv-mode gro")
+    if args.metrics_port is not None:
+        unsupported_option_list.append("--metrics-port")
+    if args.metrics_textfile is not None:
+        unsupported_option_list.append("--metrics-textfile")
+
+    return unsupported_option_list
+
+
+# the client args as sent to the server, with our protocol version
+def client_args_to_json(args):
+    args_d = dict(vars(args))
+    args_d["protocol_version"] = const.PROTOCOL_VERSION
+
+    return json.dumps(args_d)
+
+
+# the client args as received by the server, as if they came directly from argparse
+# raises ValueError if they are not valid json
+def client_args_from_json(args_bytes):
+    return argparse.Namespace(**json.loads(args_bytes.decode()))
+
+
+# server, the client args of a client that speaks another protocol version must not be used,
+# returns an error message for those, else None
+def check_client_protocol_version(client_args):
+    # clients without a protocol version do not send it at all
+    client_protocol_version = vars(client_args).get("protocol_version", 1)
+
+    if client_protocol_version == const.PROTOCOL_VERSION:
+        return None
+
+    return "client protocol version {}, server protocol version {}, client and server must run the same bbperf version".format(
+        client_protocol_version, const.PROTOCOL_VERSION)
+
+
+# server, the error reply to client args it cannot run a test with, see parse_control_args_reply()
+def get_control_args_error_reply(error_str):
+    error_bytes = error_str.encode()
+
+    return const.TCP_CONTROL_ARGS_ERROR.format(len(error_bytes)).encode() + error_bytes
+
+
+# reply of the server to the client args
+# returns ("ack", control protocol), ("queued", estimated wait in seconds) or ("error", length
+# of the error message that follows), raises ServerBusyException if the server is busy
+def parse_control_args_reply(received_str):
+    if received_str == const.TCP_CONTROL_ARGS_ACK_BINARY:
+        return "ack", "binary"
+
+    if received_str == const.TCP_CONTROL_ARGS_ACK:
+        return "ack", "ascii"
+
+    if received_str == const.TCP_CONTROL_ARGS_ACK_VERSION_1:
+        raise Exception("ERROR: the server runs an older bbperf without a protocol version (client protocol version {}), "
+                        "client and server must run the same bbperf version".format(const.PROTOCOL_VERSION))
+
+    if received_str == const.TCP_CONTROL_ARGS_VERSION_MISMATCH:
+        raise Exception("ERROR: the server does not support client protocol version {}, "
+                        "client and server must run the same bbperf version".format(const.PROTOCOL_VERSION))
+
+    w = received_str.split()
+
+    if (len(w) == 2) and w[1].isdigit():
+        if w[0] == "queued":
+            return "queued", int(w[1])
+        if w[0] == "busy":
+            raise ServerBusyException(int(w[1]))
+        if w[0] == "error":
+            return "error", int(w[1])
+
+    raise Exception("ERROR: received invalid control args ack: {}".format(received_str))
+
+
+# how long to wait before retry number retry_num (from 0) when the server is busy:
+# exponential backoff, but not before the server said, plus jitter
+def get_busy_backoff_sec(retry_num, retry_after_sec):
+    backoff_sec = min(const.BUSY_BACKOFF_MAX_SEC, const.BUSY_BACKOFF_INITIAL_SEC * (2 ** retry_num))
+
+    backoff_sec = max(backoff_sec, retry_after_sec)
+
+    return backoff_sec * (1 + random.uniform(0, const.BUSY_BACKOFF_JITTER))
+
+
 def convert_udp_pps_to_batch_size(packets_per_sec):
 
     batch_size = int(packets_per_sec / const.UDP_DESIRED_BATCHES_PER_SECOND)
@@ -61,6 +258,11 @@ def convert_udp_pps_to_batch_size(packets_per_sec):
     return batch_size
 
 
+# bytes per second for SO_MAX_PACING_RATE
+def convert_udp_pps_to_kernel_pacing_rate(packets_per_sec):
+    return packets_per_sec * (len(const.PAYLOAD_1K) + const.UDP_KERNEL_PACING_OVERHEAD_BYTES)
+
+
 def done_with_socket(mysock):
     try:
         mysock.shutdown(socket.SHUT_RDWR)
@@ -73,6 +275,29 @@ def done_with_socket(mysock):
         pass
 
 
+# sentinels of the processes still running, to block on with multiprocessing.connection.wait()
+def get_sentinel_list(thread_list):
+    return [ t.sentinel for t in thread_list if t.is_alive() ]
+
+
+# blocks until every process has exited, raises like threads_are_running() if one exits abnormally
+def wait_for_threads(thread_list, deadline_sec):
+    while threads_are_running(thread_list):
+        timeout_sec = deadline_sec - time.time()
+
+        if timeout_sec <= 0:
+            raise Exception("ERROR: max_run_time_failsafe_sec exceeded")
+
+        sentinel_list = get_sentinel_list(thread_list)
+
+        # the last one exited after threads_are_running() looked, with nothing to wait on
+        # wait() would sleep until the timeout
+        if len(sentinel_list) == 0:
+            continue
+
+        multiprocessing.connection.wait(sentinel_list, timeout_sec)
+
+
 def threads_are_running(thread_list):
     any_running = False
 
@@ -88,87 +313,222 @@ def threads_are_running(thread_list):
 
 
 def parse_r_record(args, s1):
-    r_record = {}
-
     swords = s1.split()
 
-    # literal "a"
-    r_record["r_record_type"] = swords[1]
-    r_record["r_pkt_sent_time_sec"] = float(swords[2])
-    r_record["r_sender_interval_duration_sec"] = float(swords[3])
-    r_record["r_sender_interval_pkts_sent"] = int(swords[4])                # valid for udp only
-    r_record["r_sender_interval_bytes_sent"] = int(swords[5])
-    r_record["r_sender_total_pkts_sent"] = int(swords[6])                   # valid for udp only
-    # literal "b"
-    r_record["r_receiver_interval_duration_sec"] = float(swords[8])
-    r_record["r_receiver_interval_pkts_received"] = int(swords[9])          # valid for udp only
-    r_record["r_receiver_interval_bytes_received"] = int(swords[10])
-    r_record["r_receiver_total_pkts_received"] = int(swords[11])            # valid for udp only
+    r_record = a_c_words_to_r_record(swords)
+
     # literal "c"
-    r_record["r_pkt_received_time_sec"] = float(swords[13])
-    r_record["interval_dropped"] = int(swords[14])
-    r_record["interval_dropped_percent"] = float(swords[15])
-    r_record["is_sample_valid"] = int(swords[16])
+    r_record.r_pkt_received_time_sec = float(swords[24])
+    r_record.interval_dropped = int(swords[25])
+    r_record.interval_dropped_percent = float(swords[26])
+    r_record.is_sample_valid = int(swords[27])
+    r_record.sweep_step = int(swords[28])
+    r_record.control_dwell_sec = float(swords[29])                       # with --kernel-timestamps only
+    r_record.rtt_sample_count = int(swords[30])                          # with --rtt-sample-interval only
+    r_record.rtt_sample_min_sec = float(swords[31])
+    r_record.rtt_sample_p50_sec = float(swords[32])
+    r_record.rtt_sample_p99_sec = float(swords[33])
+    r_record.rtt_sample_max_sec = float(swords[34])
     # literal "d"
 
-    r_record["rtt_sec"] = r_record["r_pkt_received_time_sec"] - r_record["r_pkt_sent_time_sec"]
-    r_record["rtt_ms"] = r_record["rtt_sec"] * 1000
+    return add_r_record_derived_fields(args, r_record)
+
+
+# the raw fields of the " a ... c " block only (as received by the control receiver), no derived fields
+def parse_a_c_block(s1):
+    return a_c_words_to_r_record(s1.split())
+
+
+def a_c_words_to_r_record(swords):
+    r_record = IntervalRecordClass()
+
+    # literal "a"
+    r_record.r_record_type = swords[1]
+    r_record.r_pkt_sent_time_sec = float(swords[2])
+    r_record.r_sender_interval_duration_sec = float(swords[3])
+    r_record.r_sender_interval_pkts_sent = int(swords[4])                # valid for udp only
+    r_record.r_sender_interval_bytes_sent = int(swords[5])
+    r_record.r_sender_total_pkts_sent = int(swords[6])                   # valid for udp only
+    # tcp only, tcp_info_helper.TCP_INFO_FIELD_LIST order
+    (r_record.r_sender_tcp_srtt_us,
+     r_record.r_sender_tcp_rttvar_us,
+     r_record.r_sender_tcp_min_rtt_us,
+     r_record.r_sender_tcp_snd_cwnd,
+     r_record.r_sender_tcp_lost,
+     r_record.r_sender_tcp_notsent_bytes,
+     r_record.r_sender_tcp_delivery_rate,
+     r_record.r_sender_tcp_pacing_rate,
+     r_record.r_sender_tcp_bytes_retrans) = map(int, swords[7:16])
+    # literal "b"
+    r_record.r_receiver_interval_duration_sec = float(swords[17])
+    r_record.r_receiver_interval_pkts_received = int(swords[18])         # valid for udp only
+    r_record.r_receiver_interval_bytes_received = int(swords[19])
+    r_record.r_receiver_total_pkts_received = int(swords[20])            # valid for udp only
+    r_record.r_stream_id = int(swords[21])
+    r_record.r_receiver_dwell_sec = float(swords[22])                    # with --kernel-timestamps only
+
+    return r_record
+
+
+R_RECORD_STR_FORMAT = " a {} {} {} {} {} {} {} {} {} {} {} {} {} {} {} b {} {} {} {} {} {} c {} {} {} {} {} {} {} {} {} {} {} d ".format
+
+
+# the text form of an interval record, as written to the raw data file
+def r_record_to_str(r_record):
+    return R_RECORD_STR_FORMAT(
+        r_record.r_record_type,
+        r_record.r_pkt_sent_time_sec,
+        r_record.r_sender_interval_duration_sec,
+        r_record.r_sender_interval_pkts_sent,
+        r_record.r_sender_interval_bytes_sent,
+        r_record.r_sender_total_pkts_sent,
+        r_record.r_sender_tcp_srtt_us,
+        r_record.r_sender_tcp_rttvar_us,
+        r_record.r_sender_tcp_min_rtt_us,
+        r_record.r_sender_tcp_snd_cwnd,
+        r_record.r_sender_tcp_lost,
+        r_record.r_sender_tcp_notsent_bytes,
+        r_record.r_sender_tcp_delivery_rate,
+        r_record.r_sender_tcp_pacing_rate,
+        r_record.r_sender_tcp_bytes_retrans,
+        r_record.r_receiver_interval_duration_sec,
+        r_record.r_receiver_interval_pkts_received,
+        r_record.r_receiver_interval_bytes_received,
+        r_record.r_receiver_total_pkts_received,
+        r_record.r_stream_id,
+        r_record.r_receiver_dwell_sec,
+        r_record.r_pkt_received_time_sec,
+        r_record.interval_dropped,
+        r_record.interval_dropped_percent,
+        r_record.is_sample_valid,
+        r_record.sweep_step,
+        r_record.control_dwell_sec,
+        r_record.rtt_sample_count,
+        r_record.rtt_sample_min_sec,
+        r_record.rtt_sample_p50_sec,
+        r_record.rtt_sample_p99_sec,
+        r_record.rtt_sample_max_sec)
+
+
+# everything computed from the raw fields, whichever control protocol they came in on
+def add_r_record_derived_fields(args, r_record):
+
+    # as seen by python on both ends
+    r_record.userspace_rtt_sec = r_record.r_pkt_received_time_sec - r_record.r_pkt_sent_time_sec
+
+    if args.kernel_timestamps:
+        # take out the time the data packet and the control record spent waiting to be read
+        r_record.rtt_sec = r_record.userspace_rtt_sec - r_record.r_receiver_dwell_sec - r_record.control_dwell_sec
+    else:
+        r_record.rtt_sec = r_record.userspace_rtt_sec
+
+    r_record.rtt_ms = r_record.rtt_sec * 1000
+    r_record.userspace_rtt_ms = r_record.userspace_rtt_sec * 1000
 
     try:
         # first record received has zeros
-        sender_interval_rate_bps = (r_record["r_sender_interval_bytes_sent"] * 8.0) / r_record["r_sender_interval_duration_sec"]
+        sender_interval_rate_bps = (r_record.r_sender_interval_bytes_sent * 8.0) / r_record.r_sender_interval_duration_sec
     except ZeroDivisionError:
         sender_interval_rate_bps = 0
 
-    r_record["sender_interval_rate_mbps"] = sender_interval_rate_bps / (10 ** 6)
+    r_record.sender_interval_rate_mbps = sender_interval_rate_bps / (10 ** 6)
 
     try:
-        r_record["receiver_interval_rate_bytes_per_sec"] = r_record["r_receiver_interval_bytes_received"] / r_record["r_receiver_interval_duration_sec"]
+        r_record.receiver_interval_rate_bytes_per_sec = r_record.r_receiver_interval_bytes_received / r_record.r_receiver_interval_duration_sec
     except ZeroDivisionError:
-        r_record["receiver_interval_rate_bytes_per_sec"] = 0
+        r_record.receiver_interval_rate_bytes_per_sec = 0
 
-    receiver_interval_rate_bps = r_record["receiver_interval_rate_bytes_per_sec"] * 8
-    r_record["receiver_interval_rate_mbps"] = receiver_interval_rate_bps / (10 ** 6)
+    receiver_interval_rate_bps = r_record.receiver_interval_rate_bytes_per_sec * 8
+    r_record.receiver_interval_rate_mbps = receiver_interval_rate_bps / (10 ** 6)
 
-    r_record["buffered_bytes"] = int( r_record["receiver_interval_rate_bytes_per_sec"] * r_record["rtt_sec"] )
+    r_record.buffered_bytes = int( r_record.receiver_interval_rate_bytes_per_sec * r_record.rtt_sec )
 
     if args.udp:
         try:
             # first record received has zeroes
-            r_record["sender_pps"] = int(r_record["r_sender_interval_pkts_sent"] / r_record["r_sender_interval_duration_sec"])
+            r_record.sender_pps = int(r_record.r_sender_interval_pkts_sent / r_record.r_sender_interval_duration_sec)
         except ZeroDivisionError:
-            r_record["sender_pps"] = 0
+            r_record.sender_pps = 0
 
         try:
-            r_record["receiver_pps"] = int(r_record["r_receiver_interval_pkts_received"] / r_record["r_receiver_interval_duration_sec"])
+            r_record.receiver_pps = int(r_record.r_receiver_interval_pkts_received / r_record.r_receiver_interval_duration_sec)
         except ZeroDivisionError:
-            r_record["receiver_pps"] = 0
+            r_record.receiver_pps = 0
 
-        r_record["total_dropped"] = r_record["r_sender_total_pkts_sent"] - r_record["r_receiver_total_pkts_received"]
-        if r_record["total_dropped"] < 0:
+        r_record.total_dropped = r_record.r_sender_total_pkts_sent - r_record.r_receiver_total_pkts_received
+        if r_record.total_dropped < 0:
             # this can happen if we happen to pick up an "early" a_b block (probably just negative by 1 or 2, not a big deal)
-            r_record["total_dropped"] = 0
+            r_record.total_dropped = 0
 
     else:
-        r_record["sender_pps"] = -1
-        r_record["receiver_pps"] = -1
-        r_record["total_dropped"] = -1
+        r_record.sender_pps = -1
+        r_record.receiver_pps = -1
+        r_record.total_dropped = -1
+
+        # kernel view of the sending data socket, see tcp_info_helper
+        r_record.tcp_srtt_ms = r_record.r_sender_tcp_srtt_us / 1000
+        r_record.tcp_rttvar_ms = r_record.r_sender_tcp_rttvar_us / 1000
+        r_record.tcp_min_rtt_ms = r_record.r_sender_tcp_min_rtt_us / 1000
+        r_record.tcp_delivery_rate_mbps = (r_record.r_sender_tcp_delivery_rate * 8) / (10 ** 6)
+        r_record.tcp_pacing_rate_mbps = (r_record.r_sender_tcp_pacing_rate * 8) / (10 ** 6)
 
     return r_record
 
 
-def validate_data_connection(args, run_id, data_connection_initial_str):
-    w = data_connection_initial_str.split(" ")
+# rtt echo record, with --rtt-sample-interval
+#   " e <record type> <sent time> <stream id> <receiver dwell> f <received time> <control dwell> <is sample valid> g "
+def parse_e_record(args, s1):
+    swords = s1.split()
+
+    e_record = e_f_words_to_e_record(swords)
+
+    # literal "f"
+    e_record.r_pkt_received_time_sec = float(swords[6])
+    e_record.control_dwell_sec = float(swords[7])
+    e_record.is_sample_valid = int(swords[8])
+    # literal "g"
+
+    return add_e_record_derived_fields(args, e_record)
+
+
+# the raw fields of the " e ... f " block only
+def parse_e_f_block(s1):
+    return e_f_words_to_e_record(s1.split())
+
+
+def e_f_words_to_e_record(swords):
+    e_record = EchoRecordClass()
+
+    # literal "e"
+    e_record.r_record_type = swords[1]
+    e_record.r_pkt_sent_time_sec = float(swords[2])
+    e_record.r_stream_id = int(swords[3])
+    e_record.r_receiver_dwell_sec = float(swords[4])
+
+    return e_record
+
+
+E_RECORD_STR_FORMAT = " e {} {} {} {} f {} {} {} g ".format
+
+
+def e_record_to_str(e_record):
+    return E_RECORD_STR_FORMAT(
+        e_record.r_record_type,
+        e_record.r_pkt_sent_time_sec,
+        e_record.r_stream_id,
+        e_record.r_receiver_dwell_sec,
+        e_record.r_pkt_received_time_sec,
+        e_record.control_dwell_sec,
+        e_record.is_sample_valid)
+
 
-    if w[0] != "data":
-        raise Exception("ERROR: data connection invalid (does not start with data) run_id {} received {}".format(
-            run_id, data_connection_initial_str))
+def add_e_record_derived_fields(args, e_record):
+    rtt_sec = e_record.r_pkt_received_time_sec - e_record.r_pkt_sent_time_sec
 
-    data_connection_run_id = w[1]
+    if args.kernel_timestamps:
+        rtt_sec -= e_record.r_receiver_dwell_sec + e_record.control_dwell_sec
 
-    if data_connection_run_id != run_id:
-        raise Exception("ERROR: data connection invalid (run_id incorrect) control run_id {} data run_id {} received {}".format(
-            run_id, data_connection_run_id, data_connection_initial_str))
+    e_record.rtt_sec = rtt_sec
+    e_record.rtt_ms = rtt_sec * 1000
 
-    if args.verbosity:
-        print("data run_id is valid", flush=True)
+    return e_record
@@ -40,6 +40,32 @@ do_run "-c $SERVER_ADDR $EXTRAARGS -u"
 
 do_run "-c $SERVER_ADDR $EXTRAARGS -u -R"
 
+do_run "-c $SERVER_ADDR $EXTRAARGS -P 2"
+
+do_run "-c $SERVER_ADDR $EXTRAARGS -P 2 -R"
+
+do_run "-c $SERVER_ADDR $EXTRAARGS -u -P 2"
+
+do_run "-c $SERVER_ADDR $EXTRAARGS --engine asyncio"
+
+do_run "-c $SERVER_ADDR $EXTRAARGS --engine asyncio -R"
+
+do_run "-c $SERVER_ADDR $EXTRAARGS --engine asyncio -u"
+
+do_run "-c $SERVER_ADDR $EXTRAARGS --sweep"
+
+do_run "-c $SERVER_ADDR $EXTRAARGS -u --sweep"
+
+do_run "-c $SERVER_ADDR $EXTRAARGS --control-protocol ascii"
+
+do_run "-c $SERVER_ADDR $EXTRAARGS --control-protocol binary -R"
+
+do_run "-c $SERVER_ADDR $EXTRAARGS --data-header binary"
+
+do_run "-c $SERVER_ADDR $EXTRAARGS --data-header binary -R"
+
+do_run "-c $SERVER_ADDR $EXTRAARGS --data-header binary -u"
+
 do_run "-c $SERVER_ADDR $EXTRAARGS -J /tmp/foo578439759837.out"
 
 head /tmp/foo578439759837.out
@@ -0,0 +1,119 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import types
+
+from bbperf.admission_controller_class import AdmissionControllerClass
+
+
+def get_server_args(**kwargs):
+    server_args = types.SimpleNamespace(
+        max_concurrent_sessions=2,
+        bandwidth_budget=None,
+        session_bandwidth=1000,
+        max_queue_length=4,
+        max_queue_wait=300)
+
+    vars(server_args).update(kwargs)
+
+    return server_args
+
+
+def get_client_args(**kwargs):
+    client_args = types.SimpleNamespace(
+        udp=False,
+        time=10,
+        sweep=False,
+        sweep_step_time=2,
+        sweep_load_percent_list=[],
+        tcp_target_rate=None,
+        exclusive=False,
+        max_run_time_failsafe_sec=100)
+
+    vars(client_args).update(kwargs)
+
+    return client_args
+
+
+def test_admit_up_to_max_concurrent_sessions():
+    admission_controller = AdmissionControllerClass(get_server_args())
+
+    assert admission_controller.request("r1", get_client_args(), "i1") == ("admit", None)
+    assert admission_controller.request("r2", get_client_args(), "i2") == ("admit", None)
+
+    client_args = get_client_args()
+    decision, estimated_wait_sec = admission_controller.request("r3", client_args, "i3")
+
+    assert decision == "queued"
+    assert estimated_wait_sec > 0
+    assert admission_controller.get_num_running() == 2
+    assert admission_controller.get_queue_length() == 1
+    assert admission_controller.is_known("r3")
+
+    assert admission_controller.end("r1") == [ ("r3", client_args, "i3") ]
+    assert admission_controller.get_queue_length() == 0
+    assert admission_controller.get_num_running() == 2
+
+
+def test_exclusive():
+    admission_controller = AdmissionControllerClass(get_server_args())
+
+    # a test always fits on an idle server
+    assert admission_controller.request("r1", get_client_args(exclusive=True), "i1") == ("admit", None)
+    assert admission_controller.request("r2", get_client_args(), "i2")[0] == "queued"
+
+    assert [ run_id for run_id, _, _ in admission_controller.end("r1") ] == [ "r2" ]
+
+    assert admission_controller.request("r3", get_client_args(exclusive=True), "i3")[0] == "queued"
+    # not overtaken by a smaller one
+    assert admission_controller.request("r4", get_client_args(), "i4")[0] == "queued"
+
+    assert [ run_id for run_id, _, _ in admission_controller.end("r2") ] == [ "r3" ]
+    assert [ run_id for run_id, _, _ in admission_controller.end("r3") ] == [ "r4" ]
+
+
+def test_bandwidth_budget():
+    admission_controller = AdmissionControllerClass(get_server_args(max_concurrent_sessions=10, bandwidth_budget=1500))
+
+    assert admission_controller.request("r1", get_client_args(tcp_target_rate=1000), "i1") == ("admit", None)
+    assert admission_controller.request("r2", get_client_args(tcp_target_rate=500), "i2") == ("admit", None)
+    # --session-bandwidth without a target rate
+    assert admission_controller.request("r3", get_client_args(), "i3")[0] == "queued"
+
+
+def test_busy_when_queue_full():
+    admission_controller = AdmissionControllerClass(get_server_args(max_concurrent_sessions=1, max_queue_length=1))
+
+    assert admission_controller.request("r1", get_client_args(), "i1") == ("admit", None)
+    assert admission_controller.request("r2", get_client_args(), "i2")[0] == "queued"
+
+    decision, retry_after_sec = admission_controller.request("r3", get_client_args(), "i3")
+
+    assert decision == "busy"
+    assert retry_after_sec >= 1
+    assert not admission_controller.is_known("r3")
+
+
+def test_busy_when_wait_too_long():
+    admission_controller = AdmissionControllerClass(get_server_args(max_concurrent_sessions=1, max_queue_wait=5))
+
+    assert admission_controller.request("r1", get_client_args(), "i1") == ("admit", None)
+    assert admission_controller.request("r2", get_client_args(), "i2")[0] == "busy"
+
+
+def test_queued_estimates_and_remove():
+    admission_controller = AdmissionControllerClass(get_server_args(max_concurrent_sessions=1))
+
+    admission_controller.request("r1", get_client_args(), "i1")
+    admission_controller.request("r2", get_client_args(), "i2")
+    admission_controller.request("r3", get_client_args(), "i3")
+
+    queued_list = admission_controller.get_queued_list()
+
+    assert [ run_id for run_id, _, _, _ in queued_list ] == [ "r2", "r3" ]
+    # one after the other
+    assert queued_list[1][3] > queued_list[0][3] > 0
+
+    assert admission_controller.remove_queued("r2") == []
+    assert [ run_id for run_id, _, _, _ in admission_controller.get_queued_list() ] == [ "r3" ]
+    assert not admission_controller.is_known("r2")
@@ -0,0 +1,90 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import pytest
+
+from bbperf import binary_header_helper
+from bbperf import tcp_info_helper
+
+from bbperf.binary_frame_parser_class import BinaryFrameParserClass
+
+
+# a frame whose header has sent time sent_time_ns and total send counter frame_num
+def make_frame(frame_num, sent_time_ns, payload_len=100):
+    frame_buffer = binary_header_helper.create_frame_buffer(b'x' * payload_len)
+
+    binary_header_helper.pack_header_into(frame_buffer, True, sent_time_ns, 1000, 1, len(frame_buffer),
+                                          frame_num, tcp_info_helper.TCP_INFO_NONE)
+
+    return bytes(frame_buffer)
+
+
+def get_stream(num_frames):
+    return b''.join(make_frame(i, 1000 + i) for i in range(num_frames))
+
+
+def test_whole_frames():
+    parser = BinaryFrameParserClass()
+
+    parser.feed(memoryview(get_stream(5)))
+
+    assert parser.num_frames == 5
+    assert parser.last_header[4] == 1004
+    assert parser.last_header[8] == 4
+
+
+def test_frame_split_across_recv_calls():
+    parser = BinaryFrameParserClass()
+
+    stream = get_stream(3)
+    # in the middle of the second header
+    split_offset = len(make_frame(0, 0)) + 10
+
+    parser.feed(memoryview(stream[ : split_offset ]))
+    assert parser.num_frames == 1
+    assert parser.last_header[4] == 1000
+
+    parser.feed(memoryview(stream[ split_offset : ]))
+    assert parser.num_frames == 3
+    assert parser.last_header[4] == 1002
+
+
+def test_one_byte_at_a_time():
+    parser = BinaryFrameParserClass()
+
+    stream = get_stream(4)
+
+    for i in range(len(stream)):
+        parser.feed(memoryview(stream[ i : i + 1 ]))
+
+    assert parser.num_frames == 4
+    assert parser.last_header[4] == 1003
+    assert parser.header_bytes_have == 0
+    assert parser.payload_bytes_remaining == 0
+
+
+# the receive time is that of the recv that completed the header, not of a later one that
+# only had payload
+def test_rx_time_paired_with_header():
+    parser = BinaryFrameParserClass()
+
+    stream = get_stream(2)
+    frame_len = len(make_frame(0, 0))
+    header_size = binary_header_helper.BINARY_HEADER_SIZE
+
+    parser.feed(memoryview(stream[ : frame_len + 10 ]), 1.0)
+    parser.feed(memoryview(stream[ frame_len + 10 : frame_len + header_size ]), 2.0)
+    parser.feed(memoryview(stream[ frame_len + header_size : ]), 3.0)
+
+    assert parser.last_header[4] == 1001
+    assert parser.last_header_rx_time_sec == 2.0
+
+
+def test_invalid_frame_length():
+    parser = BinaryFrameParserClass()
+
+    frame = bytearray(make_frame(0, 0))
+    binary_header_helper.FRAME_LEN_STRUCT.pack_into(frame, binary_header_helper.FRAME_LEN_OFFSET, 1)
+
+    with pytest.raises(Exception, match="invalid frame length"):
+        parser.feed(memoryview(frame))
@@ -0,0 +1,135 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+from bbperf import control_record_helper
+from bbperf import tcp_info_helper
+
+from bbperf.interval_record_class import IntervalRecordClass
+
+
+TCP_INFO = tuple(range(101, 101 + len(tcp_info_helper.TCP_INFO_FIELD_LIST)))
+
+A_B_FIELDS = (control_record_helper.RECORD_TYPE_RUN, 1700000000.25, 0.1, 7, 123456, 99) + TCP_INFO
+
+
+def make_c_record():
+    return control_record_helper.pack_interval_c_record(A_B_FIELDS, 0.11, 6, 120000, 98, 3, 0.0005)
+
+
+def set_d_fields(r_record):
+    r_record.r_pkt_received_time_sec = 1700000000.5
+    r_record.interval_dropped = 1
+    r_record.interval_dropped_percent = 14.25
+    r_record.is_sample_valid = 1
+    r_record.sweep_step = -1
+    r_record.control_dwell_sec = 0.00025
+    r_record.rtt_sample_count = 4
+    r_record.rtt_sample_min_sec = 0.01
+    r_record.rtt_sample_p50_sec = 0.02
+    r_record.rtt_sample_p99_sec = 0.03
+    r_record.rtt_sample_max_sec = 0.04
+
+
+def check_c_fields(r_record):
+    assert r_record.r_record_type == "run"
+    assert r_record.r_pkt_sent_time_sec == 1700000000.25
+    assert r_record.r_sender_interval_duration_sec == 0.1
+    assert r_record.r_sender_interval_pkts_sent == 7
+    assert r_record.r_sender_interval_bytes_sent == 123456
+    assert r_record.r_sender_total_pkts_sent == 99
+    assert r_record.r_sender_tcp_srtt_us == 101
+    assert r_record.r_sender_tcp_bytes_retrans == TCP_INFO[-1]
+    assert r_record.r_receiver_interval_duration_sec == 0.11
+    assert r_record.r_receiver_interval_pkts_received == 6
+    assert r_record.r_receiver_interval_bytes_received == 120000
+    assert r_record.r_receiver_total_pkts_received == 98
+    assert r_record.r_stream_id == 3
+    assert r_record.r_receiver_dwell_sec == 0.0005
+
+
+def check_d_fields(r_record):
+    assert r_record.r_pkt_received_time_sec == 1700000000.5
+    assert r_record.interval_dropped == 1
+    assert r_record.interval_dropped_percent == 14.25
+    assert r_record.is_sample_valid == 1
+    assert r_record.sweep_step == -1
+    assert r_record.control_dwell_sec == 0.00025
+    assert r_record.rtt_sample_count == 4
+    assert r_record.rtt_sample_max_sec == 0.04
+
+
+def test_interval_c_record():
+    c_record = make_c_record()
+
+    assert len(c_record) == control_record_helper.INTERVAL_C_SIZE
+    assert control_record_helper.get_record_kind(c_record) == control_record_helper.KIND_INTERVAL_C
+
+    r_record = control_record_helper.unpack_interval_record(c_record)
+
+    check_c_fields(r_record)
+    assert not hasattr(r_record, "r_pkt_received_time_sec")
+
+
+def test_interval_d_record():
+    c_record = make_c_record()
+
+    r_record = control_record_helper.unpack_interval_record(c_record)
+    set_d_fields(r_record)
+
+    d_record = control_record_helper.pack_interval_d_record(c_record, r_record)
+
+    assert len(d_record) == control_record_helper.INTERVAL_D_SIZE
+    assert control_record_helper.get_record_kind(d_record) == control_record_helper.KIND_INTERVAL_D
+
+    r_record = control_record_helper.unpack_interval_record(d_record)
+
+    check_c_fields(r_record)
+    check_d_fields(r_record)
+
+
+# e.g. an r_record parsed from the ascii control protocol
+def test_r_record_to_binary():
+    r_record = control_record_helper.unpack_interval_record(make_c_record())
+    set_d_fields(r_record)
+
+    assert isinstance(r_record, IntervalRecordClass)
+
+    d_record = control_record_helper.record_to_binary(r_record)
+
+    assert d_record == control_record_helper.pack_interval_d_record(make_c_record(), r_record)
+
+
+def test_echo_records():
+    f_record = control_record_helper.pack_echo_f_record(control_record_helper.RECORD_TYPE_CAL, 1700000000.75, 2, 0.001)
+
+    assert len(f_record) == control_record_helper.ECHO_F_SIZE
+    assert control_record_helper.get_record_kind(f_record) == control_record_helper.KIND_ECHO_F
+
+    e_record = control_record_helper.unpack_echo_record(f_record)
+
+    assert e_record.r_record_type == "cal"
+    assert e_record.r_pkt_sent_time_sec == 1700000000.75
+    assert e_record.r_stream_id == 2
+    assert e_record.r_receiver_dwell_sec == 0.001
+
+    e_record.r_pkt_received_time_sec = 1700000001.0
+    e_record.control_dwell_sec = 0.002
+    e_record.is_sample_valid = 1
+
+    g_record = control_record_helper.pack_echo_g_record(f_record, e_record)
+
+    assert control_record_helper.get_record_kind(g_record) == control_record_helper.KIND_ECHO_G
+    assert control_record_helper.record_to_binary(e_record) == g_record
+
+    e_record = control_record_helper.unpack_echo_record(g_record)
+
+    assert e_record.r_pkt_sent_time_sec == 1700000000.75
+    assert e_record.r_pkt_received_time_sec == 1700000001.0
+    assert e_record.control_dwell_sec == 0.002
+    assert e_record.is_sample_valid == 1
+
+
+def test_a_b_block_to_fields():
+    a_b_block = " a run 1700000000.25 0.1 7 123456 99 " + " ".join(str(x) for x in TCP_INFO) + " b "
+
+    assert control_record_helper.a_b_block_to_fields(a_b_block) == A_B_FIELDS
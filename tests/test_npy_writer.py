@@ -0,0 +1,71 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import numpy
+
+from bbperf import const
+from bbperf import data_file_helper
+
+from bbperf.npy_writer_class import NpyWriterClass, NPY_HEADER_ALIGN
+
+
+DTYPE = numpy.dtype([ ("a", "<f8"), ("b", "<i8"), ("c", "<u1") ])
+
+
+def write_file(filename, row_list, dtype=DTYPE):
+    with open(filename, "wb") as f:
+        npy_writer = NpyWriterClass(f, dtype)
+
+        for row in row_list:
+            npy_writer.append(row)
+
+        assert npy_writer.get_num_records() == len(row_list)
+
+        npy_writer.close()
+
+
+# more than a chunk, so the last chunk is a partial one
+def test_loads_with_numpy(tmp_path):
+    filename = tmp_path / "test.npy"
+
+    row_list = [ (i * 0.5, -i, i % 256) for i in range(const.NPY_WRITER_CHUNK_RECORDS * 2 + 10) ]
+
+    write_file(filename, row_list)
+
+    data = numpy.load(filename, mmap_mode="r")
+
+    assert data.dtype == DTYPE
+    assert data.shape == (len(row_list),)
+    assert data.tolist() == row_list
+
+
+def test_empty(tmp_path):
+    filename = tmp_path / "empty.npy"
+
+    write_file(filename, [])
+
+    data = numpy.load(filename)
+
+    assert data.dtype == DTYPE
+    assert data.shape == (0,)
+
+
+def test_header_aligned(tmp_path):
+    filename = tmp_path / "test.npy"
+
+    write_file(filename, [ (1.0, 2, 3) ])
+
+    assert (filename.stat().st_size - DTYPE.itemsize) % NPY_HEADER_ALIGN == 0
+
+
+def test_raw_data_dtype(tmp_path):
+    filename = tmp_path / "raw.npy"
+
+    row_list = [ tuple(range(len(data_file_helper.RAW_DATA_DTYPE.names))) ] * 3
+
+    write_file(filename, row_list, data_file_helper.RAW_DATA_DTYPE)
+
+    data = numpy.load(filename)
+
+    assert data.dtype == data_file_helper.RAW_DATA_DTYPE
+    assert len(data) == 3
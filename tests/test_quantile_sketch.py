@@ -0,0 +1,76 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import numpy
+import pytest
+
+from bbperf import const
+
+from bbperf.quantile_sketch_class import QuantileSketchClass
+
+
+PERCENT_LIST = [ 0, 1, 10, 50, 90, 99, 100 ]
+
+
+def get_values(num_values):
+    rng = numpy.random.default_rng(1)
+    # rtt like, a long tail, and some zeros and negatives
+    values = rng.lognormal(-4, 1, num_values)
+    values[::50] = 0.0
+    values[::77] *= -1
+    return values
+
+
+# up to QUANTILE_SKETCH_MAX_EXACT_SAMPLES, the same as numpy.percentile on a list
+def test_exact_up_to_limit():
+    values = get_values(const.QUANTILE_SKETCH_MAX_EXACT_SAMPLES)
+
+    sketch = QuantileSketchClass()
+    for value in values:
+        sketch.add(value)
+
+    assert not sketch.is_folded()
+    assert sketch.get_percentile_list(PERCENT_LIST) == numpy.percentile(values, PERCENT_LIST).tolist()
+
+
+def test_multiple_columns():
+    values = get_values(1000)
+    rows = numpy.column_stack([ values, values * 2, -values ])
+
+    sketch = QuantileSketchClass(3)
+    for row in rows:
+        sketch.add(row.tolist())
+
+    assert numpy.array_equal(sketch.get_percentile_table(PERCENT_LIST), numpy.percentile(rows, PERCENT_LIST, axis=0))
+    assert sketch.get_max(1) == rows[:, 1].max()
+    assert sketch.get_min(2) == rows[:, 2].min()
+
+
+# past the limit, within the relative accuracy, and the moments are still exact
+def test_folded(monkeypatch):
+    monkeypatch.setattr(const, "QUANTILE_SKETCH_MAX_EXACT_SAMPLES", 1000)
+
+    values = get_values(25000)
+
+    sketch = QuantileSketchClass()
+    for value in values:
+        sketch.add(value)
+
+    assert sketch.is_folded()
+    assert sketch.get_count() == len(values)
+
+    # the value at the zero based rank, rounded down
+    exact_percentile_list = numpy.sort(values)[ [ int(p / 100 * (len(values) - 1)) for p in PERCENT_LIST ] ]
+
+    for percentile, exact_percentile in zip(sketch.get_percentile_list(PERCENT_LIST), exact_percentile_list):
+        assert percentile == pytest.approx(exact_percentile, rel=const.QUANTILE_SKETCH_RELATIVE_ACCURACY * 1.01, abs=1e-9)
+
+    assert sketch.get_min() == values.min()
+    assert sketch.get_max() == values.max()
+    assert sketch.get_mean() == pytest.approx(values.mean(), rel=1e-9)
+    assert sketch.get_stddev() == pytest.approx(values.std(), rel=1e-9)
+
+
+def test_no_values():
+    with pytest.raises(Exception, match="no values"):
+        QuantileSketchClass().get_percentile_list([ 50 ])
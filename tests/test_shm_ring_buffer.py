@@ -0,0 +1,117 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import os
+import time
+import threading
+
+import pytest
+
+from bbperf.shm_ring_buffer_class import ShmRingBufferClass
+
+
+@pytest.fixture
+def ring():
+    ring = ShmRingBufferClass(64, 8)
+    yield ring
+    ring.close()
+
+
+def test_put_get_batch(ring):
+    assert ring.get_batch() == []
+
+    record_list = [ "record {}".format(i).encode() for i in range(5) ]
+
+    for record in record_list:
+        ring.put(record)
+
+    assert ring.get_batch() == record_list
+    assert ring.get_batch() == []
+
+
+def test_wraps_around(ring):
+    for i in range(100):
+        ring.put(bytes([ i ]) * (i % 64 + 1))
+        ring.put(b'second')
+
+        assert ring.get_batch() == [ bytes([ i ]) * (i % 64 + 1), b'second' ]
+
+
+def test_record_too_big(ring):
+    with pytest.raises(Exception, match="too big"):
+        ring.put(bytes(65))
+
+
+def test_wait_returns_with_record(ring):
+    ring.put(b'x')
+
+    start_time = time.time()
+    ring.wait(10)
+
+    assert (time.time() - start_time) < 5
+    assert ring.get_batch() == [ b'x' ]
+
+
+def test_wait_times_out_when_empty(ring):
+    start_time = time.time()
+    ring.wait(0.2)
+
+    assert (time.time() - start_time) >= 0.15
+
+
+def test_put_wakes_waiting_consumer(ring):
+    def produce():
+        time.sleep(0.2)
+        ring.put(b'x')
+
+    producer_thread = threading.Thread(target=produce)
+    producer_thread.start()
+
+    start_time = time.time()
+    ring.wait(10)
+
+    assert (time.time() - start_time) < 5
+    assert ring.get_batch() == [ b'x' ]
+
+    producer_thread.join(5)
+
+
+# e.g. the sentinel of a process that exited
+def test_wait_returns_with_other(ring):
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, b'x')
+
+    start_time = time.time()
+    ring.wait(10, [ read_fd ])
+
+    assert (time.time() - start_time) < 5
+
+    os.close(read_fd)
+    os.close(write_fd)
+
+
+# the producer blocks on a full ring until the consumer takes records, nothing is dropped
+def test_full_ring_blocks_producer(ring):
+    num_records = 200
+
+    def produce():
+        for i in range(num_records):
+            ring.put(i.to_bytes(4, "big"))
+
+    producer_thread = threading.Thread(target=produce)
+    producer_thread.start()
+
+    received_list = []
+    deadline = time.time() + 30
+
+    while (len(received_list) < num_records) and (time.time() < deadline):
+        record_list = ring.get_batch()
+        if len(record_list) == 0:
+            ring.wait(1)
+        received_list.extend(record_list)
+
+    producer_thread.join(5)
+
+    assert not producer_thread.is_alive()
+    assert [ int.from_bytes(record, "big") for record in received_list ] == list(range(num_records))
+    assert ring.num_full_waits > 0
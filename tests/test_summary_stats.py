@@ -0,0 +1,87 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import types
+
+import numpy
+import pytest
+
+from bbperf.summary_stats_class import SummaryStatsClass, PERCENTILE_KEY_LIST
+
+
+def get_args(**kwargs):
+    args = types.SimpleNamespace(udp=False, summary_percent_list=[ 1, 10, 50, 90, 99, 99.9 ])
+
+    vars(args).update(kwargs)
+
+    return args
+
+
+def make_entry(stream_id, i):
+    return {
+        "stream_id": stream_id,
+        "loaded_rtt_ms": 10.0 + (i % 7),
+        "sender_throughput_rate_mbps": 100.0 + i,
+        "receiver_throughput_rate_mbps": 90.0 + i + stream_id,
+        "buffered_bytes": 1000.0 * i,
+        "excess_buffered_bytes": 500.0 * i,
+        "receiver_pps": 8000.0 + i,
+        "pkt_loss_percent": -1.0,
+        "pkts_sent": 100,
+        "pkts_dropped": i % 3 }
+
+
+def test_single_stream_matches_numpy():
+    args = get_args()
+    summary_stats = SummaryStatsClass(args, 1)
+
+    entry_list = [ make_entry(0, i) for i in range(200) ]
+    for entry in entry_list:
+        summary_stats.add_entry(entry)
+
+    stats_dict = {}
+    summary_stats.add_stats_to(stats_dict)
+
+    assert summary_stats.get_num_samples() == 200
+
+    for key in PERCENTILE_KEY_LIST:
+        values = numpy.array([ entry[key] for entry in entry_list ])
+
+        for percent in args.summary_percent_list:
+            # p1, p99.9
+            assert stats_dict[key]["p{:g}".format(percent)] == numpy.percentile(values, percent)
+
+        assert stats_dict[key]["mean"] == pytest.approx(values.mean())
+        assert stats_dict[key]["stddev"] == pytest.approx(values.std())
+        assert stats_dict[key]["min"] == values.min()
+        assert stats_dict[key]["max"] == values.max()
+
+
+# the aggregate is sampled only once every stream has reported
+def test_parallel_streams():
+    summary_stats = SummaryStatsClass(get_args(), 2)
+
+    summary_stats.add_entry(make_entry(0, 0))
+    summary_stats.add_entry(make_entry(0, 1))
+    assert summary_stats.aggregate_sketch.get_count() == 0
+
+    summary_stats.add_entry(make_entry(1, 1))
+    assert summary_stats.aggregate_sketch.get_count() == 1
+
+    stats_dict = {}
+    summary_stats.add_stats_to(stats_dict)
+
+    assert stats_dict["num_streams"] == 2
+    # the latest entry of each stream
+    assert stats_dict["receiver_throughput_rate_mbps"]["max"] == (90.0 + 1) + (90.0 + 1 + 1)
+    assert [ s["stream_id"] for s in stats_dict["streams"] ] == [ 0, 1 ]
+    assert stats_dict["streams"][0]["num_samples"] == 2
+    assert 0.5 < stats_dict["fairness_index"] <= 1.0
+
+
+def test_jain_fairness_index():
+    summary_stats = SummaryStatsClass(get_args(), 1)
+
+    assert summary_stats.get_jain_fairness_index([ 10.0, 10.0, 10.0 ]) == pytest.approx(1.0)
+    assert summary_stats.get_jain_fairness_index([ 10.0, 0.0 ]) == pytest.approx(0.5)
+    assert summary_stats.get_jain_fairness_index([ 0.0, 0.0 ]) is None
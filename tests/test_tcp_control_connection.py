@@ -0,0 +1,66 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import socket
+import types
+
+import pytest
+
+from bbperf import control_record_helper
+from bbperf import timestamp_helper
+
+from bbperf.tcp_control_connection_class import TcpControlConnectionClass
+
+
+@pytest.fixture
+def sock_pair():
+    listen_sock = socket.create_server(("127.0.0.1", 0))
+    client_sock = socket.create_connection(listen_sock.getsockname())
+    server_sock, _ = listen_sock.accept()
+    listen_sock.close()
+
+    yield client_sock, server_sock
+
+    client_sock.close()
+    server_sock.close()
+
+
+# at high verbosity, binary records are logged without decoding them as text
+def test_send_binary_record_verbose(sock_pair, capsys):
+    client_sock, server_sock = sock_pair
+
+    control_conn = TcpControlConnectionClass(client_sock)
+    control_conn.set_args(types.SimpleNamespace(verbosity=4, control_protocol="binary"))
+
+    record = control_record_helper.pack_echo_f_record(1, 1700000000.123, 0, 0.001)
+
+    control_conn.send_bytes(record)
+
+    peer_conn = TcpControlConnectionClass(server_sock)
+    assert peer_conn.recv_binary_record() == record
+
+    assert bytes(record).hex() in capsys.readouterr().out
+
+
+# each buffered record keeps the kernel receive time of the recv that completed it
+def test_kernel_time_per_record(sock_pair, monkeypatch):
+    client_sock, server_sock = sock_pair
+
+    rx_time_list = [ 10.0, 20.0 ]
+    monkeypatch.setattr(timestamp_helper, "get_rx_timestamp_sec", lambda ancdata: rx_time_list.pop(0))
+
+    control_conn = TcpControlConnectionClass(server_sock)
+    control_conn.enable_kernel_timestamps()
+
+    for chunk in [ b' a 1 c  a 2', b' c  a 3 c ' ]:
+        client_sock.sendall(chunk)
+        control_conn.recv_into_buffer_until_minimum_size(control_conn.get_num_unread_bytes() + len(chunk))
+
+    assert control_conn.recv_a_c_or_e_f_block() == b' a 1 c '
+    assert control_conn.last_record_kernel_time_sec == 10.0
+
+    assert control_conn.recv_a_c_or_e_f_block() == b' a 2 c '
+    assert control_conn.last_record_kernel_time_sec == 20.0
+
+    assert control_conn.recv_a_c_or_e_f_block() == b' a 3 c '
+    assert control_conn.last_record_kernel_time_sec == 20.0
@@ -0,0 +1,99 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import select
+import socket
+import struct
+import types
+
+import pytest
+
+from bbperf import const
+
+from bbperf.udp_batch_receiver_class import UdpBatchReceiverClass
+
+
+# hands out (coalesced) datagrams the way a connected socket with UDP_GRO does
+class FakeGroSocket:
+
+    def __init__(self, datagram_list):
+        # list of (datagram bytes, gso segment size)
+        self.datagram_list = datagram_list
+
+    def gettimeout(self):
+        return 1
+
+    def setsockopt(self, level, optname, value):
+        pass
+
+    def connect(self, addr):
+        pass
+
+    def setblocking(self, flag):
+        pass
+
+    def next_datagram(self):
+        if len(self.datagram_list) == 0:
+            raise BlockingIOError()
+
+        datagram, segment_size = self.datagram_list.pop(0)
+        ancdata = [ (socket.SOL_UDP, const.UDP_GRO, struct.pack('i', segment_size)) ]
+
+        return datagram, ancdata
+
+    def recvmsg(self, bufsize, ancbufsize):
+        datagram, ancdata = self.next_datagram()
+        return datagram[ 0 : bufsize ], ancdata, 0, None
+
+    def recvmsg_into(self, buffers, ancbufsize, flags=0):
+        datagram, ancdata = self.next_datagram()
+
+        num_bytes = min(len(datagram), len(buffers[0]))
+        buffers[0][ 0 : num_bytes ] = datagram[ 0 : num_bytes ]
+
+        if flags & socket.MSG_TRUNC:
+            num_bytes = len(datagram)
+
+        return num_bytes, ancdata, 0, None
+
+
+def get_receiver(monkeypatch, copy_free, datagram_list):
+    monkeypatch.setattr(select, "select", lambda rlist, wlist, xlist, timeout: (rlist, [], []))
+
+    args = types.SimpleNamespace(
+        copy_free_recv=copy_free,
+        kernel_timestamps=False,
+        udp_recv_mode="gro",
+        verbosity=0)
+
+    return UdpBatchReceiverClass(args, FakeGroSocket(datagram_list), None)
+
+
+# the stop message coalesced behind the data as a short last segment
+@pytest.mark.parametrize("copy_free", [ False, True ])
+def test_stop_msg_in_last_segment(monkeypatch, copy_free):
+    data_pkt = b' a ' + (b'x' * 997)
+    coalesced = (data_pkt * 3) + const.UDP_STOP_MSG.encode()
+
+    udp_batch_receiver = get_receiver(monkeypatch, copy_free, [ (coalesced, len(data_pkt)) ])
+
+    num_pkts, num_bytes, last_pkt, stop_received = udp_batch_receiver.recv()
+
+    assert stop_received
+    assert num_pkts == 4
+    assert num_bytes == len(coalesced)
+
+
+@pytest.mark.parametrize("copy_free", [ False, True ])
+def test_no_stop_msg(monkeypatch, copy_free):
+    data_pkt = b' a ' + (b'x' * 997)
+    # the last segment is allowed to be shorter
+    coalesced = (data_pkt * 3) + data_pkt[ 0 : 500 ]
+
+    udp_batch_receiver = get_receiver(monkeypatch, copy_free, [ (coalesced, len(data_pkt)), (data_pkt, len(data_pkt)) ])
+
+    num_pkts, num_bytes, last_pkt, stop_received = udp_batch_receiver.recv()
+
+    assert not stop_received
+    assert num_pkts == 5
+    assert bytes(last_pkt[ 0 : 3 ]) == b' a '
@@ -0,0 +1,39 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import errno
+import types
+
+import pytest
+
+from bbperf.udp_batch_sender_class import UdpBatchSenderClass
+
+
+# a kernel (or nic) without UDP_SEGMENT
+class FakeNoGsoSocket:
+
+    def sendmsg(self, buffers, ancdata, flags, address):
+        raise OSError(errno.EIO, "Input/output error")
+
+    def sendto(self, payload_bytes, address):
+        return len(payload_bytes)
+
+
+def get_sender(udp_send_mode):
+    args = types.SimpleNamespace(udp_send_mode=udp_send_mode, verbosity=0)
+
+    return UdpBatchSenderClass(args, FakeNoGsoSocket(), None)
+
+
+def test_auto_falls_back_to_loop():
+    udp_batch_sender = get_sender("auto")
+
+    assert udp_batch_sender.send(b'x' * 1000, 10) == (1, 1000)
+    assert udp_batch_sender.send_mode == "loop"
+
+
+def test_explicit_gso_does_not_fall_back():
+    udp_batch_sender = get_sender("gso")
+
+    with pytest.raises(Exception, match="udp gso send failed"):
+        udp_batch_sender.send(b'x' * 1000, 10)
@@ -0,0 +1,21 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import time
+import types
+
+from bbperf.udp_pacer_class import UdpPacerClass
+
+
+# the first batch after a reset is spaced and counted like the others
+def test_first_batch_after_reset_is_paced():
+    udp_pacer = UdpPacerClass(types.SimpleNamespace(udp_max_burst=64))
+
+    udp_pacer.reset()
+    start_time = time.perf_counter()
+
+    # 10 packets at 1000 pps is a 10 ms gap
+    udp_pacer.pace(10, 1000)
+
+    assert (time.perf_counter() - start_time) >= 0.0099
+    assert udp_pacer.get_stats()["num_batches"] == 1
@@ -0,0 +1,34 @@
+# Copyright (c) 2024 Cloudflare, Inc.
+# Licensed under the Apache 2.0 license found in the LICENSE file or at https://www.apache.org/licenses/LICENSE-2.0
+
+import types
+
+from bbperf.udp_rate_manager_class import UdpRateManagerClass
+
+
+def get_r_record(stream_id, receiver_pps):
+    return types.SimpleNamespace(
+        r_stream_id=stream_id,
+        r_sender_total_pkts_sent=10000,
+        r_sender_interval_pkts_sent=1000,
+        receiver_pps=receiver_pps)
+
+
+# with -P N, one aggregate sample per interval, not one per record
+def test_one_sample_per_interval():
+    args = types.SimpleNamespace(parallel=3, udp_steady_state_factor=1.1, verbosity=0)
+    shared_udp_sending_rate_pps = types.SimpleNamespace(value=0)
+
+    udp_rate_manager = UdpRateManagerClass(args, shared_udp_sending_rate_pps)
+
+    for interval_idx in range(4):
+        for stream_id in range(3):
+            udp_rate_manager.update(get_r_record(stream_id, 1000 + interval_idx))
+
+        assert len(udp_rate_manager.receiver_pps_list) == interval_idx + 1
+
+        if interval_idx == 0:
+            # initial climb at 20%, split across the flows
+            assert shared_udp_sending_rate_pps.value == 1200
+
+    assert udp_rate_manager.receiver_pps_list == [ 3000, 3003, 3006, 3009 ]